@@ -7,6 +7,7 @@ import as_weatherstation.app as mod_ws_app
 import as_pws.app as mod_pws_app
 
 import as_weatherstation.log.weather as mod_ws_log_weather
+import as_weatherstation.phidget as mod_ws_phidget
 
 import as_weatherstation.read.log as mod_ws_read_log
 import as_weatherstation.write.textlcd as mod_ws_write_textlcd
@@ -47,6 +48,7 @@ as_ws.log.config - log configration: rotation times, backup count
 CHANGELOG
 ********************************************************************************
 v1.0 - old PWS display.py script created converted to use read/write objects
+v1.1 - optional simulated TextLCD (phidgetBackend app option)
 
 
 ********************************************************************************
@@ -100,7 +102,9 @@ class AS_CONTROLLER_PWS_DISPLAY(mod_ws_controller_abstract.AS_CONTROLLER_ABSTRAC
         self.sLabel = sLabel
 
         import time
-        from Phidgets.PhidgetException import PhidgetErrorCodes, PhidgetException
+        # The Phidget library, or simulated devices
+        phidget = mod_ws_phidget.getBackend(self.app)
+        PhidgetErrorCodes, PhidgetException = phidget.PhidgetErrorCodes, phidget.PhidgetException
 
 
         # TODO Create writer with attach and detach event handlers
@@ -1,15 +1,22 @@
 #!/usr/bin/python
 # encoding=utf-8
 
+import time
+
 import as_weatherstation.controller.abstract as mod_ws_controller_abstract
 
 import as_weatherstation.app as mod_ws_app
 import as_pws.app as mod_pws_app
 
 import as_weatherstation.log.weather as mod_ws_log_weather
+import as_weatherstation.phidget as mod_ws_phidget
 
 import as_weatherstation.read.pws as mod_ws_read_pws
+import as_weatherstation.write.asyncqueue as mod_ws_write_asyncqueue
+import as_weatherstation.write.db as mod_ws_write_db
+import as_weatherstation.write.deadband as mod_ws_write_deadband
 import as_weatherstation.write.log as mod_ws_write_log
+import as_weatherstation.write.sqlite as mod_ws_write_sqlite
 
 
 """
@@ -28,13 +35,47 @@ After the Phidget InterfaceKit is connected, event callbacks are bound
 and the main loop starts.
 
 Analog sensors are polled periodically and an average of several polls is
-written to a log.
+written to a log. Polls are scheduled on the monotonic clock, aligned to
+the log interval (e.g., logs on the minute), so time spent reading and
+writing doesn't make the polls drift. A poll that runs past the next one
+is logged as a warning in the error log.
 
 Events are called when digital sensor values change and we capture these events
 in different ways depending on the type of sensor.
 
+With the station's sensorCapture option set to 'event', analog sensors are
+not polled either: the InterfaceKit sends their values when they change
+(by sensorChangeTrigger or more) and each sample uses the latest values.
+This saves a round trip per sensor per sample with a remote InterfaceKit.
+
+With the station's burstRate option set, each sample is a short burst of
+fast reads (e.g., 20 a second for a second), decimated to a single value
+by a boxcar (mean) or median filter as it is read. Bursts whose reads run
+late (jitter) are logged as warnings in the error log.
+
+With the phidgetBackend app option (or the AS_WS_PHIDGET_BACKEND environment
+variable) set to 'simulated', no Phidget hardware (or library) is needed:
+the InterfaceKit is simulated (see as_weatherstation/phidget/simulated.py),
+and the whole loop can run many times faster than real time (the timeScale
+option of the [simulation] config section), e.g., for load testing.
+
+With the station's intervalSensorLogMax option set, logging is adaptive:
+while every measurement stays within its deadband of the last row logged
+(see [deadband] in app-explain.cfg) and the rain gauge doesn't tip, rows
+are held back, up to intervalSensorLogMax seconds of them, and then logged
+as a single held row. Log readers (e.g., the DB loader) expand held rows
+back to one row per intervalSensorLog. This cuts the log (and the uploads)
+down on calm days, and any change is still logged when it happens.
+
 Logs are set aside each day. Old logs have a timestamp appended to their name.
 
+If the station's writeDB option is set, samples are also written to the
+database as they are logged. DB writes happen in a background thread
+(see as_weatherstation/write/asyncqueue.py), so a slow or unreachable
+database never delays the next sensor read. writeDB says what happens to
+samples when the DB falls behind: drop, block or spill (to disk, written
+when the DB catches up).
+
 An error log may appear in the data folder. This file will contain ERRORS and
 WARNINGS regarding script execution. The error log will be rotated when it
 approaches 1 MB in size. Up to 10 old error logs will be kept, then older logs
@@ -56,6 +97,15 @@ as_ws.log.config - log configration: rotation times, backup count
 CHANGELOG
 ********************************************************************************
 v1.0 - old PWS measurer.py script created converted to use read/write objects
+v1.1 - optional DB writes through a background queue (writeDB station option)
+v1.2 - samples read on a drift-free grid aligned to the log interval; overruns logged
+v1.3 - samples aggregated as they are read rather than kept until logged
+v1.4 - input events handed to the main loop through a ring buffer; overflows logged
+v1.5 - optional event driven sensor capture (sensorCapture station option)
+v1.6 - optional burst sampling with decimation (burstRate station option); late bursts logged
+v1.7 - samples stamped with their scheduled time; optional simulated Phidget devices (phidgetBackend app option)
+v1.8 - optional adaptive logging with deadbands (intervalSensorLogMax station option)
+v1.9 - logged rows stamped with the end of their log period
 
 
 ********************************************************************************
@@ -98,8 +148,9 @@ class AS_CONTROLLER_PWS_MAIN(mod_ws_controller_abstract.AS_CONTROLLER_ABSTRACT):
 
         self.sLabel = sLabel
 
-        import time
-        from Phidgets.PhidgetException import PhidgetErrorCodes, PhidgetException
+        # The Phidget library, or simulated devices
+        phidget = mod_ws_phidget.getBackend(self.app)
+        PhidgetErrorCodes, PhidgetException = phidget.PhidgetErrorCodes, phidget.PhidgetException
 
 
         # Create the PWS reader
@@ -119,19 +170,46 @@ class AS_CONTROLLER_PWS_MAIN(mod_ws_controller_abstract.AS_CONTROLLER_ABSTRACT):
         # Create the log writer
         writer = mod_ws_write_log.AS_WS_WRITER_LOG(self.app, log_logger)
 
+        # With adaptive logging, samples that haven't moved are held back
+        # (up to intervalSensorLogMax seconds of them) and logged as one
+        # held row
+        intervalMax = getattr(reader.station, 'intervalSensorLogMax', None)
+        if intervalMax:
+            writer = mod_ws_write_deadband.AS_WS_WRITER_DEADBAND(self.app, writer, reader.station.intervalSensorLog, intervalMax, reader.aggregateStats)
+
+        # Create the background DB writer
+        dbWriter = None
+        full = getattr(reader.station, 'writeDB', None)
+        if full:
+            dbWriter = mod_ws_write_asyncqueue.AS_WS_WRITER_ASYNC(self.app, self.createDBWriter(reader.station.label), full)
+
+
+        # Samples are read on a grid of deadlines, intervalSensorSample
+        # apart and starting on a multiple of intervalSensorLog (e.g., on
+        # the minute), however long the reads and writes take. The samples
+        # are aggregated and logged each time the grid crosses a multiple
+        # of intervalSensorLog. Simulated devices may run the grid faster
+        # than real time.
+        scheduler = mod_ws_controller_abstract.AS_CONTROLLER_SCHEDULER(reader.station.intervalSensorSample, reader.station.intervalSensorLog, self.error_logger, reader.timeScale)
+        sampleTime = scheduler.wait()
+        logPeriod = int(round(sampleTime)) // reader.station.intervalSensorLog
+
+        # Input events dropped so far, see AS_WS_READER_PWS.eventBufferSize
+        eventOverflows = 0
+        # Late bursts so far, see AS_WS_READER_PWS.readBurst()
+        lateBursts = 0
 
         # Main run loop
-        self.go = True
-        while self.go == True:
-
-            i = 0
-            while i < reader.station.intervalSensorLog:
-
-                #print "Sample %d" % ((i+reader.station.intervalSensorSample)/reader.station.intervalSensorSample)
+        #
+        # The writers are flushed however the loop ends: signals end it
+        # with SystemExit (see sigHandler()), errors with their exception.
+        try:
+            self.go = True
+            while self.go == True:
 
                 # Read the samples from the PWS
                 try:
-                    reader.read()
+                    reader.read(sampleTime)
                 except PhidgetException as e:
                     self.error_logger.error('PhidgetException %d: %s', e.code, e.details)
                     raise
@@ -139,10 +217,49 @@ class AS_CONTROLLER_PWS_MAIN(mod_ws_controller_abstract.AS_CONTROLLER_ABSTRACT):
                     self.error_logger.error(e)
                     raise
 
-                time.sleep(reader.station.intervalSensorSample)
-                i = i+reader.station.intervalSensorSample
-
-            # Aggregate the samples and write them to the log
-            samples = reader.aggregateSamples(reader.flushSamples())
-            writer.write(samples)
+                sampleTime = scheduler.wait()
+                period = int(round(sampleTime)) // reader.station.intervalSensorLog
+                if period == logPeriod:
+                    continue
+
+                # Aggregate the samples and write them to the log, stamped
+                # with the end of their log period (the boundary the grid
+                # just crossed) rather than the time of the last sample
+                logTime = time.localtime((logPeriod + 1) * reader.station.intervalSensorLog)
+                logPeriod = period
+                overflows = reader.events.overflows
+                samples = reader.flushAggregate()
+                for sample in samples:
+                    sample.dateTime = logTime
+                if overflows > eventOverflows:
+                    self.error_logger.warning('%d input events dropped (event buffer full).', overflows - eventOverflows)
+                    eventOverflows = overflows
+                if reader.burstRate and reader.lateBursts > lateBursts:
+                    self.error_logger.warning('%d burst(s) with reads more than half a period late (last burst: mean %.1f ms, worst %.1f ms).', reader.lateBursts - lateBursts, reader.burstJitterMean*1000, reader.burstJitterMax*1000)
+                    lateBursts = reader.lateBursts
+                writer.write(samples)
+                if not dbWriter is None:
+                    dbWriter.write(samples)
+        finally:
+            if intervalMax:
+                # Log the samples held back so far
+                writer.flush()
+                self.message_logger.info('Adaptive logging: %d samples logged in %d rows.', writer.samples, writer.rows)
+
+            if reader.sensorCapture == mod_ws_read_pws.SENSOR_CAPTURE_EVENT:
+                self.message_logger.info('Sensor capture by events: %d sensor reads, %d InterfaceKit calls (%d saved).', reader.sensorReads, reader.deviceCalls, reader.getDeviceCallsSaved())
+
+            if not dbWriter is None:
+                # Write what is queued (or spill it) before we exit
+                dbWriter.close(dbWriter.retryInterval)
+
+
+
+
+    def createDBWriter(self, sLabel):
+        """ Create the writer for the main DB (the background queue writes through it) """
+
+        if self.app.db[mod_ws_app.DB_MAIN].backend == mod_ws_app.DB_BACKEND_SQLITE:
+            return mod_ws_write_sqlite.AS_WS_WRITER_SQLITE(self.app, sLabel)
+        return mod_ws_write_db.AS_WS_WRITER_DB_BULK(self.app, sLabel)
 
@@ -21,6 +21,66 @@ MEASURE_SEA_LEVEL_BAROMETRIC_PRESSURE = 128
 MEASURE_PRECIPITATION = 256
 
 
+# Columns of the log file, in order.
+#
+# If you append a new column here, update the log formatter
+# in as_nma/config/log.py
+#
+# Do not change the order unless you want to mess up
+# the parsing of older logs. Just append new elements
+# to the end.
+#
+# Samples store their values in a list indexed by position in this list.
+LOG_FIELDS = [
+    MEASURE_TEMPERATURE,
+    MEASURE_RELATIVE_HUMIDITY,
+    MEASURE_STATION_BAROMETRIC_PRESSURE,
+    MEASURE_PRECIPITATION_WEIGHT,
+    MEASURE_INTERNAL_TEMPERATURE,
+    MEASURE_CO2,
+    MEASURE_NOISE,
+    MEASURE_SEA_LEVEL_BAROMETRIC_PRESSURE,
+    MEASURE_PRECIPITATION
+]
+LOG_FIELD_INDEX = dict((mtype, i) for i, mtype in enumerate(LOG_FIELDS))
+
+
+# Statistics of a measurement over a log interval, besides the mean (or
+# sum) in the measurement's own column. Which are kept is configured per
+# measurement (see [aggregate] in app-explain.cfg). Each is logged in a
+# column appended to the log, and stored in a DB column named after the
+# measurement's with a suffix (e.g., fTemperatureMin).
+#
+# A statistic's field (its key in samples, fieldMap and MEASURE_TYPES) is
+# the tuple (mtype, STAT_*), see getStatField().
+STAT_MIN = 'min'
+STAT_MAX = 'max'
+STAT_MEDIAN = 'median'
+STAT_STDDEV = 'stddev'
+STAT_LAST = 'last'
+
+# DB column suffixes, in the order the statistics are logged
+STAT_SUFFIX = OrderedDict([
+    (STAT_MIN, 'Min'),
+    (STAT_MAX, 'Max'),
+    (STAT_MEDIAN, 'Median'),
+    (STAT_STDDEV, 'StdDev'),
+    (STAT_LAST, 'Last')
+    ])
+
+# How far a measurement may move from the last logged row before it is
+# logged again, with adaptive logging (see the station's
+# intervalSensorLogMax option and [deadband] in app-explain.cfg). Other
+# measurements are logged again on any change.
+DEADBAND_DEFAULTS = OrderedDict([
+    (MEASURE_TEMPERATURE, 0.2), # C
+    (MEASURE_RELATIVE_HUMIDITY, 1), # %
+    (MEASURE_STATION_BAROMETRIC_PRESSURE, 1), # hPa
+    (MEASURE_PRECIPITATION_WEIGHT, 10), # g
+    (MEASURE_INTERNAL_TEMPERATURE, 0.5) # C
+    ])
+
+
 # Station type constants
 STYPE_PWS = 'STYPE_PWS'
 STYPE_NETATMO_DEVICE = 'STYPE_NETATMO_DEVICE'
@@ -40,6 +100,13 @@ PWS_IO_SENSOR = 0
 PWS_IO_INPUT = 1
 PWS_IO_OUTPUT = 2
 
+# Phidget backends ("phidgetBackend" option of [app], or the AS_WS_PHIDGET_BACKEND environment variable)
+PHIDGET_BACKEND_PHIDGET = 'phidget' # The Phidget library and real devices (see as_weatherstation/phidget/lphidget.py)
+PHIDGET_BACKEND_SIMULATED = 'simulated' # Simulated devices, no hardware needed (see as_weatherstation/phidget/simulated.py)
+
+PHIDGET_BACKENDS = (PHIDGET_BACKEND_PHIDGET, PHIDGET_BACKEND_SIMULATED)
+PHIDGET_BACKEND_ENVIRONMENT = 'AS_WS_PHIDGET_BACKEND'
+
 
 # Bitwise logfile types
 LOGFILE_CURRENT = 1 # the file that is currently being logged to
@@ -52,6 +119,10 @@ LOGFILE_ALL = 31 # All -- update this if adding new types
 
 DB_MAIN = 1 # main database
 
+# Database backends ("backend" option of [database_main])
+DB_BACKEND_MYSQL = 'mysql' # MySQL server (see schema.sql)
+DB_BACKEND_SQLITE = 'sqlite' # Local SQLite file (see as_weatherstation/sqlitedb.py)
+
 class AS_WS_APP(object):
     """Configuration settings for weather station app"""
 
@@ -138,15 +209,27 @@ class AS_WS_APP(object):
         # seperate database config for your development environment versus production.
         dbSection = "database_main_%s" % self.hostname.lower()
         if not self._config.has_section(dbSection): dbSection = 'database_main'
-        try:
-            self.db[DB_MAIN] = AS_DB_CONNECT(
-                self._config.get(dbSection, 'host'),
-                self._config.get(dbSection, 'user'),
-                self._config.get(dbSection, 'password'),
-                self._config.get(dbSection, 'database')
-                )
-        except (ConfigParser.NoOptionError, ConfigParser.NoSectionError) as e:
-             self.db[DB_MAIN] = AS_DB_CONNECT('', '', '', '')
+        backend = DB_BACKEND_MYSQL
+        if self._config.has_option(dbSection, 'backend'):
+            backend = self._config.get(dbSection, 'backend').strip().lower()
+        if backend == DB_BACKEND_SQLITE:
+            # No server to connect to, just a file (relative to the data folder)
+            path = 'as_pws.sqlite'
+            if self._config.has_option(dbSection, 'path'):
+                path = self._config.get(dbSection, 'path')
+            self.db[DB_MAIN] = AS_DB_CONNECT('', '', '', '', backend, os.path.join(self.dataFolder, path))
+        elif backend == DB_BACKEND_MYSQL:
+            try:
+                self.db[DB_MAIN] = AS_DB_CONNECT(
+                    self._config.get(dbSection, 'host'),
+                    self._config.get(dbSection, 'user'),
+                    self._config.get(dbSection, 'password'),
+                    self._config.get(dbSection, 'database')
+                    )
+            except (ConfigParser.NoOptionError, ConfigParser.NoSectionError) as e:
+                 self.db[DB_MAIN] = AS_DB_CONNECT('', '', '', '')
+        else:
+            raise ValueError('Unsupported database backend %s in [%s] config section' % (backend, dbSection))
 
 
         try:
@@ -160,6 +243,42 @@ class AS_WS_APP(object):
             self.ftp = {'host':'', 'username':'', 'password': '', 'path':''}
 
 
+        # Phidget devices: real, or simulated for testing without hardware
+        self.phidgetBackend = PHIDGET_BACKEND_PHIDGET
+        if self._config.has_option('app', 'phidgetBackend'):
+            self.phidgetBackend = self._config.get('app', 'phidgetBackend').strip().lower()
+        if os.environ.get(PHIDGET_BACKEND_ENVIRONMENT):
+            self.phidgetBackend = os.environ[PHIDGET_BACKEND_ENVIRONMENT].strip().lower()
+        if not self.phidgetBackend in PHIDGET_BACKENDS:
+            raise ValueError('Unsupported Phidget backend %s. Use one of: %s' % (self.phidgetBackend, ', '.join(PHIDGET_BACKENDS)))
+
+        # Settings of the simulated devices (see as_weatherstation/phidget/simulated.py)
+        self.simulation = {
+            'timeScale': 1.0,
+            'latency': 0.0,
+            'sensorRate': 1.0,
+            'sensorStep': 2.0,
+            'inputRate': 6.0,
+            'script': None,
+            'seed': None
+            }
+        if self._config.has_section('simulation'):
+            for option in self._config.options('simulation'):
+                if not option in self.simulation:
+                    raise ValueError('Unknown option %s in [simulation] config section' % option)
+                value = self._config.get('simulation', option).strip()
+                if value == '':
+                    continue
+                if option == 'script':
+                    self.simulation[option] = os.path.join(self.dataFolder, value)
+                elif option == 'seed':
+                    self.simulation[option] = int(value)
+                else:
+                    self.simulation[option] = float(value)
+        if self.simulation['timeScale'] <= 0:
+            raise ValueError('Simulation timeScale must be positive, not %s' % str(self.simulation['timeScale']))
+
+
 
         # Dictionary mapping measurement types to their equivelant
         # location in various datasources.
@@ -168,25 +287,8 @@ class AS_WS_APP(object):
         # and map it to our generic database or log file format.
         self.fieldMap = {}
 
-        # Map of columns in the log file.
-        #
-        # If you append a new column here, update the log formatter
-        # in as_nma/config/log.py
-        #
-        # Do not change the order unless you want to mess up
-        # the parsing of older logs. Just append new elements
-        # to the end.
-        self.fieldMap['log'] = [
-            MEASURE_TEMPERATURE,
-            MEASURE_RELATIVE_HUMIDITY,
-            MEASURE_STATION_BAROMETRIC_PRESSURE,
-            MEASURE_PRECIPITATION_WEIGHT,
-            MEASURE_INTERNAL_TEMPERATURE,
-            MEASURE_CO2,
-            MEASURE_NOISE,
-            MEASURE_SEA_LEVEL_BAROMETRIC_PRESSURE,
-            MEASURE_PRECIPITATION
-        ]
+        # Map of columns in the log file (see LOG_FIELDS above).
+        self.fieldMap['log'] = list(LOG_FIELDS)
 
 
         # Map of database column names
@@ -205,6 +307,74 @@ class AS_WS_APP(object):
             MEASURE_PRECIPITATION: 'fPrecipitation'
         }
 
+        # DB column names as config options, matched regardless of case
+        columns = dict((self.fieldMap['db'][mtype].lower(), mtype) for mtype in self.fieldMap['db'])
+
+        # Optional overrides of how measurement strings are parsed,
+        # keyed on DB column name (see MEASURE_TYPES and [numeric] in
+        # app-explain.cfg).
+        if self._config.has_section('numeric'):
+            for column in self._config.options('numeric'):
+                if not column.lower() in columns:
+                    raise ValueError('Unknown column %s in [numeric] config section' % column)
+                policy = [v.strip() for v in self._config.get('numeric', column).split(',')]
+                precision = None
+                if len(policy) > 1:
+                    precision = int(policy[1])
+                setNumericPolicy(columns[column.lower()], policy[0], precision)
+
+        # Optional rollup tiers and aggregates (see as_weatherstation/rollup.py
+        # and [rollup] in app-explain.cfg). None and {} mean the defaults.
+        self.rollupTiers = None
+        self.rollupAggregates = {}
+        self.rollupLag = 30
+        if self._config.has_section('rollup'):
+            for option in self._config.options('rollup'):
+                values = [v.strip() for v in self._config.get('rollup', option).split(',') if v.strip()]
+                if option == 'tiers':
+                    self.rollupTiers = values
+                elif option == 'lag':
+                    self.rollupLag = self._config.getint('rollup', option)
+                elif option.lower() in columns:
+                    self.rollupAggregates[columns[option.lower()]] = tuple(values)
+                else:
+                    raise ValueError('Unknown option %s in [rollup] config section' % option)
+
+        # Optional extra statistics of measurements over each log interval,
+        # keyed on DB column name (see STAT_* and [aggregate] in
+        # app-explain.cfg). They are appended to the log and DB fields.
+        self.aggregateSpec = OrderedDict()
+        if self._config.has_section('aggregate'):
+            for column in self._config.options('aggregate'):
+                if not column.lower() in columns:
+                    raise ValueError('Unknown column %s in [aggregate] config section' % column)
+                stats = [v.strip() for v in self._config.get('aggregate', column).split(',') if v.strip()]
+                for stat in stats:
+                    if not stat in STAT_SUFFIX:
+                        raise ValueError('Unknown statistic %s in [aggregate] config section. Use: %s' % (stat, ', '.join(STAT_SUFFIX)))
+                self.aggregateSpec[columns[column.lower()]] = tuple(stats)
+
+        # Appended in a fixed order (not the order in the config), so the
+        # log columns only depend on which statistics are configured
+        for mtype in LOG_FIELDS:
+            for stat in STAT_SUFFIX:
+                if stat in self.aggregateSpec.get(mtype, ()):
+                    field = getStatField(mtype, stat)
+                    self.fieldMap['log'].append(field)
+                    self.fieldMap['db'][field] = self.fieldMap['db'][mtype] + STAT_SUFFIX[stat]
+
+        # Optional deadbands of adaptive logging, keyed on DB column name
+        # (see DEADBAND_DEFAULTS and [deadband] in app-explain.cfg)
+        self.deadbands = dict(DEADBAND_DEFAULTS)
+        if self._config.has_section('deadband'):
+            for column in self._config.options('deadband'):
+                if not column.lower() in columns:
+                    raise ValueError('Unknown column %s in [deadband] config section' % column)
+                self.deadbands[columns[column.lower()]] = float(self._config.get('deadband', column))
+
+        # The local database adds the statistics columns itself
+        self.db[DB_MAIN].logColumns = self.getStatColumnTypes(self.db[DB_MAIN].backend)
+
         # Map of Netatmo measurment names available on the main device
         self.fieldMap[STYPE_NETATMO_DEVICE] = {
             MEASURE_TEMPERATURE: 'Temperature',
@@ -272,6 +442,13 @@ class AS_WS_APP(object):
 
 
 
+    def getStatColumnTypes(self, backend=DB_BACKEND_MYSQL):
+        """ Get the as_pws_data_log columns of the configured statistics (see [aggregate]) as a list of (column name, SQL type) """
+
+        return [(self.fieldMap['db'][field], getSQLType(field, backend)) for field in self.fieldMap['log'] if isStatField(field)]
+
+
+
     def _setDataFolder(self, folder):
         """ Set the path to the data folder, which in turn defines paths to all the sub folders and files """
         self.dataFolder = os.path.join(folder, '')
@@ -407,7 +584,32 @@ class AS_WS_APP(object):
             return self.moveFile(src, destFolder, False)
         else:
             shutil.move(aFile, dest)
+            self.moveTailIndex(aFile, dest)
             return dest
+
+
+
+    @staticmethod
+    def getTailIndexFile(aFile):
+        """ Get the path of a gzip file's tail index (see AS_WS_READER_CSVFILE._tailGZip()) """
+        return os.path.join(os.path.dirname(aFile), '.%s.tail' % os.path.basename(aFile))
+
+
+
+    def moveTailIndex(self, aFile, dest):
+        """ Move a file's tail index, if it has one, along with the file (or remove it if it can't be moved) """
+        import shutil
+
+        index = self.getTailIndexFile(aFile)
+        if not os.path.exists(index):
+            return
+        try:
+            shutil.move(index, self.getTailIndexFile(dest))
+        except (IOError, OSError):
+            try:
+                os.remove(index)
+            except OSError:
+                pass
             
 
 
@@ -421,11 +623,15 @@ class AS_WS_APP(object):
         """
         import gzip
         zFile = '%s.gz' % aFile
+        # Compress to a hidden file first, so an interrupted gzip never
+        # leaves a partial file that looks like a log file
+        tmp = os.path.join(os.path.dirname(zFile), '.%s' % os.path.basename(zFile))
         f_in = open(aFile, 'rb')
-        f_out = gzip.open(zFile, 'wb')
+        f_out = gzip.open(tmp, 'wb')
         f_out.writelines(f_in)
         f_out.close()
         f_in.close()
+        os.rename(tmp, zFile)
         if not keepOriginal:
             os.remove(aFile)
         return zFile
@@ -515,10 +721,22 @@ class AS_WS_STATION_PWS(AS_WS_STATION_ABSTRACT):
         options['sensorLoad'] = int
         options['sensorRH'] = int
         options['sensorTemp'] = int
+        options['sensorBPOffset'] = [None, float]
+        options['sensorInternalTempOffset'] = [None, float]
+        options['sensorLoadOffset'] = [None, float]
+        options['sensorRHOffset'] = [None, float]
+        options['sensorTempOffset'] = [None, float]
         options['rainGaugeArea'] = Decimal
         options['rainGaugeVolume'] = Decimal
         options['inputRG'] = int
         options['remoteHost'] = [None, str]
+        options['writeDB'] = [None, str]
+        options['sensorCapture'] = [None, str]
+        options['sensorChangeTrigger'] = [None, int]
+        options['burstRate'] = [None, int]
+        options['burstDuration'] = [None, float]
+        options['burstFilter'] = [None, str]
+        options['intervalSensorLogMax'] = [None, int]
 
         return options
 
@@ -570,103 +788,439 @@ STYPE_CLASS_LOOKUP = OrderedDict([
 
 
 class AS_WS_SAMPLE(object):
-    """Station details"""
-    
+    """
+    A sample time and its measurements.
+
+    Measurement values are stored in a fixed-length list indexed by
+    position in LOG_FIELDS, with a bitmask recording which of them are
+    set. Measurement objects are only built when asked for with
+    getMeasurement(), so a sample costs a handful of references instead of
+    a dict of objects that each repeat their type's unit and labels.
+
+    getMeasurement() returns a new object each time. Change a value with
+    setMeasurement() or setValue(), not by modifying that object.
+    """
+
+    __slots__ = ('dateTime', 'values', 'mask', 'extra')
+
     def __init__(self, dateTime, measurements={}):
 
         self.dateTime = dateTime
-        self.measurements = {}
+        self.values = [0] * len(LOG_FIELDS)
+        self.mask = 0
+        self.extra = None # measurements of types that are not in LOG_FIELDS
 
 
     def setMeasurement(self, m):
         if not isinstance(m, AS_WS_MEASUREMENT):
             raise ValueError('sample must be an instance of AS_WS_MEASUREMENT')
-        self.measurements[m.mtype] = m
+        self.setValue(m.mtype, m.value)
 
 
     def delMeasurement(self, mtype):
-        self.measurements.pop[mtype, None]
+        i = LOG_FIELD_INDEX.get(mtype)
+        if i is None:
+            if self.extra:
+                self.extra.pop(mtype, None)
+        else:
+            self.mask &= ~(1 << i)
+            self.values[i] = 0
 
 
     def getMeasurement(self, mtype):
-        if mtype in self.measurements:
-            return self.measurements[mtype]
+        if self.hasMeasurement(mtype):
+            return AS_WS_SAMPLE.createMeasurement(mtype, self.getValue(mtype))
         else:
             return None
 
 
+    def hasMeasurement(self, mtype):
+        i = LOG_FIELD_INDEX.get(mtype)
+        if i is None:
+            return bool(self.extra) and mtype in self.extra
+        return bool(self.mask & (1 << i))
+
+
+    def setValue(self, mtype, value):
+        """ Set a measurement value without building a measurement object """
+
+        if type(value) == str:
+            value = parseMeasurementValue(mtype, value)
+
+        i = LOG_FIELD_INDEX.get(mtype)
+        if i is None:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[mtype] = value
+        else:
+            self.values[i] = value
+            self.mask |= 1 << i
+
+
+    def getValue(self, mtype, default=None):
+        """ Get a measurement value without building a measurement object """
+
+        i = LOG_FIELD_INDEX.get(mtype)
+        if i is None:
+            if self.extra and mtype in self.extra:
+                return self.extra[mtype]
+            return default
+        if self.mask & (1 << i):
+            return self.values[i]
+        return default
+
+
+    def iterValues(self):
+        """ Yield (mtype, value) for each measurement that is set """
+
+        mask = self.mask
+        values = self.values
+        for i in xrange(len(LOG_FIELDS)):
+            if mask & (1 << i):
+                yield (LOG_FIELDS[i], values[i])
+        if self.extra:
+            for mtype in self.extra:
+                yield (mtype, self.extra[mtype])
+
+
+    def getMeasurements(self):
+        """ Dict of measurement objects keyed on mtype (built on demand) """
+        return dict((mtype, AS_WS_SAMPLE.createMeasurement(mtype, value)) for mtype, value in self.iterValues())
+
+    measurements = property(getMeasurements, None, None, None)
+
+
     @staticmethod
     def createMeasurement(mtype, value=0):
         """ Static helper """
-        if mtype == MEASURE_TEMPERATURE:
-            return AS_WS_MEASUREMENT_TEMPERATURE(value)
+        if mtype in MEASURE_CLASS_LOOKUP:
+            return MEASURE_CLASS_LOOKUP[mtype](value)
+        elif mtype in MEASURE_TYPES:
+            # e.g., a statistic (see getStatField())
+            return AS_WS_MEASUREMENT(mtype, value)
+        else:
+            return AS_WS_MEASUREMENT(MEASURE_ABSTRACT, value)
 
-        elif mtype == MEASURE_RELATIVE_HUMIDITY:
-            return AS_WS_MEASUREMENT_RELATIVE_HUMIDITY(value)
 
-        elif mtype == MEASURE_STATION_BAROMETRIC_PRESSURE:
-            return AS_WS_MEASUREMENT_STATION_BAROMETRIC_PRESSURE(value)
 
-        elif mtype == MEASURE_PRECIPITATION_WEIGHT:
-            return AS_WS_MEASUREMENT_PRECIPITATION_WEIGHT(value)
 
-        elif mtype == MEASURE_INTERNAL_TEMPERATURE:
-            return AS_WS_MEASUREMENT_INTERNAL_TEMPERATURE(value)
+# A value missing from a row of an AS_WS_SAMPLE_COLUMNS batch (see appendRow())
+NAN = float('nan')
 
-        elif mtype == MEASURE_CO2:
-            return AS_WS_MEASUREMENT_CO2(value)
+class AS_WS_SAMPLE_COLUMNS(object):
+    """
+    Columnar batch of samples.
 
-        elif mtype == MEASURE_NOISE:
-            return AS_WS_MEASUREMENT_NOISE(value)
+    Instead of one AS_WS_SAMPLE (and a measurement object per field) for
+    every row, a batch keeps one epoch-seconds column plus one float column
+    per measurement type. Large log files can be parsed and written to the
+    DB without ever building per-row objects.
 
-        elif mtype == MEASURE_SEA_LEVEL_BAROMETRIC_PRESSURE:
-            return AS_WS_MEASUREMENT_SEA_LEVEL_BAROMETRIC_PRESSURE(value)
+    The time column uses array typecode 'l' (C long), which is 64 bits
+    on the 64-bit hosts that do bulk loading. Python 2's array module
+    has no explicit int64 typecode.
+    """
+
+    def __init__(self, mtypes):
+        """
+        @param mtypes list - Measurement types, in column order
+            (usually app.fieldMap['log']).
+        """
+        import array
+
+        self.mtypes = list(mtypes)
+        self.times = array.array('l')
+        self.columns = OrderedDict()
+        for mtype in self.mtypes:
+            self.columns[mtype] = array.array('d')
+        # Byte offset in the source file just past the batch's last row,
+        # if the reader tracks it (see AS_WS_READER_LOG.iterSamples())
+        self.offset = None
+
+
+    def __len__(self):
+        return len(self.times)
 
-        elif mtype == MEASURE_PRECIPITATION:
-            return AS_WS_MEASUREMENT_PRECIPITATION(value)
 
+    def appendRow(self, epoch, values):
+        """
+        Append one row to the batch.
+
+        @param epoch int - Sample time in seconds since the epoch.
+        @param values list - Floats in column order. Short rows (logs
+            written before a column was appended) are padded with zeros,
+            the same way the log writer fills missing measurements. Missing
+            statistics are padded with NaN, so they can be told from real
+            values (see formatColumnRows() in as_weatherstation/log/dbhandler.py).
+        """
+        self.times.append(epoch)
+        n = len(values)
+        i = 0
+        for mtype in self.mtypes:
+            if i < n:
+                self.columns[mtype].append(values[i])
+            elif isStatField(mtype):
+                self.columns[mtype].append(NAN)
+            else:
+                self.columns[mtype].append(0.0)
+            i += 1
+
+
+    def getColumn(self, mtype):
+        if mtype in self.columns:
+            return self.columns[mtype]
         else:
-            return AS_WS_MEASUREMENT(MEASURE_ABSTRACT, value)
+            return None
 
 
+    def getSample(self, i):
+        """ Build an AS_WS_SAMPLE for row i (for callers that need the object API) """
+        import time
 
+        sample = AS_WS_SAMPLE(time.localtime(self.times[i]))
+        for mtype in self.mtypes:
+            sample.setValue(mtype, self.columns[mtype][i])
+        return sample
 
-class AS_WS_MEASUREMENT(object):
-    """Abstract Measurement Class"""
-    
-    def __init__(self, mtype=MEASURE_ABSTRACT, value=0, unit='', dtype='numeric', labelLong='', labelShort=''):
+
+    def sliceRows(self, start, end=None):
+        """ Get rows start up to (but not including) end as a new batch """
+        batch = AS_WS_SAMPLE_COLUMNS(self.mtypes)
+        batch.times = self.times[start:end]
+        for mtype in self.mtypes:
+            batch.columns[mtype] = self.columns[mtype][start:end]
+        if end is None or end >= len(self.times):
+            # Still ends at our last row
+            batch.offset = self.offset
+        return batch
+
+
+    def iterRows(self):
+        """ Yield (epoch, [values]) tuples in row order """
+        columns = self.columns.values()
+        for i in xrange(len(self.times)):
+            yield (self.times[i], [c[i] for c in columns])
+
+
+
+
+# Numeric policies: how measurement strings (e.g., from log files) are
+# converted to numbers. See parseMeasurementValue().
+NUMERIC_INT = 'int' # whole numbers (for SMALLINT/TINYINT DB columns)
+NUMERIC_FIXED = 'fixed' # fixed-point, rounded to the type's precision (for DECIMAL DB columns)
+NUMERIC_FLOAT = 'float' # plain floats, no rounding
+NUMERIC_POLICIES = (NUMERIC_INT, NUMERIC_FIXED, NUMERIC_FLOAT)
+
+# Powers of ten for fixed-point scaling, indexed by decimal places
+_FIXED_SCALE = [10**i for i in range(10)]
+
+
+
+class AS_WS_MEASUREMENT_TYPE(object):
+    """ Metadata shared by every measurement of a given type """
+
+    __slots__ = ('mtype', 'unit', 'dtype', 'labelLong', 'labelShort', 'numeric', 'precision')
+
+    def __init__(self, mtype, unit='', dtype='numeric', labelLong='', labelShort='', numeric=NUMERIC_FLOAT, precision=2):
 
         self.mtype = mtype
-        self.dtype = dtype
         self.unit = unit
-        self.setValue(value)
+        self.dtype = dtype
         self.labelLong = labelLong
         self.labelShort = labelShort
+        self.numeric = numeric
+        self.precision = precision
+
+
+
+# Measurement type descriptors, keyed on mtype
+#
+# numeric and precision match the column types in schema.sql, so values
+# parsed from logs round-trip exactly into the DB: DECIMAL(n,2) columns
+# are fixed-point with 2 places, SMALLINT/TINYINT columns are whole numbers.
+MEASURE_TYPES = OrderedDict([
+    (MEASURE_ABSTRACT, AS_WS_MEASUREMENT_TYPE(MEASURE_ABSTRACT)),
+    (MEASURE_TEMPERATURE, AS_WS_MEASUREMENT_TYPE(MEASURE_TEMPERATURE, '°C', labelLong='Temperature', labelShort='Temp', numeric=NUMERIC_FIXED, precision=2)),
+    (MEASURE_RELATIVE_HUMIDITY, AS_WS_MEASUREMENT_TYPE(MEASURE_RELATIVE_HUMIDITY, '%', labelLong='Relative Humidity', labelShort='RH', numeric=NUMERIC_FIXED, precision=2)),
+    (MEASURE_STATION_BAROMETRIC_PRESSURE, AS_WS_MEASUREMENT_TYPE(MEASURE_STATION_BAROMETRIC_PRESSURE, 'hPa', labelLong='Station Pressure', labelShort='SBP', numeric=NUMERIC_INT, precision=0)),
+    (MEASURE_PRECIPITATION_WEIGHT, AS_WS_MEASUREMENT_TYPE(MEASURE_PRECIPITATION_WEIGHT, 'g', labelLong='Precipitation Weight', labelShort='Precip Mass', numeric=NUMERIC_INT, precision=0)),
+    (MEASURE_INTERNAL_TEMPERATURE, AS_WS_MEASUREMENT_TYPE(MEASURE_INTERNAL_TEMPERATURE, '°C', labelLong='Internal Temperature', labelShort='Int Temp', numeric=NUMERIC_FIXED, precision=2)),
+    (MEASURE_CO2, AS_WS_MEASUREMENT_TYPE(MEASURE_CO2, 'ppm', labelLong='CO2', labelShort='CO2', numeric=NUMERIC_INT, precision=0)),
+    (MEASURE_NOISE, AS_WS_MEASUREMENT_TYPE(MEASURE_NOISE, 'dB', labelLong='Noise', labelShort='Noise', numeric=NUMERIC_INT, precision=0)),
+    (MEASURE_SEA_LEVEL_BAROMETRIC_PRESSURE, AS_WS_MEASUREMENT_TYPE(MEASURE_SEA_LEVEL_BAROMETRIC_PRESSURE, 'hPa', labelLong='Sea-level Pressure', labelShort='SLBP', numeric=NUMERIC_INT, precision=0)),
+    (MEASURE_PRECIPITATION, AS_WS_MEASUREMENT_TYPE(MEASURE_PRECIPITATION, 'mm', labelLong='Precipitation', labelShort='Precip', numeric=NUMERIC_FIXED, precision=2))
+    ])
+
+
+
+def setNumericPolicy(mtype, numeric, precision=None):
+    """
+    Change how strings of a measurement type are parsed.
+
+    @param mtype int - MEASURE_* constant
+    @param numeric string - NUMERIC_INT, NUMERIC_FIXED or NUMERIC_FLOAT
+    @param precision int optional - Decimal places kept by NUMERIC_FIXED (0 to 9)
+    """
+
+    if not numeric in NUMERIC_POLICIES:
+        raise ValueError('Unsupported numeric policy %s' % str(numeric))
+    if precision is not None and not 0 <= precision < len(_FIXED_SCALE):
+        raise ValueError('Unsupported numeric precision %s' % str(precision))
+
+    mt = MEASURE_TYPES[mtype]
+    mt.numeric = numeric
+    if precision is not None:
+        mt.precision = precision
+
+
+
+def getStatField(mtype, stat):
+    """
+    Get the field of a statistic of a measurement (see STAT_*).
+
+    The statistic's type is added to MEASURE_TYPES the first time, with
+    the measurement's unit and numeric policy. A standard deviation of a
+    whole number measurement is kept to 2 decimal places.
+    """
+
+    field = (mtype, stat)
+    if not field in MEASURE_TYPES:
+        mt = MEASURE_TYPES[mtype]
+        numeric, precision = mt.numeric, mt.precision
+        if stat == STAT_STDDEV and numeric == NUMERIC_INT:
+            numeric, precision = NUMERIC_FIXED, 2
+        MEASURE_TYPES[field] = AS_WS_MEASUREMENT_TYPE(field, mt.unit, mt.dtype,
+            '%s %s' % (mt.labelLong, STAT_SUFFIX[stat]), '%s %s' % (mt.labelShort, STAT_SUFFIX[stat]),
+            numeric, precision)
+    return field
+
+
+
+def isStatField(field):
+    """ Is a field a statistic of a measurement (see getStatField())? """
+
+    return isinstance(field, tuple)
+
+
+
+def getSQLType(field, backend=DB_BACKEND_MYSQL):
+    """ Get the SQL column type of a field (measurement or statistic), following its numeric policy """
+
+    mt = MEASURE_TYPES[field]
+    if backend == DB_BACKEND_SQLITE:
+        if mt.numeric == NUMERIC_INT:
+            return 'INTEGER'
+        return 'REAL'
+    if mt.numeric == NUMERIC_INT:
+        return 'INT'
+    if mt.numeric == NUMERIC_FIXED:
+        return 'DECIMAL(8,%d)' % mt.precision
+    return 'DOUBLE'
+
+
+
+def parseMeasurementValue(mtype, value):
+    """
+    Convert a measurement string (e.g., from a log file) to a number,
+    following the numeric policy of the measurement type.
+
+    Parsing does not rely on catching exceptions and builds no Decimal
+    objects. Malformed strings still raise ValueError.
+    """
+
+    mt = MEASURE_TYPES.get(mtype)
+    if mt is None:
+        mt = MEASURE_TYPES[MEASURE_ABSTRACT]
+
+    if mt.numeric == NUMERIC_FIXED:
+        return parseFixed(value, mt.precision)
+    elif mt.numeric == NUMERIC_INT:
+        digits = value.strip()
+        if digits[:1] in ('-', '+'):
+            digits = digits[1:]
+        if digits.isdigit():
+            return int(value)
+        return int(round(float(value)))
+    else:
+        return float(value)
+
+
+
+def parseFixed(value, places):
+    """
+    Parse a decimal string as a fixed-point number with the given
+    number of decimal places.
+
+    The digits are read into a scaled integer (rounding half away from
+    zero), so '12.345' with 2 places is exactly 1235 hundredths. The
+    result is returned as a float, which formats back to the same
+    string with that many places.
+    """
+
+    s = value.strip()
+    negative = s[:1] == '-'
+    if negative or s[:1] == '+':
+        s = s[1:]
+
+    whole, dot, frac = s.partition('.')
+    if not (whole or frac) or (whole and not whole.isdigit()) or (frac and not frac.isdigit()):
+        # Exponents, 'nan', etc. -- let float() parse (or reject) them
+        return round(float(value), places)
+
+    scaled = int(whole + frac[:places].ljust(places, '0') or '0')
+    if len(frac) > places and frac[places] >= '5':
+        scaled += 1
+
+    v = scaled / float(_FIXED_SCALE[places])
+    if negative:
+        return -v
+    return v
+
+
+
+class AS_WS_MEASUREMENT(object):
+    """
+    Abstract Measurement Class
+
+    Only the type and value are stored on the object. Unit, dtype and
+    labels come from the type's entry in MEASURE_TYPES.
+    """
+
+    __slots__ = ('mtype', '_value')
+
+    def __init__(self, mtype=MEASURE_ABSTRACT, value=0):
+
+        self.mtype = mtype
+        self.setValue(value)
 
 
     def setValue(self, value):
 
         if type(value) == str:
-            try:
-                # casting '1.23' to int throws an error
-                v = int(value)
-            except ValueError:
-                from decimal import Decimal
-                v = Decimal(value)
+            v = parseMeasurementValue(self.mtype, value)
         else:
                 v = value
-        self.__value = v;
+        self._value = v;
         return self.value
 
 
     def getValue(self):
-        return self.__value
+        return self._value
 
     
     def delValue(self):
         return self.setValue(0)
 
 
+    def getType(self):
+        return MEASURE_TYPES.get(self.mtype, MEASURE_TYPES[MEASURE_ABSTRACT])
+
+    unit = property(lambda self: self.getType().unit)
+    dtype = property(lambda self: self.getType().dtype)
+    labelLong = property(lambda self: self.getType().labelLong)
+    labelShort = property(lambda self: self.getType().labelShort)
+
+
     def getString(self, r=2):
         v = self.getValue()
         if r > -1:
@@ -685,52 +1239,36 @@ class AS_WS_MEASUREMENT(object):
 
 
 class AS_WS_MEASUREMENT_TEMPERATURE(AS_WS_MEASUREMENT):
-    
+
+    __slots__ = ()
+
     def __init__(self, value):
-        super(AS_WS_MEASUREMENT_TEMPERATURE, self).__init__(
-            mtype = MEASURE_TEMPERATURE,
-            value = value,
-            unit = '°C',
-            labelLong = 'Temperature',
-            labelShort = 'Temp'
-            )
+        super(AS_WS_MEASUREMENT_TEMPERATURE, self).__init__(MEASURE_TEMPERATURE, value)
 
 
 class AS_WS_MEASUREMENT_INTERNAL_TEMPERATURE(AS_WS_MEASUREMENT):
 
+    __slots__ = ()
+
     def __init__(self, value):
-        super(AS_WS_MEASUREMENT_INTERNAL_TEMPERATURE, self).__init__(
-            mtype = MEASURE_INTERNAL_TEMPERATURE,
-            value = value,
-            unit = '°C',
-            labelLong = 'Internal Temperature',
-            labelShort = 'Int Temp'
-            )
+        super(AS_WS_MEASUREMENT_INTERNAL_TEMPERATURE, self).__init__(MEASURE_INTERNAL_TEMPERATURE, value)
 
 
 class AS_WS_MEASUREMENT_RELATIVE_HUMIDITY(AS_WS_MEASUREMENT):
 
+    __slots__ = ()
+
     def __init__(self, value):
-        super(AS_WS_MEASUREMENT_RELATIVE_HUMIDITY, self).__init__(
-            mtype = MEASURE_RELATIVE_HUMIDITY,
-            value = value,
-            unit = '%',
-            labelLong = 'Relative Humidity',
-            labelShort = 'RH'
-            )
+        super(AS_WS_MEASUREMENT_RELATIVE_HUMIDITY, self).__init__(MEASURE_RELATIVE_HUMIDITY, value)
 
 
 
 class AS_WS_MEASUREMENT_STATION_BAROMETRIC_PRESSURE(AS_WS_MEASUREMENT):
 
+    __slots__ = ()
+
     def __init__(self, value):
-        super(AS_WS_MEASUREMENT_STATION_BAROMETRIC_PRESSURE, self).__init__(
-            mtype = MEASURE_STATION_BAROMETRIC_PRESSURE,
-            value = value,
-            unit = 'hPa',
-            labelLong = 'Station Pressure',
-            labelShort = 'SBP'
-            )
+        super(AS_WS_MEASUREMENT_STATION_BAROMETRIC_PRESSURE, self).__init__(MEASURE_STATION_BAROMETRIC_PRESSURE, value)
 
     def getStationPressure(self):
         return self.value
@@ -742,14 +1280,10 @@ class AS_WS_MEASUREMENT_STATION_BAROMETRIC_PRESSURE(AS_WS_MEASUREMENT):
 
 class AS_WS_MEASUREMENT_SEA_LEVEL_BAROMETRIC_PRESSURE(AS_WS_MEASUREMENT):
 
+    __slots__ = ()
+
     def __init__(self, value):
-        super(AS_WS_MEASUREMENT_SEA_LEVEL_BAROMETRIC_PRESSURE, self).__init__(
-            mtype = MEASURE_SEA_LEVEL_BAROMETRIC_PRESSURE,
-            value = value,
-            unit = 'hPa',
-            labelLong = 'Sea-level Pressure',
-            labelShort = 'SLBP'
-            )
+        super(AS_WS_MEASUREMENT_SEA_LEVEL_BAROMETRIC_PRESSURE, self).__init__(MEASURE_SEA_LEVEL_BAROMETRIC_PRESSURE, value)
 
     def getStationPressure(self, altitude, temp):
         # see http://keisan.casio.com/exec/system/1224562962
@@ -762,62 +1296,79 @@ class AS_WS_MEASUREMENT_SEA_LEVEL_BAROMETRIC_PRESSURE(AS_WS_MEASUREMENT):
 
 class AS_WS_MEASUREMENT_PRECIPITATION_WEIGHT(AS_WS_MEASUREMENT):
 
+    __slots__ = ()
+
     def __init__(self, value):
-        super(AS_WS_MEASUREMENT_PRECIPITATION_WEIGHT, self).__init__(
-            mtype = MEASURE_PRECIPITATION_WEIGHT,
-            value = value,
-            unit = 'g',
-            labelLong = 'Precipitation Weight',
-            labelShort = 'Precip Mass'
-            )
+        super(AS_WS_MEASUREMENT_PRECIPITATION_WEIGHT, self).__init__(MEASURE_PRECIPITATION_WEIGHT, value)
 
 
 class AS_WS_MEASUREMENT_CO2(AS_WS_MEASUREMENT):
 
+    __slots__ = ()
+
     def __init__(self, value):
-        super(AS_WS_MEASUREMENT_CO2, self).__init__(
-            mtype = MEASURE_CO2,
-            value = value,
-            unit = 'ppm',
-            labelLong = 'CO2',
-            labelShort = 'CO2'
-            )
+        super(AS_WS_MEASUREMENT_CO2, self).__init__(MEASURE_CO2, value)
 
 
 class AS_WS_MEASUREMENT_NOISE(AS_WS_MEASUREMENT):
 
+    __slots__ = ()
+
     def __init__(self, value):
-        super(AS_WS_MEASUREMENT_NOISE, self).__init__(
-            mtype = MEASURE_NOISE,
-            value = value,
-            unit = 'dB',
-            labelLong = 'Noise',
-            labelShort = 'Noise'
-            )
+        super(AS_WS_MEASUREMENT_NOISE, self).__init__(MEASURE_NOISE, value)
 
 
 class AS_WS_MEASUREMENT_PRECIPITATION(AS_WS_MEASUREMENT):
 
+    __slots__ = ()
+
     def __init__(self, value):
-        super(AS_WS_MEASUREMENT_PRECIPITATION, self).__init__(
-            mtype = MEASURE_PRECIPITATION,
-            value = value,
-            unit = 'mm',
-            labelLong = 'Precipitation',
-            labelShort = 'Precip'
-            )
+        super(AS_WS_MEASUREMENT_PRECIPITATION, self).__init__(MEASURE_PRECIPITATION, value)
+
+
+
+# Measurement class lookup
+MEASURE_CLASS_LOOKUP = OrderedDict([
+    (MEASURE_TEMPERATURE, AS_WS_MEASUREMENT_TEMPERATURE),
+    (MEASURE_RELATIVE_HUMIDITY, AS_WS_MEASUREMENT_RELATIVE_HUMIDITY),
+    (MEASURE_STATION_BAROMETRIC_PRESSURE, AS_WS_MEASUREMENT_STATION_BAROMETRIC_PRESSURE),
+    (MEASURE_PRECIPITATION_WEIGHT, AS_WS_MEASUREMENT_PRECIPITATION_WEIGHT),
+    (MEASURE_INTERNAL_TEMPERATURE, AS_WS_MEASUREMENT_INTERNAL_TEMPERATURE),
+    (MEASURE_CO2, AS_WS_MEASUREMENT_CO2),
+    (MEASURE_NOISE, AS_WS_MEASUREMENT_NOISE),
+    (MEASURE_SEA_LEVEL_BAROMETRIC_PRESSURE, AS_WS_MEASUREMENT_SEA_LEVEL_BAROMETRIC_PRESSURE),
+    (MEASURE_PRECIPITATION, AS_WS_MEASUREMENT_PRECIPITATION)
+    ])
 
 
 
 class AS_DB_CONNECT(object):
     """Store of database connection info"""
     
-    def __init__(self, host, user, passwd, db):
+    def __init__(self, host, user, passwd, db, backend=DB_BACKEND_MYSQL, path=''):
 
         self.host = host
         self.user = user
         self.passwd = passwd
         self.db = db
+        self.backend = backend # DB_BACKEND_*
+        self.path = path # Database file (DB_BACKEND_SQLITE)
+        self.logColumns = [] # Extra as_pws_data_log columns (column name, SQL type), added by the SQLite backend
+
+
+    def connect(self, **kargs):
+        """
+        Open a DB-API connection to the database.
+
+        @param kargs - Extra MySQLdb.connect() arguments (ignored by SQLite).
+        """
+
+        if self.backend == DB_BACKEND_SQLITE:
+            import as_weatherstation.sqlitedb as mod_ws_sqlitedb
+            return mod_ws_sqlitedb.connect(self.path, logColumns=self.logColumns)
+
+        import MySQLdb
+        return MySQLdb.connect(self.host, self.user, self.passwd, self.db, **kargs)
 
 
 def interogate(obj):
@@ -2,6 +2,9 @@
 # encoding=utf-8
 
 from signal import *
+import ctypes
+import ctypes.util
+import sys
 import time
 
 import as_weatherstation.app as mod_ws_app
@@ -19,11 +22,185 @@ class AS_CONTROLLER_ERROR_TIMEOUT(AS_CONTROLLER_ERROR):
 
 AS_CONTROLLER_ERROR_ALL = (AS_CONTROLLER_ERROR, AS_CONTROLLER_ERROR_TIMEOUT)
 
+
+
+def _getMonotonicClock():
+    """
+    Get a function returning seconds on a monotonic clock.
+
+    Python 2 has no time.monotonic(), so clock_gettime(CLOCK_MONOTONIC) is
+    called through ctypes. A monotonic clock never jumps when the system
+    time is set (e.g., by NTP when a PhidgetSBC finds the network after
+    booting with the wrong date). Falls back to time.time() where the call
+    is not available.
+    """
+
+    # CLOCK_MONOTONIC differs between platforms
+    clockIDs = {'linux': 1, 'darwin': 6, 'freebsd': 4}
+    clockID = None
+    for platform, id in clockIDs.items():
+        if sys.platform.startswith(platform):
+            clockID = id
+    if clockID is None:
+        return time.time
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    try:
+        lib = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno=True)
+        clock_gettime = lib.clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+    t = timespec()
+    def monotonic():
+        if clock_gettime(clockID, ctypes.byref(t)) != 0:
+            raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+        return t.tv_sec + t.tv_nsec * 1e-9
+
+    try:
+        monotonic()
+    except OSError:
+        return time.time
+    return monotonic
+
+monotonic = _getMonotonicClock()
+
+
+
+class AS_CONTROLLER_SCHEDULER(object):
+    """
+    Run a loop on a fixed grid of deadlines, without drift.
+
+    Sleeping for the interval after each pass adds the time the pass took
+    (reading, aggregating, writing) to every interval, so the loop runs a
+    little later each time. Instead, the deadlines are planned on a grid:
+    interval seconds apart on the monotonic clock, starting on a wall-clock
+    multiple of align (e.g., on the minute), and wait() sleeps until the
+    next one, however long the pass took.
+
+    A pass that runs past the next deadline is an overrun: wait() returns
+    at once, skipping any deadlines that were missed entirely, so the loop
+    stays on the grid. Overruns are counted, and logged if a logger is
+    given.
+
+    If the system time is set (by more than resyncThreshold seconds), the
+    grid is realigned to the new wall clock.
+
+    With a timeScale, the loop runs that many times faster than real time
+    (e.g., with simulated devices, see as_weatherstation/phidget/simulated.py):
+    the interval and the returned times are simulated seconds, starting
+    from the wall clock when the scheduler starts.
+
+    Usage:
+        scheduler = AS_CONTROLLER_SCHEDULER(6, 60)
+        while True:
+            t = scheduler.wait() # wall-clock time of the deadline, e.g. on the minute
+            ...
+    """
+
+    resyncThreshold = 1.0 # Seconds the wall clock may move against the monotonic clock before the grid is realigned.
+
+    def __init__(self, interval, align=None, logger=None, timeScale=1):
+        """
+        @param interval float - Seconds between deadlines.
+        @param align float optional - Align the grid to wall-clock multiples of
+            this many seconds. Defaults to interval. 0 = no alignment (the first
+            deadline is interval seconds from now).
+        @param logger logging.Logger optional - Overruns are logged to this as warnings.
+        @param timeScale float optional - How many times faster than real time to run.
+        """
+
+        if interval <= 0:
+            raise ValueError('Scheduler interval must be positive, not %s' % str(interval))
+        if timeScale <= 0:
+            raise ValueError('Scheduler time scale must be positive, not %s' % str(timeScale))
+
+        self.interval = float(interval)
+        self.align = self.interval if align is None else float(align)
+        self.logger = logger
+        self.timeScale = float(timeScale)
+
+        self.overruns = 0 # Passes that ran past the next deadline
+        self.missed = 0 # Deadlines skipped by overruns
+        self.lastLate = 0.0 # Seconds the last overrun was late
+        self.maxLate = 0.0 # Seconds the worst overrun was late
+        self.resyncs = 0 # Times the grid was realigned to a new wall clock
+
+        self.start()
+
+
+
+    def start(self):
+        """ Plan the first deadline: the next aligned wall-clock time (or interval seconds from now) """
+
+        mono = self.clock()
+        wall = time.time()
+
+        if self.align > 0:
+            first = (int(wall // self.align) + 1) * self.align
+        else:
+            first = wall + self.interval
+
+        # The wall-clock time of the monotonic clock's zero
+        self.wallOffset = wall - mono
+        self.deadline = first - self.wallOffset
+
+
+
+    def wait(self):
+        """
+        Sleep until the next deadline.
+
+        @return float - Wall-clock time of the deadline (seconds since the epoch).
+        """
+
+        now = self.clock()
+
+        # Has the system time been set since the grid was planned? (Only
+        # followed in real time, a scaled clock leaves the wall clock behind.)
+        if self.timeScale == 1 and abs((time.time() - now) - self.wallOffset) > self.resyncThreshold:
+            self.resyncs += 1
+            self.start()
+
+        late = now - self.deadline
+        if late > 0:
+            # The last pass ran past this deadline. Skip the deadlines that
+            # have passed entirely and go at once, on the latest one.
+            missed = int(late // self.interval)
+            self.deadline += missed * self.interval
+            self.overruns += 1
+            self.missed += missed
+            self.lastLate = late
+            self.maxLate = max(self.maxLate, late)
+            if not self.logger is None:
+                self.logger.warning('Loop overran its %gs interval by %.3fs (%d deadline(s) skipped).', self.interval, late, missed)
+        else:
+            # Sleep can wake early (e.g., on a signal), so check the clock again
+            while now < self.deadline:
+                time.sleep((self.deadline - now) / self.timeScale)
+                now = self.clock()
+
+        deadline = self.deadline
+        self.deadline += self.interval
+        return deadline + self.wallOffset
+
+
+
+    def clock(self):
+        """ The monotonic clock, in (scaled) seconds """
+
+        return monotonic() * self.timeScale
+
+
 class AS_CONTROLLER_ABSTRACT(object):
     
     iteration = 0 # Count of loops run.
     count = 1 # Number of loops to run. Zero = forever (e.g., if running as a daemon).
-    interval = 300 # Number of seconds to wait between loops.
+    interval = 300 # Number of seconds between the starts of loops.
+    alignInterval = True # Start loops on wall-clock multiples of interval (e.g., 5 minutes past), rather than interval seconds after the first.
 
     def __init__(self):
 
@@ -56,7 +233,7 @@ class AS_CONTROLLER_ABSTRACT(object):
             self._main(*args, **kargs)
         except KeyboardInterrupt as e:
             import inspect
-            callerframerecord = inspect.stack()[1+back] # 0 represents this line
+            callerframerecord = inspect.stack()[1] # 0 represents this line
                                                         # 1 represents line at caller
                                                         # 2 represents line at caller's caller
             frame = callerframerecord[0]
@@ -79,11 +256,18 @@ class AS_CONTROLLER_ABSTRACT(object):
         
         The the current iteration number is stored in self.iteration
 
+        Loops start every self.interval seconds (see AS_CONTROLLER_SCHEDULER),
+        however long they take. A loop that takes longer than self.interval
+        is logged as an overrun, and the next one starts at once.
+
         One can break out of the run loop by setting self.go to False.
         """
         
         
         self.preloop(*args, **kargs)
+
+        if self.interval > 0:
+            self.scheduler = AS_CONTROLLER_SCHEDULER(self.interval, None if self.alignInterval else 0, self.error_logger)
         
         self.iteration = 1
         self.go = True
@@ -99,7 +283,7 @@ class AS_CONTROLLER_ABSTRACT(object):
                 break
 
             if self.interval > 0:
-                time.sleep(self.interval)
+                self.scheduler.wait()
 
         self.postloop(*args, **kargs)
 
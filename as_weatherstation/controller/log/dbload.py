@@ -1,14 +1,20 @@
 #!/usr/bin/python
 # encoding=utf-8
 
+from bisect import bisect_right
 import logging
+import time
 
 import as_weatherstation.controller.abstract as mod_ws_controller_abstract
 
 import as_weatherstation.app as mod_ws_app
 
+import as_weatherstation.manifest as mod_ws_manifest
 import as_weatherstation.read.log as mod_ws_read_log
+import as_weatherstation.rollup as mod_ws_rollup
+import as_weatherstation.timecodec as mod_ws_timecodec
 import as_weatherstation.write.db as mod_ws_write_db
+import as_weatherstation.write.sqlite as mod_ws_write_sqlite
 
 
 """
@@ -30,7 +36,26 @@ those may be in use by some other process. Active log files are backed up each
 day, or may be backed up on demand with controller_log_rotate.py
 
 After the log data is inserted into the database, the backup log files are
-gzip'ed and moved to the data/log/imported/ directory.
+gzip'ed and moved to the data/log/imported/ directory, and recorded in the
+load manifest (data/dbload_manifest.json).
+
+Rows already in the database are not sent again. The latest sample time of
+each station is read from the database once per run (the watermark). For the
+rows of a file up to that time, the sample times the database has are read
+back, one query per chunk: if they are all there the rows are skipped,
+otherwise the chunk is sent and the rows already in the database are ignored
+by the server. So rows are only ever skipped if they are known to be in the
+database (e.g., a file that failed on an earlier run while newer ones were
+loaded, or samples the live DB writer dropped, are still loaded). A file that
+is in the manifest (e.g., a copy of a day that was already loaded) is archived
+without being read. Each station's files are loaded in time order. Use
+--no-skip to send every row.
+
+Each file is checkpointed after every committed chunk of rows in the load
+journal (data/dbload_journal.json): the byte offset loaded up to, and the rows
+committed. If a run dies part way through a file, the next run picks up at the
+checkpoint rather than re-reading the file from the start. A file is only moved
+to imported/ once all of its rows have been committed.
 
 An error log may appear in the data folder. This file will contain ERRORS and
 WARNINGS regarding script execution. The error log will be rotated when it
@@ -51,6 +76,30 @@ as_ws.log.config - log configration: rotation times, backup count
 CHANGELOG
 ********************************************************************************
 v1.0 - old PWS data_load.py script converted to use read/write objects
+v1.1 - optional parallel loading (--workers N): log files are parsed in a pool
+       of processes and written by a few DB writer threads, each with its own
+       connection. A file is only moved to imported/ after all of its rows
+       have been committed.
+v1.2 - rows are inserted in batches (--buffer-size N), one commit per batch.
+v1.3 - rows are written with AS_WS_WRITER_DB_BULK, bypassing the logging
+       framework (--writer log for the old logging based writer).
+v1.4 - --writer infile loads each file with LOAD DATA LOCAL INFILE from a
+       staging TSV (falls back to batched INSERTs if the server does not
+       allow it). Overall rows/s is reported at the end of each run, so the
+       writers can be compared.
+v1.5 - loads into an SQLite database if [database_main] backend = sqlite.
+v1.6 - new samples are rolled up into as_pws_data_hourly after each load
+       (--no-rollup to skip; see controller_rollup.py).
+v1.7 - the rollup also updates the 5 minute, daily and monthly tiers.
+v1.8 - rows already in the database, and files already loaded (load
+       manifest), are skipped rather than sent for INSERT IGNORE to reject
+       (--no-skip to send everything). Skipped rows are reported.
+v1.9 - files are checkpointed after each committed chunk, and a load that
+       dies part way through a file resumes from its last checkpoint.
+v1.10 - rows up to the watermark are only skipped once the database is known
+       to have them; each station's files are loaded in time order.
+v1.11 - missing rollup tables and columns are created before each rollup
+       (e.g., after an upgrade); if they can't be, the rollup is skipped.
 
 
 ********************************************************************************
@@ -69,8 +118,69 @@ Plan:
 
 
 
+# DB writers (see AS_CONTROLLER_LOG_DBLOAD.dbWriter)
+DB_WRITER_LOG = 'log' # AS_WS_WRITER_DB, through the logging framework
+DB_WRITER_BULK = 'bulk' # AS_WS_WRITER_DB_BULK, batched INSERTs
+DB_WRITER_INFILE = 'infile' # AS_WS_WRITER_DB_INFILE, LOAD DATA LOCAL INFILE
+
+DB_WRITERS = (DB_WRITER_LOG, DB_WRITER_BULK, DB_WRITER_INFILE)
+
+# Used instead of the above when the DB backend is SQLite
+DB_WRITER_SQLITE = 'sqlite' # AS_WS_WRITER_SQLITE
+
+
+
+# App used by the parser processes (see _initParser())
+_parserApp = None
+
+
+
+def _initParser():
+    """ Set up a parser process of the parallel loader """
+
+    global _parserApp
+
+    # Ctrl-C is handled by the parent process
+    from signal import signal, SIGINT, SIG_IGN
+    signal(SIGINT, SIG_IGN)
+
+    # Forked processes inherit the parent's app
+    if _parserApp is None:
+        _parserApp = mod_ws_app.AS_WS_APP()
+
+
+
+def _parseStationLog(task):
+    """
+    Parse a backup log file in a parser process.
+
+    @param task tuple - (sLabel, logFile, chunkSize, offset)
+    @return tuple - (sLabel, logFile, list of AS_WS_SAMPLE_COLUMNS, seconds, error)
+        On failure the list is None and error is a message string.
+    """
+
+    sLabel, logFile, chunkSize, offset = task
+    start = time.time()
+    try:
+        reader = mod_ws_read_log.AS_WS_READER_LOG(_parserApp, sLabel)
+        chunks = list(reader.iterSamples(logFile, chunkSize, columnar=True, offset=offset))
+    except (ValueError, TypeError, AttributeError, IOError) as e:
+        return (sLabel, logFile, None, time.time() - start, str(e))
+
+    return (sLabel, logFile, chunks, time.time() - start, None)
+
+
+
 class AS_CONTROLLER_LOG_DBLOAD(mod_ws_controller_abstract.AS_CONTROLLER_ABSTRACT):
 
+    chunkSize = 1440 # Rows read and written per batch (one day of 1-minute samples).
+    workers = 0 # Number of parser processes. Zero = load one file at a time in this process.
+    writers = 2 # Number of DB writer threads (and connections) when workers > 0.
+    bufferSize = 500 # Rows per INSERT batch and transaction. Zero = one INSERT and commit per row (per chunk with DB_WRITER_BULK).
+    dbWriter = DB_WRITER_BULK # One of DB_WRITERS.
+    rollup = True # Roll up new samples into the rollup tiers after loading.
+    skipLoaded = True # Skip rows and files already in the DB (see getWatermarks() and the load manifest).
+
     def __init__(self):
         
         # Configure the logging classes.
@@ -85,10 +195,268 @@ class AS_CONTROLLER_LOG_DBLOAD(mod_ws_controller_abstract.AS_CONTROLLER_ABSTRACT
 
 
 
-    def main(self):
-
+    def main(self, workers=None, writers=None, bufferSize=None, dbWriter=None, rollup=None, skipLoaded=None):
+        """
+        @param workers int optional - Number of parser processes (see self.workers).
+        @param writers int optional - Number of DB writer threads (see self.writers).
+        @param bufferSize int optional - Rows per INSERT batch (see self.bufferSize).
+        @param dbWriter string optional - Which DB writer to use (see self.dbWriter).
+        @param rollup bool optional - Roll up new samples after loading (see self.rollup).
+        @param skipLoaded bool optional - Skip rows and files already loaded (see self.skipLoaded).
+        """
+
+        if not workers is None:
+            self.workers = workers
+        if not writers is None:
+            self.writers = writers
+        if not bufferSize is None:
+            self.bufferSize = bufferSize
+        if not dbWriter is None:
+            self.dbWriter = dbWriter
+        if not rollup is None:
+            self.rollup = rollup
+        if not skipLoaded is None:
+            self.skipLoaded = skipLoaded
+
+        if self.app.db[mod_ws_app.DB_MAIN].backend == mod_ws_app.DB_BACKEND_SQLITE:
+            # The MySQL writers don't apply, and SQLite has one writer at a time
+            self.dbWriter = DB_WRITER_SQLITE
+            self.writers = 1
+        elif not self.dbWriter in DB_WRITERS:
+            raise ValueError('Unknown DB writer %s' % str(self.dbWriter))
+
+        self.manifest = mod_ws_manifest.AS_WS_LOAD_MANIFEST(self.app.dataFolder + mod_ws_manifest.MANIFEST_FILE)
+        self.journal = mod_ws_manifest.AS_WS_LOAD_JOURNAL(self.app.dataFolder + mod_ws_manifest.JOURNAL_FILE)
+        backups = []
         for sLabel in self.app.stations:
-            self.loadStationData(sLabel)
+            backups += self.getBackupFiles(sLabel)
+        self.journal.prune(backups)
+        self.watermarks = {}
+        if self.skipLoaded:
+            self.watermarks = self.getWatermarks()
+
+        # (rows, skipped rows, seconds) for each file loaded
+        self.loaded = []
+        # Files archived without loading because they are in the manifest
+        self.skippedFiles = 0
+        start = time.time()
+
+        if self.workers > 0:
+            self.loadParallel()
+        else:
+            for sLabel in self.app.stations:
+                self.loadStationData(sLabel)
+
+        if self.loaded:
+            rows = sum([l[0] for l in self.loaded])
+            seconds = time.time() - start
+            self.message_logger.info('Loaded %d rows from %d files in %.2fs: %.0f rows/s with the %s writer' % (rows, len(self.loaded), seconds, rows / max(seconds, 0.001), self.dbWriter))
+        if self.loaded or self.skippedFiles:
+            self.message_logger.info('Sent %d rows, skipped %d rows already in the DB and %d files already loaded' % (sum([l[0] for l in self.loaded]), sum([l[1] for l in self.loaded]), self.skippedFiles))
+
+        if self.rollup:
+            self.rollupStations()
+
+
+
+    def rollupStations(self):
+        """ Roll up the new samples of each station into the rollup tiers """
+
+        start = time.time()
+        rollup = mod_ws_rollup.AS_WS_ROLLUP(self.app)
+        try:
+            try:
+                # Creates whatever is missing (e.g., a MySQL DB from before the rollup tiers)
+                rollup.createTables()
+            except Exception as e:
+                # The samples are loaded; they can be rolled up later
+                self.error_logger.warning('Skipped the rollup: could not create the rollup tables (%s). Run controller_rollup.py --create-tables, or use --no-rollup.' % e)
+                return
+
+            ranges = 0
+            for sLabel in self.app.stations:
+                ranges += rollup.rollupStation(sLabel)
+        except Exception as e:
+            self.error_logger.error(e)
+            raise
+        finally:
+            rollup.close()
+
+        if ranges:
+            self.message_logger.info('Rolled up %d ranges of new periods in %.2fs' % (ranges, time.time() - start))
+
+
+
+    def getWatermarks(self):
+        """
+        Get the time of the latest sample of each station in the DB, in one query.
+
+        @return dict - Station ID -> seconds since the epoch
+        """
+
+        conn = self.app.db[mod_ws_app.DB_MAIN].connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT fStationID, MAX(fSampleDateTime) FROM as_pws_data_log GROUP BY fStationID')
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+
+        return dict([(row[0], mod_ws_timecodec.parseEpoch(str(row[1]))) for row in rows if not row[1] is None])
+
+
+
+    def getBackupFiles(self, sLabel):
+        """ Get a station's backup log files (rotated out, but not yet imported), oldest first """
+
+        # The names end with the time they were rotated, which sorts as text
+        files = self.app.listLogFiles(self.app.stations[sLabel].id, mod_ws_app.LOGFILE_BACKUP)
+        return sorted(files[mod_ws_app.LOGFILE_BACKUP])
+
+
+
+    def getLoadedTimes(self, conn, stationID, first, last):
+        """
+        Get the sample times a station has in the DB between two times.
+
+        @param first int - Seconds since the epoch (inclusive).
+        @param last int - Seconds since the epoch (inclusive).
+        @return set - Seconds since the epoch
+        """
+
+        p = '?' if self.app.db[mod_ws_app.DB_MAIN].backend == mod_ws_app.DB_BACKEND_SQLITE else '%s'
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT fSampleDateTime FROM as_pws_data_log WHERE fStationID = %s AND fSampleDateTime >= %s AND fSampleDateTime <= %s' % (p, p, p),
+                (stationID, mod_ws_timecodec.formatEpoch(first), mod_ws_timecodec.formatEpoch(last)))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        return set([mod_ws_timecodec.parseEpoch(str(row[0])) for row in rows])
+
+
+
+    def isLoaded(self, logFile):
+        """ Check whether a file is in the load manifest. If so, archive it and say so. """
+
+        if not self.skipLoaded:
+            return False
+
+        entry = self.manifest.get(logFile)
+        if entry is None:
+            return False
+
+        self.app.moveLogFileToImported(logFile, True)
+        self.skippedFiles += 1
+        self.message_logger.info('Skipped %s: already loaded (%s to %s, %d rows)' % (logFile, entry['first'], entry['last'], entry['rows'] + entry['skipped']))
+        return True
+
+
+
+    def getResumeOffset(self, logFile):
+        """ Get the byte offset to start reading a file at: its last checkpoint, if it has one """
+
+        checkpoint = self.journal.get(logFile)
+        if checkpoint is None:
+            return 0
+        if checkpoint['offset'] is None:
+            # Can't be resumed: drop it and start over (the rows already
+            # in the DB are skipped or ignored)
+            self.journal.remove(logFile)
+            return 0
+
+        self.message_logger.info('Resuming %s at byte %d (%d rows already committed)' % (logFile, checkpoint['offset'], checkpoint['rows']))
+        return checkpoint['offset']
+
+
+
+    def writeChunks(self, sLabel, logFile, chunks, writer):
+        """
+        Write a file's columnar chunks to the DB, skipping the rows up to
+        the station's watermark that the DB is known to have. Logs are in
+        time order, so only a prefix of the file can be skipped: once a row
+        is past the watermark, or one up to it is missing from the DB, the
+        rest are sent (rows the DB has are ignored by the server).
+
+        Each chunk is committed, then checkpointed in the journal. If the
+        file has a checkpoint, the chunks are expected to start there (see
+        getResumeOffset()) and the counts carry on from it. A resumed file
+        is never skipped against the watermark.
+
+        @param chunks iterable - AS_WS_SAMPLE_COLUMNS
+        @return tuple - (rows sent, rows skipped, first time, last time).
+            Times are epoch seconds, or None if the file is empty.
+        """
+
+        stationID = self.app.stations[sLabel].id
+        watermark = self.watermarks.get(stationID)
+        rows = 0
+        skipped = 0
+        first = None
+        last = None
+        checkpoint = self.journal.get(logFile)
+        if not checkpoint is None:
+            rows = checkpoint['rows']
+            skipped = checkpoint['skipped']
+            first = checkpoint['first']
+            last = checkpoint['last']
+            watermark = None
+
+        conn = None
+        try:
+            for columns in chunks:
+                if not len(columns):
+                    continue
+                offset = columns.offset
+                if first is None:
+                    first = columns.times[0]
+                last = columns.times[-1]
+
+                if not watermark is None:
+                    i = bisect_right(columns.times, watermark)
+                    if i:
+                        if conn is None:
+                            conn = self.app.db[mod_ws_app.DB_MAIN].connect()
+                        loaded = self.getLoadedTimes(conn, stationID, columns.times[0], columns.times[i-1])
+                        for t in columns.times[:i]:
+                            if not t in loaded:
+                                # Not all in the DB: send the rest of the file
+                                i = 0
+                                watermark = None
+                                break
+                    skipped += i
+                    if i < len(columns):
+                        if i:
+                            columns = columns.sliceRows(i)
+                        watermark = None
+
+                if watermark is None:
+                    writer.write(columns)
+                    # Commit the chunk before it is checkpointed
+                    writer.flush()
+                    rows += len(columns)
+
+                self.journal.checkpoint(logFile, offset, rows, skipped, first, last)
+        finally:
+            if not conn is None:
+                conn.close()
+
+        return (rows, skipped, first, last)
+
+
+
+    def fileLoaded(self, sLabel, logFile, rows, skipped, first, last):
+        """ Archive a file whose rows have all been committed, and add it to the load manifest """
+
+        if not first is None:
+            first = mod_ws_timecodec.formatEpoch(first)
+            last = mod_ws_timecodec.formatEpoch(last)
+
+        self.app.moveLogFileToImported(logFile, True)
+        self.manifest.add(logFile, self.app.stations[sLabel].id, first, last, rows, skipped)
+        self.journal.remove(logFile)
 
 
 
@@ -97,25 +465,271 @@ class AS_CONTROLLER_LOG_DBLOAD(mod_ws_controller_abstract.AS_CONTROLLER_ABSTRACT
         # Get a lost of log backup files. These are the old log
         # files that have been rotated out, but that have not
         # yet been imported.
-        files = self.app.listLogFiles(self.app.stations[sLabel].id, mod_ws_app.LOGFILE_BACKUP)
-
-        for logFile in files[mod_ws_app.LOGFILE_BACKUP]:
-            self.loadStationLog(sLabel, logFile)
-            self.app.moveLogFileToImported(logFile, True)
+        for logFile in self.getBackupFiles(sLabel):
+            if self.isLoaded(logFile):
+                continue
+            start = time.time()
+            rows, skipped, first, last, rate = self.loadStationLog(sLabel, logFile)
+            self.fileLoaded(sLabel, logFile, rows, skipped, first, last)
+            seconds = time.time() - start
+            self.loaded.append((rows, skipped, seconds))
+            self.message_logger.info('Loaded %s: %d rows (%d skipped) in %.2fs (DB %.0f rows/s)' % (logFile, rows, skipped, seconds, rate))
 
 
 
     def loadStationLog(self, sLabel, logFile):
+        """ Load a log file into the DB. Returns (rows sent, rows skipped, first time, last time, DB rows/s) (see writeChunks()). """
 
+        writer = None
+        logger = None
+        handler = None
         try:
-            # Create the PWS reader
-            # and read the samples
+            # Create the log reader and the DB writer
             reader = mod_ws_read_log.AS_WS_READER_LOG(self.app, sLabel)
-            reader.read(log=logFile)
-            # Create the DB writer
-            # and insert the samples
-            writer = mod_ws_write_db.AS_WS_WRITER_DB(self.app, sLabel)
-            writer.write(reader.samples)
+            logger, handler = self.createDBLogger(sLabel)
+            writer = self.createWriter(sLabel, logger)
+            # Stream the samples into the DB in columnar chunks so
+            # memory stays bounded no matter how big the file is
+            # (no per-row sample objects are built)
+            chunks = reader.iterSamples(logFile, self.chunkSize, columnar=True, offset=self.getResumeOffset(logFile))
+            rows, skipped, first, last = self.writeChunks(sLabel, logFile, chunks, writer)
+            self.checkInfileFallback(writer)
+            rate = writer.rowsPerSecond()
         except (ValueError, TypeError, AttributeError) as e:
             self.error_logger.error(e)
             raise
+        finally:
+            if not writer is None and self.dbWriter != DB_WRITER_LOG:
+                writer.close()
+            self.closeDBLogger(logger, handler)
+
+        return (rows, skipped, first, last, rate)
+
+
+
+    def createDBLogger(self, name):
+        """
+        With the logging writer, create a logger with its own DBHandler.
+        The handler raises errors rather than printing them (as the global
+        one does), so a chunk that fails to commit is never checkpointed
+        and its file is never archived.
+
+        @param name string - Name of the logger, under the DB writer's.
+        @return tuple - (logging.Logger, DBHandler), or (None, None) with the other writers.
+        """
+
+        import as_weatherstation.log.dbhandler as mod_ws_log_dbhandler
+
+        if self.dbWriter != DB_WRITER_LOG:
+            return (None, None)
+
+        handler = mod_ws_log_dbhandler.DBHandler(self.app, raiseErrors=True)
+        logger = logging.getLogger('%s.%s' % (mod_ws_write_db.__name__, name))
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        return (logger, handler)
+
+
+
+    def closeDBLogger(self, logger, handler):
+        """ Remove and close the handler of a createDBLogger() logger """
+
+        if handler is None:
+            return
+        logger.removeHandler(handler)
+        handler.close()
+
+
+
+    def createWriter(self, sLabel, logger=None):
+        """
+        Create the DB writer selected by self.dbWriter.
+
+        @param logger logging.Logger optional - Logger for AS_WS_WRITER_DB (see its constructor).
+        """
+
+        if self.dbWriter == DB_WRITER_BULK:
+            return mod_ws_write_db.AS_WS_WRITER_DB_BULK(self.app, sLabel, self.bufferSize)
+        if self.dbWriter == DB_WRITER_INFILE:
+            return mod_ws_write_db.AS_WS_WRITER_DB_INFILE(self.app, sLabel, self.bufferSize)
+        if self.dbWriter == DB_WRITER_SQLITE:
+            return mod_ws_write_sqlite.AS_WS_WRITER_SQLITE(self.app, sLabel, self.bufferSize)
+
+        writer = mod_ws_write_db.AS_WS_WRITER_DB(self.app, sLabel, logger)
+        writer.setBufferSize(self.bufferSize)
+        return writer
+
+
+
+    def checkInfileFallback(self, writer):
+        """ If the server refused LOAD DATA LOCAL INFILE, say so and use batched INSERTs from now on """
+
+        if self.dbWriter == DB_WRITER_INFILE and not writer.infile:
+            self.error_logger.warning('LOAD DATA LOCAL INFILE is not allowed by the DB server (local_infile). Using batched INSERTs instead.')
+            self.dbWriter = DB_WRITER_BULK
+
+
+
+    def loadParallel(self):
+        """
+        Load the backup log files of every station using a pool of parser
+        processes and self.writers DB writer threads.
+
+        Files are handed to the writers in order as they are parsed. Only
+        a few parsed files are held at a time, so memory stays bounded
+        when the DB is slower than the parsers. Each station's files all go
+        to the same writer, oldest first, so they are committed in time
+        order. A file that fails to parse or write is logged and left in
+        place to be retried on the next run, and so are the station's later
+        files.
+        """
+
+        import multiprocessing
+        import threading
+        import Queue
+        from collections import deque
+
+        global _parserApp
+
+        # Take the stations' files in turn, so the writers are kept busy
+        stationTasks = []
+        for sLabel in self.app.stations:
+            stationTasks.append([(sLabel, logFile, self.chunkSize, self.getResumeOffset(logFile)) for logFile in self.getBackupFiles(sLabel) if not self.isLoaded(logFile)])
+        tasks = []
+        while any(stationTasks):
+            for l in stationTasks:
+                if l:
+                    tasks.append(l.pop(0))
+
+        if not tasks:
+            return
+
+        # Stations with a file that failed (see writeParsedLog())
+        self.failedStations = set()
+
+        # Start the pool before any writer threads, so no thread holds a
+        # lock (logging, etc.) while the processes are forked.
+        _parserApp = self.app
+        pool = multiprocessing.Pool(self.workers, _initParser)
+
+        # One queue per writer. Each station is given to one writer.
+        queues = []
+        threads = []
+        for i in range(max(1, self.writers)):
+            queues.append(Queue.Queue(1))
+            t = threading.Thread(target=self.writeParsedLogs, args=(queues[i], i))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        stationQueues = {}
+        for i, sLabel in enumerate(self.app.stations):
+            stationQueues[sLabel] = queues[i % len(queues)]
+
+        try:
+            pending = deque()
+            for task in tasks:
+                pending.append(pool.apply_async(_parseStationLog, (task,)))
+                if len(pending) >= 2*self.workers:
+                    parsed = pending.popleft().get()
+                    stationQueues[parsed[0]].put(parsed)
+            while pending:
+                parsed = pending.popleft().get()
+                stationQueues[parsed[0]].put(parsed)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            # Let the writers finish what they have been given
+            for queue in queues:
+                queue.put(None)
+            for t in threads:
+                t.join()
+            pool.join()
+
+
+
+    def writeParsedLogs(self, queue, n):
+        """
+        DB writer thread. Writes parsed log files from queue until it gets None.
+
+        The thread always drains the queue: if its DB writer can't be
+        created, the files it is given are logged and left in place.
+
+        Each thread has its own DB writer, and so its own DB connection.
+        With the logging writer, the thread gets its own logger (see
+        createDBLogger()).
+
+        @param queue Queue.Queue - Results of _parseStationLog(), for the thread's stations
+        @param n int - Thread number, used to name the logger.
+        """
+
+        handler = None
+        logger = None
+        writer = None
+        error = None
+        try:
+            logger, handler = self.createDBLogger('writer%d' % n)
+            writer = self.createWriter(None, logger)
+        except Exception as e:
+            # Keep taking files off the queue, or loadParallel() would
+            # block on the full queue once every writer thread had failed
+            error = e
+            self.error_logger.error('DB writer %d: %s' % (n, e))
+
+        try:
+            while True:
+                parsed = queue.get()
+                if parsed is None:
+                    break
+                if not error is None:
+                    # Left in place to be retried on the next run
+                    self.failedStations.add(parsed[0])
+                    self.error_logger.error('%s: not loaded, DB writer %d failed: %s' % (parsed[1], n, error))
+                    continue
+                try:
+                    self.writeParsedLog(parsed, writer)
+                except Exception as e:
+                    self.failedStations.add(parsed[0])
+                    self.error_logger.error('%s: %s' % (parsed[1], e))
+        finally:
+            if not writer is None and self.dbWriter != DB_WRITER_LOG:
+                writer.close()
+            self.closeDBLogger(logger, handler)
+
+
+
+    def writeParsedLog(self, parsed, writer):
+        """
+        Write one parsed log file to the DB, then move it to the imported folder.
+
+        Once a file of a station fails, the station's later files are left
+        in place too, so its files are never loaded out of order.
+        """
+
+        sLabel, logFile, chunks, parseTime, error = parsed
+        if sLabel in self.failedStations:
+            self.error_logger.error('%s: not loaded, an earlier file of the station failed' % logFile)
+            return
+        if not error is None:
+            self.failedStations.add(sLabel)
+            self.error_logger.error('%s: %s' % (logFile, error))
+            return
+
+        start = time.time()
+        try:
+            writer.slabel = sLabel
+            rows, skipped, first, last = self.writeChunks(sLabel, logFile, chunks, writer)
+            self.checkInfileFallback(writer)
+        except Exception as e:
+            # Keep the thread alive for the other stations' files
+            self.failedStations.add(sLabel)
+            self.error_logger.error('%s: %s' % (logFile, e))
+            return
+
+        # All of the file's rows have been committed
+        self.fileLoaded(sLabel, logFile, rows, skipped, first, last)
+        seconds = time.time() - start
+        self.loaded.append((rows, skipped, parseTime + seconds))
+        self.message_logger.info('Loaded %s: %d rows (%d skipped), parsed in %.2fs, written in %.2fs (DB %.0f rows/s)' % (logFile, rows, skipped, parseTime, seconds, writer.rowsPerSecond()))
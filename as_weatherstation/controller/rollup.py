@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# encoding=utf-8
+
+import as_weatherstation.controller.abstract as mod_ws_controller_abstract
+
+import as_weatherstation.app as mod_ws_app
+
+import as_weatherstation.rollup as mod_ws_rollup
+
+
+"""
+********************************************************************************
+Controller Rollup
+********************************************************************************
+
+This rolls up the raw samples in the database (as_pws_data_log) into tiers of
+downsampled samples: 5 minute, hourly (as_pws_data_hourly), daily and monthly.
+See as_weatherstation/rollup.py.
+
+By default only the periods with samples loaded since the last rollup are
+recomputed. The DB load controller (controller_log_dbload.py) does this
+automatically after each load, so you only need to run this to:
+    - create the tier tables in a MySQL database (--create-tables)
+    - recompute a given time range (e.g., after fixing data in as_pws_data_log
+      by hand)
+    - roll up all samples from scratch (--backfill, e.g., after adding a tier)
+
+An error log may appear in the data folder. This file will contain ERRORS and
+WARNINGS regarding script execution. The error log will be rotated when it
+approaches 1 MB in size. Up to 10 old error logs will be kept, then older logs
+will start to be discarded.
+
+
+********************************************************************************
+CONFIGURATION
+********************************************************************************
+app.cfg
+    - basic app config: data directory, DB connection info, station IDs and details
+    - optional [rollup] section: tiers and aggregates (see app-explain.cfg)
+
+
+********************************************************************************
+CHANGELOG
+********************************************************************************
+v1.0 - controller created
+v1.1 - 5 minute, daily and monthly tiers, cascading from the tier below;
+       backfill and table creation
+
+
+********************************************************************************
+"""
+
+
+
+class AS_CONTROLLER_ROLLUP(mod_ws_controller_abstract.AS_CONTROLLER_ABSTRACT):
+
+    def __init__(self):
+
+        super(AS_CONTROLLER_ROLLUP, self).__init__()
+
+
+
+    def main(self, start=None, end=None, stations=None, backfill=False, createTables=False):
+        """
+        @param start string optional - 'YYYY-MM-DD HH:MM:SS'. If start and end are
+            given, recompute that range. Otherwise roll up new samples.
+        @param end string optional - 'YYYY-MM-DD HH:MM:SS'
+        @param stations list optional - Station labels. Defaults to all stations.
+        @param backfill bool optional - Roll up all samples from scratch.
+        @param createTables bool optional - Create the tier tables (and missing columns) first.
+        """
+
+        if stations is None:
+            stations = list(self.app.stations)
+
+        rollup = mod_ws_rollup.AS_WS_ROLLUP(self.app)
+        try:
+            if createTables:
+                rollup.createTables()
+                self.message_logger.info('Created rollup tables: %s' % ', '.join([tier.table for tier in rollup.tiers]))
+
+            for sLabel in stations:
+                if backfill:
+                    months = rollup.backfill(sLabel)
+                    self.message_logger.info('Rolled up %d months of samples for %s' % (months, sLabel))
+                elif not start is None and not end is None:
+                    rollup.rollupRange(sLabel, start, end)
+                    self.message_logger.info('Rolled up %s from %s to %s' % (sLabel, start, end))
+                else:
+                    ranges = rollup.rollupStation(sLabel)
+                    self.message_logger.info('Rolled up %d ranges of new periods for %s' % (ranges, sLabel))
+        except Exception as e:
+            self.error_logger.error(e)
+            raise
+        finally:
+            rollup.close()
+
+
+
+    def printSchema(self):
+        """ Print the CREATE TABLE statements of the configured tiers """
+
+        rollup = mod_ws_rollup.AS_WS_ROLLUP(self.app)
+        print "\n\n".join(rollup.getSchema())
@@ -27,15 +27,90 @@
     Copyright (C) 2001-2004 Vinay Sajip. All Rights Reserved.
     """
 import sys, string, time, logging
-import MySQLdb
 import as_weatherstation.app as mod_ws_app
+import as_weatherstation.timecodec as mod_ws_timecodec
+
+def getInsertSQL(wsApp, backend=mod_ws_app.DB_BACKEND_MYSQL):
+    """
+    Build the parameterized INSERT IGNORE statement for as_pws_data_log.
+
+    Values are passed as one tuple per row: station ID, sample time, then
+    the measurements in the order of the returned field list (see
+    formatSampleRow() and formatColumnRows()).
+
+    @param backend string optional - DB_BACKEND_* SQL dialect (and parameter style).
+    @return tuple - (list of measurement types, SQL string)
+    """
+
+    fields = list(wsApp.fieldMap['db'])
+    cols = [wsApp.fieldMap['db'][field] for field in fields]
+    if backend == mod_ws_app.DB_BACKEND_SQLITE:
+        insert, param = 'INSERT OR IGNORE', '?'
+    else:
+        insert, param = 'INSERT IGNORE', '%s'
+    sql = """%s INTO as_pws_data_log (
+            fStationID,
+            fSampleDateTime,
+            %s
+            )
+            VALUES (%s)""" % (insert, ",\n".join(cols), ", ".join([param] * (len(cols) + 2)))
+
+    return (fields, sql)
+
+def getMissingValue(field):
+    """
+    Get the DB value of a measurement a row doesn't have: 0, or None (NULL)
+    for statistics, so rollups can tell them from real values (see
+    AS_WS_ROLLUP.getRollupSQL()).
+    """
+
+    if mod_ws_app.isStatField(field):
+        return None
+    return 0
+
+def formatSampleRow(stationID, sample, fields):
+    """ Get the getInsertSQL() parameters for an AS_WS_SAMPLE """
+
+    row = [stationID, mod_ws_timecodec.formatTime(sample.dateTime)]
+    for field in fields:
+        row.append(sample.getValue(field, getMissingValue(field)))
+    return tuple(row)
+
+def formatColumnRows(stationID, columns, fields):
+    """ Get the getInsertSQL() parameters for each row of an AS_WS_SAMPLE_COLUMNS batch """
+
+    data = [(columns.getColumn(field), getMissingValue(field)) for field in fields]
+    rows = []
+    for i in xrange(len(columns)):
+        row = [stationID, mod_ws_timecodec.formatEpoch(columns.times[i])]
+        for column, missing in data:
+            if column is None:
+                row.append(missing)
+            else:
+                value = column[i]
+                if value != value:
+                    # NaN: not in the row (see AS_WS_SAMPLE_COLUMNS.appendRow())
+                    row.append(missing)
+                else:
+                    row.append(round(value, 2))
+        rows.append(tuple(row))
+    return rows
 
 class DBHandler(logging.Handler):
-    def __init__(self, wsApp=None, delay=True):
+    def __init__(self, wsApp=None, delay=True, raiseErrors=False, bufferSize=0):
+        """
+        @param bufferSize int optional - If zero, each record is inserted and
+            committed as soon as it is emitted. Otherwise rows are buffered and
+            written with one parameterized executemany() and one commit per
+            bufferSize rows (see flush()).
+        """
         
         logging.Handler.__init__(self)
 
         self.delay = True
+        # If True, DB errors are raised to the caller (e.g., so a loader
+        # knows the rows were not committed) instead of just printed.
+        self.raiseErrors = raiseErrors
         self.conn = None
         self.cursor = None
 
@@ -44,6 +119,13 @@ class DBHandler(logging.Handler):
         self.password = ''
         self.database = ''
 
+        self.bufferSize = bufferSize
+        self.buffer = []
+
+        # Throughput counters, see rowsPerSecond()
+        self.rowCount = 0
+        self.writeTime = 0.0
+
         self.setApp(wsApp)
 
 
@@ -68,7 +150,11 @@ class DBHandler(logging.Handler):
         vals = []
         for field in self.app.fieldMap['db']:
             cols.append(self.app.fieldMap['db'][field])
-            vals.append('"%%(%s)s"' % self.app.fieldMap['db'][field])
+            if mod_ws_app.isStatField(field):
+                # Unquoted, so they can be NULL
+                vals.append('%%(%s)s' % self.app.fieldMap['db'][field])
+            else:
+                vals.append('"%%(%s)s"' % self.app.fieldMap['db'][field])
 
         self.SQL = """INSERT IGNORE INTO as_pws_data_log (
             fStationID,
@@ -82,46 +168,147 @@ class DBHandler(logging.Handler):
             );
             """ % (",\n".join(cols), ",\n".join(vals))
 
+        # Parameterized version for executemany() in buffered mode
+        self.fields, self.insertSQL = getInsertSQL(self.app)
+
+    def setBufferSize(self, bufferSize):
+        """ Change the number of rows per batch. Buffered rows are written first. """
+        self.flush()
+        self.bufferSize = bufferSize
+
     def connect(self):
+        # Imported here so stations using the SQLite backend don't need MySQLdb
+        import MySQLdb
         self.conn = MySQLdb.connect(self.host, self.user, self.password, self.database)
         self.cursor = self.conn.cursor()
     
     def formatDBTime(self, record):
-        record.dbtime = time.strftime("%Y-%m-%d %H:%M:%S", record.sample.dateTime)
+        record.dbtime = mod_ws_timecodec.formatTime(record.sample.dateTime)
     
+    def formatMissingValue(self, field):
+        """ Format getMissingValue() for self.SQL """
+        value = getMissingValue(field)
+        if value is None:
+            return 'NULL'
+        return str(value)
+
+    def formatColumns(self, record):
+        """ Build one SQL statement per row of a columnar batch (AS_WS_SAMPLE_COLUMNS) """
+
+        columns = record.columns
+        fields = self.app.fieldMap['db']
+        values = {'stationID': record.stationID}
+        sql = []
+        for i in xrange(len(columns)):
+            values['dbtime'] = mod_ws_timecodec.formatEpoch(columns.times[i])
+            for field in fields:
+                column = columns.getColumn(field)
+                if not column is None and column[i] == column[i]:
+                    values[fields[field]] = str(round(column[i], 2))
+                else :
+                    values[fields[field]] = self.formatMissingValue(field)
+            sql.append(self.SQL % values)
+        return sql
+
+    def formatRows(self, record):
+        """ Get the parameters for self.insertSQL, one tuple per row of the record """
+
+        if hasattr(record, 'columns'):
+            return formatColumnRows(record.stationID, record.columns, self.fields)
+        return [formatSampleRow(record.stationID, record.sample, self.fields)]
+
     def emit(self, record):
         try:
             #use default formatting -- this doesn't do much except format the message, which we don't use
             self.format(record)
 
-            # move the sample measurement key/values into the record
-            for field in self.app.fieldMap['db']:
-                measurement = record.sample.getMeasurement(field)
-                if not measurement is None:
-                    record.__dict__[self.app.fieldMap['db'][field]] = measurement.getString()
-                else :
-                    record.__dict__[self.app.fieldMap['db'][field]] = '0'
+            if self.bufferSize > 0:
+                self.buffer.extend(self.formatRows(record))
+                if len(self.buffer) >= self.bufferSize:
+                    self.flush()
+                return
 
-            #now set the database time up
-            self.formatDBTime(record)
-            if record.exc_info:
-                record.exc_text = logging._defaultFormatter.formatException(record.exc_info)
+            if hasattr(record, 'columns'):
+                # A whole batch of rows in one record
+                sql = self.formatColumns(record)
             else:
-                record.exc_text = ""
-            sql = self.SQL % record.__dict__
+                # move the sample measurement key/values into the record
+                for field in self.app.fieldMap['db']:
+                    measurement = record.sample.getMeasurement(field)
+                    if not measurement is None:
+                        record.__dict__[self.app.fieldMap['db'][field]] = measurement.getString()
+                    else :
+                        record.__dict__[self.app.fieldMap['db'][field]] = self.formatMissingValue(field)
+
+                #now set the database time up
+                self.formatDBTime(record)
+                if record.exc_info:
+                    record.exc_text = logging._defaultFormatter.formatException(record.exc_info)
+                else:
+                    record.exc_text = ""
+                sql = [self.SQL % record.__dict__]
+            start = time.time()
             if self.cursor is None:
                 self.connect()
-            self.cursor.execute(sql)
+            for statement in sql:
+                self.cursor.execute(statement)
             self.conn.commit()
+            self.rowCount += len(sql)
+            self.writeTime += time.time() - start
         except:
+            if self.raiseErrors:
+                raise
             import traceback
             ei = sys.exc_info()
             traceback.print_exception(ei[0], ei[1], ei[2], None, sys.stderr)
             del ei
+
+    def flush(self):
+        """
+        Write the buffered rows in batches of self.bufferSize, committing
+        after each batch. Call at the end of each file (or whenever the
+        rows must be in the DB). Rows of a failed batch are discarded.
+        """
+
+        self.acquire()
+        try:
+            while self.buffer:
+                rows = self.buffer[:self.bufferSize or len(self.buffer)]
+                del self.buffer[:len(rows)]
+                start = time.time()
+                try:
+                    if self.cursor is None:
+                        self.connect()
+                    self.cursor.executemany(self.insertSQL, rows)
+                    self.conn.commit()
+                except:
+                    if not self.conn is None:
+                        self.conn.rollback()
+                    raise
+                self.rowCount += len(rows)
+                self.writeTime += time.time() - start
+        except:
+            del self.buffer[:]
+            if self.raiseErrors:
+                raise
+            import traceback
+            ei = sys.exc_info()
+            traceback.print_exception(ei[0], ei[1], ei[2], None, sys.stderr)
+            del ei
+        finally:
+            self.release()
+
+    def rowsPerSecond(self):
+        """ Rows written per second spent writing (executing and committing) them """
+        if self.writeTime <= 0:
+            return 0.0
+        return self.rowCount / self.writeTime
     
     def close(self):
+        self.flush()
         if not self.cursor is None:
             self.cursor.close()
             self.conn.close()
+            self.cursor = None
+            self.conn = None
         logging.Handler.close(self)
-
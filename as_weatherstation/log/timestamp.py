@@ -1,6 +1,8 @@
 import logging
 import time
 
+import as_weatherstation.timecodec as mod_ws_timecodec
+
 
 def getLogger(stationID):
 	import as_weatherstation.config.log as config
@@ -20,14 +22,14 @@ def getLogString(d):
 
 
 	d2 = list(d)
-	d2[0] = time.strftime("%Y-%m-%d %H:%M:%S", d[0])
+	d2[0] = mod_ws_timecodec.formatTime(d[0])
 	return ",".join(d2)
 
 
 def getLatestTimestamp(timestampFile):
 	""" Get the latest timestamp from the timestamp file """
 	try:
-		t = time.strptime(file_get_contents(timestampFile).rstrip(), "%Y-%m-%d %H:%M:%S")
+		t = mod_ws_timecodec.parseTime(file_get_contents(timestampFile).rstrip())
 	except (IOError, ValueError):
 		return None
 	return t
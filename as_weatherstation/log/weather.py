@@ -1,6 +1,14 @@
 import logging
 import time
 
+import as_weatherstation.timecodec as mod_ws_timecodec
+
+
+# Appended to a held row: the row stands for a run of count rows, interval
+# seconds apart, ending at its time, which were held back because nothing
+# moved (see as_weatherstation/write/deadband.py). Readers expand it.
+HOLD_MARKER = '~hold:'
+
 
 def getLogger(stationID):
 	import as_weatherstation.config.log as config
@@ -9,9 +17,9 @@ def getLogger(stationID):
 	return logging.getLogger(config.getStationLogLoggerID(stationID))
 
 
-def getLogString(d):
+def getLogString(d, itemCount=10):
+	""" @param itemCount int optional - Time and the fields logged (9 instrument samples, plus any [aggregate] statistics and hold marker) """
 
-	itemCount = 10 # time and 9 instrument samples
 	if __debug__ :
 		if not isinstance(d[0], time.struct_time):
 			raise AssertionError('Log item zero should be a time object -- %s given' % type(d[0]))
@@ -19,10 +27,26 @@ def getLogString(d):
 			raise AssertionError('Log item should contain %d items: %d given' % (itemCount,len(d)))
 
 	d2 = list(d)
-	d2[0] = time.strftime("%Y-%m-%d %H:%M:%S", d[0])
+	d2[0] = mod_ws_timecodec.formatTime(d[0])
 	return ",".join(d2)
 
 
+def getHoldMarker(count, interval):
+	""" The marker of a held row (e.g., ~hold:10x60) """
+
+	return '%s%dx%d' % (HOLD_MARKER, count, interval)
+
+
+def parseHoldMarker(s):
+	""" The (count, interval) of a held row's marker, or None if s is not one """
+
+	if not s.startswith(HOLD_MARKER):
+		return None
+
+	count, interval = s[len(HOLD_MARKER):].split('x')
+	return (int(count), int(interval))
+
+
 def getLatestTimestamp(logFile):
 	""" Get latest timestamp by looking at the last line of the log file """
 	try:
@@ -33,7 +57,7 @@ def getLatestTimestamp(logFile):
 	tString = line.split(',')[0]
 
 	try:
-		t = time.strptime(tString, "%Y-%m-%d %H:%M:%S")
+		t = mod_ws_timecodec.parseTime(tString)
 	except ValueError:
 		return None
 
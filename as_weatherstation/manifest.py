@@ -0,0 +1,196 @@
+#!/usr/local/bin/python
+# coding: utf-8
+
+"""
+Records of the backup log files loaded into the database.
+
+AS_WS_LOAD_MANIFEST - files that have been loaded
+AS_WS_LOAD_JOURNAL - checkpoints of files being loaded
+
+Manifest:
+The DB load controller (controller_log_dbload.py) adds an entry for each
+file once all of its rows have been committed: the station, the times of
+its first and last rows, and how many rows were sent and skipped. A file
+with the same name that turns up again (e.g., a copy of a day that is in
+both downloaded/ and log/) is then known to be loaded without reading it
+or sending its rows to the DB.
+
+Journal:
+While a file is being loaded, the controller checkpoints it after each
+committed chunk of rows: the byte offset just past the chunk's last row,
+and the rows committed so far. If the load dies part way through, the
+next run resumes from the offset instead of re-reading the file from the
+start. The entry is removed once the file has been archived.
+
+A crash between a commit and its checkpoint means the next run sends
+that chunk again. The rows are already in the DB, so the server ignores
+them (INSERT IGNORE), and each row still ends up loaded once.
+
+Both are JSON files in the data folder, rewritten (atomically) on every
+change. Entries are keyed on the file name without folder or '.gz'.
+"""
+
+import json
+import os
+import threading
+import time
+
+
+MANIFEST_FILE = 'dbload_manifest.json'
+JOURNAL_FILE = 'dbload_journal.json'
+
+
+
+class AS_WS_LOAD_RECORD(object):
+    """ Base class of the manifest and the journal: a JSON file of entries keyed on log file """
+
+    def __init__(self, path):
+        """
+        @param path string - JSON file. Created on the first save() if it does not exist.
+        """
+
+        self.path = path
+        self.files = {}
+        # Several DB writer threads may add files at once
+        self.lock = threading.Lock()
+
+        self.load()
+
+
+
+    @staticmethod
+    def getKey(logFile):
+        """ Get the entry key of a (possibly gzipped) log file """
+
+        name = os.path.basename(logFile)
+        if name.endswith('.gz'):
+            name = name[:-3]
+        return name
+
+
+
+    def load(self):
+
+        if not os.path.isfile(self.path):
+            self.files = {}
+            return
+
+        with open(self.path, 'r') as f:
+            self.files = json.load(f).get('files', {})
+
+
+
+    def save(self):
+        """ Write the file to a temporary file, then move it over the old one """
+
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'files': self.files}, f, indent=1, sort_keys=True)
+            # Make sure the new contents are on disk before they replace the old
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, self.path)
+
+
+
+    def get(self, logFile):
+        """ Get a file's entry, or None """
+
+        return self.files.get(self.getKey(logFile))
+
+
+
+class AS_WS_LOAD_MANIFEST(AS_WS_LOAD_RECORD):
+
+    def get(self, logFile):
+        """
+        Get the entry of a loaded file.
+
+        @return dict - {stationID, first, last, rows, skipped, loaded} (times
+            as 'YYYY-MM-DD HH:MM:SS' strings), or None if the file is not in
+            the manifest.
+        """
+
+        return super(AS_WS_LOAD_MANIFEST, self).get(logFile)
+
+
+
+    def add(self, logFile, stationID, first, last, rows, skipped=0):
+        """
+        Record a file whose rows have all been committed, and save the manifest.
+
+        @param first string - Time of the file's first row. None if the file is empty.
+        @param last string - Time of the file's last row. None if the file is empty.
+        @param rows int - Rows sent to the DB.
+        @param skipped int - Rows skipped because they were already in the DB.
+        """
+
+        with self.lock:
+            self.files[self.getKey(logFile)] = {
+                'stationID': stationID,
+                'first': first,
+                'last': last,
+                'rows': rows,
+                'skipped': skipped,
+                'loaded': time.strftime('%Y-%m-%d %H:%M:%S')
+            }
+            self.save()
+
+
+
+class AS_WS_LOAD_JOURNAL(AS_WS_LOAD_RECORD):
+
+    def get(self, logFile):
+        """
+        Get the last checkpoint of a file being loaded.
+
+        @return dict - {offset, rows, skipped, first, last} (times as seconds
+            since the epoch), or None if the file has no checkpoint.
+        """
+
+        return super(AS_WS_LOAD_JOURNAL, self).get(logFile)
+
+
+
+    def checkpoint(self, logFile, offset, rows, skipped, first, last):
+        """
+        Record that a file's rows up to a byte offset have been committed, and save the journal.
+
+        @param offset int - Byte offset just past the last committed row.
+        @param rows int - Rows sent to the DB so far.
+        @param skipped int - Rows skipped so far (already in the DB).
+        @param first int - Time of the file's first row, in seconds since the epoch.
+        @param last int - Time of the last row read so far, in seconds since the epoch.
+        """
+
+        with self.lock:
+            self.files[self.getKey(logFile)] = {
+                'offset': offset,
+                'rows': rows,
+                'skipped': skipped,
+                'first': first,
+                'last': last
+            }
+            self.save()
+
+
+
+    def remove(self, logFile):
+        """ Drop a file's checkpoint (once it has been archived) """
+
+        with self.lock:
+            if self.files.pop(self.getKey(logFile), None) is not None:
+                self.save()
+
+
+
+    def prune(self, logFiles):
+        """ Drop the checkpoints of files that are not in logFiles (e.g., archived by hand) """
+
+        keys = set([self.getKey(f) for f in logFiles])
+        with self.lock:
+            stale = [key for key in self.files if not key in keys]
+            for key in stale:
+                del self.files[key]
+            if stale:
+                self.save()
@@ -0,0 +1,30 @@
+import as_weatherstation.app as mod_ws_app
+
+
+def getBackend(wsApp):
+    """
+    The Phidget backend module of the app: as_weatherstation.phidget.lphidget
+    (the Phidget library) or as_weatherstation.phidget.simulated.
+
+    Both provide PHIDGET_IFK, PHIDGET_TEXTLCD, PhidgetException and
+    PhidgetErrorCodes. The backend is imported here, rather than when
+    the readers and writers are, so the Phidget library is only needed
+    when it is used.
+    """
+
+    if wsApp.phidgetBackend == mod_ws_app.PHIDGET_BACKEND_SIMULATED:
+        import as_weatherstation.phidget.simulated as backend
+        backend.configure(wsApp)
+    else:
+        import as_weatherstation.phidget.lphidget as backend
+
+    return backend
+
+
+
+def getTimeScale(wsApp):
+    """ How many times faster than real time the Phidget devices run (only simulated ones run faster) """
+
+    if wsApp.phidgetBackend == mod_ws_app.PHIDGET_BACKEND_SIMULATED:
+        return wsApp.simulation['timeScale']
+    return 1.0
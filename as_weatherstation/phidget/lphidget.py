@@ -23,6 +23,11 @@ class PHIDGET_IFK(object):
         if 'ratiometric' in kargs:
             self.ratiometric = kargs['ratiometric'] 
 
+        # {sensor index: change trigger} set when the InterfaceKit attaches
+        self.sensorChangeTriggers = {}
+        if 'sensorChangeTriggers' in kargs:
+            self.sensorChangeTriggers = kargs['sensorChangeTriggers']
+
         h = [
             'onAttachHandler',
             'onDetachHandler',
@@ -60,6 +65,8 @@ class PHIDGET_IFK(object):
 
     def attached(self, e):
         self.interfaceKit.setRatiometric(self.ratiometric)
+        for index in self.sensorChangeTriggers:
+            self.interfaceKit.setSensorChangeTrigger(index, self.sensorChangeTriggers[index])
         time.sleep(0.05)
         if self.onAttachHandler: self.onAttachHandler(e)
 
@@ -77,7 +84,7 @@ class PHIDGET_IFK(object):
         if self.onInputChangeHandler: self.onInputChangeHandler(e.index, e.state, e)
 
     def sensorChanged(self, e):
-        if self.onInputChangeHandler: self.onInputChangeHandler(e.index, e.value, e)
+        if self.onSensorChangeHandler: self.onSensorChangeHandler(e.index, e.value, e)
 
 
 
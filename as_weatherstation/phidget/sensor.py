@@ -0,0 +1,141 @@
+#!/usr/local/bin/python
+# coding: utf-8
+
+"""
+Conversion of Phidget analog sensor values to measurements.
+
+AS_WS_SENSOR_TABLE - every possible converted value of one sensor
+
+The InterfaceKit reports sensors as bounded integers: 0-1000 from
+getSensorValue(), or 0-4095 from getSensorRawValue() (used for the
+barometric pressure). Rather than running the conversion formula for
+every sensor on every sample, a table of all the converted values is
+built once, when the station is configured, and samples are converted by
+looking them up. A station's calibration offsets (e.g., sensorTempOffset)
+are built into its tables.
+
+Run this module (from the top-level folder) to benchmark the tables
+against the formulas over a synthetic day of 1 Hz samples:
+
+    python -m as_weatherstation.phidget.sensor
+"""
+
+import as_weatherstation.app as mod_ws_app
+
+
+SENSOR_VALUE_MAX = 1000 # Largest getSensorValue()
+SENSOR_RAW_VALUE_MAX = 4095 # Largest getSensorRawValue()
+
+
+
+def isRawSensor(mtype):
+    """ Is a measurement converted from getSensorRawValue() (rather than getSensorValue())? """
+
+    return mtype == mod_ws_app.MEASURE_STATION_BAROMETRIC_PRESSURE
+
+
+
+def convertSensorValue(value, mtype, offset=0):
+    """
+    Convert a sensor value to a measurement.
+
+    @param value int - getSensorValue() (or getSensorRawValue(), see isRawSensor()).
+    @param offset float optional - Calibration offset, added to the measurement before it is rounded.
+    """
+
+    # These conversions are in the product manual
+    if mtype == mod_ws_app.MEASURE_TEMPERATURE or mtype == mod_ws_app.MEASURE_INTERNAL_TEMPERATURE:
+        return round((value * 0.2222) - 61.111 + offset, 1)
+
+    elif mtype == mod_ws_app.MEASURE_RELATIVE_HUMIDITY:
+        return int(round((value * 0.1906) - 40.2 + offset, 0))
+
+    elif mtype == mod_ws_app.MEASURE_STATION_BAROMETRIC_PRESSURE:
+        # This version of the equation requires the use of Phidgets.Devices.InterfaceKit.getSensorRawValue()
+        return int(round((((value / 4.095)/4.0) + 10.0) * 10 + offset, 0))
+
+    elif mtype == mod_ws_app.MEASURE_PRECIPITATION_WEIGHT:
+        return int(round((((value / 70.0) - (10.0/7.0)) * 453.59237) + offset, 0))
+
+    else:
+        raise ValueError('Unsupported measurement type %s' % str(mtype))
+
+
+
+class AS_WS_SENSOR_TABLE(object):
+    """ Lookup table of the converted values of one sensor """
+
+    def __init__(self, mtype, offset=0):
+        """
+        @param mtype int - Measurement type (MEASURE_*).
+        @param offset float optional - Calibration offset (see convertSensorValue()).
+        """
+
+        self.mtype = mtype
+        self.offset = offset
+
+        size = (SENSOR_RAW_VALUE_MAX if isRawSensor(mtype) else SENSOR_VALUE_MAX) + 1
+        self.table = tuple([convertSensorValue(value, mtype, offset) for value in xrange(size)])
+
+
+
+    def convert(self, value):
+        """ Convert a sensor value. Values outside the table (which the InterfaceKit shouldn't report) are calculated. """
+
+        try:
+            return self.table[value]
+        except (IndexError, TypeError):
+            return convertSensorValue(value, self.mtype, self.offset)
+
+
+
+if __name__ == '__main__':
+
+    import random
+    import time
+
+    mtypes = [
+        mod_ws_app.MEASURE_TEMPERATURE,
+        mod_ws_app.MEASURE_RELATIVE_HUMIDITY,
+        mod_ws_app.MEASURE_STATION_BAROMETRIC_PRESSURE,
+        mod_ws_app.MEASURE_PRECIPITATION_WEIGHT,
+        mod_ws_app.MEASURE_INTERNAL_TEMPERATURE
+        ]
+    seconds = 24*60*60
+
+    # A random walk for each sensor, one value a second
+    random.seed(1)
+    samples = []
+    for mtype in mtypes:
+        top = SENSOR_RAW_VALUE_MAX if isRawSensor(mtype) else SENSOR_VALUE_MAX
+        value = top // 2
+        values = []
+        for i in xrange(seconds):
+            value = min(top, max(0, value + random.randint(-2, 2)))
+            values.append(value)
+        samples.append((mtype, values))
+
+    start = time.clock()
+    tables = dict((mtype, AS_WS_SENSOR_TABLE(mtype)) for mtype in mtypes)
+    build = time.clock() - start
+
+    start = time.clock()
+    for mtype, values in samples:
+        for value in values:
+            convertSensorValue(value, mtype)
+    formulas = time.clock() - start
+
+    start = time.clock()
+    for mtype, values in samples:
+        convert = tables[mtype].convert
+        for value in values:
+            convert(value)
+    lookups = time.clock() - start
+
+    for mtype, values in samples:
+        assert [tables[mtype].convert(v) for v in values] == [convertSensorValue(v, mtype) for v in values]
+
+    print 'A day of 1 Hz samples: %d sensors x %d seconds' % (len(mtypes), seconds)
+    print 'Formulas:      %.3f s CPU' % formulas
+    print 'Tables:        %.3f s CPU (+ %.3f s to build them)' % (lookups, build)
+    print 'Saved:         %.0f%%' % (100 * (1 - (lookups + build) / formulas))
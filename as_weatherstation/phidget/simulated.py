@@ -0,0 +1,760 @@
+#!/usr/local/bin/python
+# coding: utf-8
+
+"""
+Simulated Phidget devices, for running the Phidget Weather Station without
+hardware (e.g., to profile or load test it on a build machine).
+
+PHIDGET_IFK - simulated InterfaceKit, a drop-in for lphidget.PHIDGET_IFK
+PHIDGET_TEXTLCD - simulated TextLCD, a drop-in for lphidget.PHIDGET_TEXTLCD
+
+They are used when the phidgetBackend option of the [app] config section
+(or the AS_WS_PHIDGET_BACKEND environment variable) is 'simulated', and
+set up by the [simulation] section:
+
+    timeScale - run this many times faster than real time (e.g., 100)
+    latency - seconds each device call takes (e.g., to mimic the webservice)
+    sensorRate - sensor value changes a second
+    sensorStep - largest change of a random sensor value, in 0-1000 sensor units
+    inputRate - random input events (rain gauge tips) an hour
+    script - CSV file of sensor values and input events (see SIM_SCRIPT)
+    seed - random seed, for repeatable runs
+
+The InterfaceKit's sensors take a random walk around plausible values of
+the station's measurements, and its rain gauge tips at random (Poisson)
+times. A script takes over the sensors and inputs it names. As with the
+Phidget library, changes are sent to the handlers from an event thread:
+sensor change events when a sensor moves by its change trigger, and
+input change events for each tip.
+
+The TextLCD keeps what is displayed in an in-memory framebuffer (see
+SIM_TEXTLCD.getFramebuffer()).
+
+Times (latency, rates, script) are simulated seconds: with timeScale = 100,
+a 20 ms latency takes 0.2 ms. AS_CONTROLLER_PWS_MAIN schedules its samples
+on the same scale.
+"""
+
+import atexit
+import bisect
+import csv
+import random
+import threading
+import time
+
+import as_weatherstation.app as mod_ws_app
+import as_weatherstation.controller.abstract as mod_ws_controller_abstract
+from as_weatherstation.phidget import sensor as mod_ws_phidget_sensor
+
+
+class PhidgetErrorCodes(object):
+    """ The error codes of the Phidget library used by the simulated devices """
+
+    EPHIDGET_NOTATTACHED = 5
+    EPHIDGET_TIMEOUT = 13
+    EPHIDGET_OUTOFBOUNDS = 14
+
+
+
+class PhidgetException(Exception):
+    """ Raised by the simulated devices, like the Phidget library's PhidgetException """
+
+    details = {
+        PhidgetErrorCodes.EPHIDGET_NOTATTACHED: 'Phidget not physically attached.',
+        PhidgetErrorCodes.EPHIDGET_TIMEOUT: 'Given timeout has been exceeded.',
+        PhidgetErrorCodes.EPHIDGET_OUTOFBOUNDS: 'Index out of Bounds.'
+        }
+
+    def __init__(self, code):
+        self.code = code
+        self.details = PhidgetException.details.get(code, 'Simulated Phidget error.')
+        super(PhidgetException, self).__init__(code, self.details)
+
+
+
+RAW_PER_VALUE = mod_ws_phidget_sensor.SENSOR_RAW_VALUE_MAX / float(mod_ws_phidget_sensor.SENSOR_VALUE_MAX) # getSensorRawValue() units per getSensorValue() unit
+
+# Where the random walk of each measurement's sensor starts (in the measurement's units)
+SENSOR_START = {
+    mod_ws_app.MEASURE_TEMPERATURE: 15.0, # C
+    mod_ws_app.MEASURE_RELATIVE_HUMIDITY: 60, # %
+    mod_ws_app.MEASURE_STATION_BAROMETRIC_PRESSURE: 1000, # hPa
+    mod_ws_app.MEASURE_PRECIPITATION_WEIGHT: 0, # g
+    mod_ws_app.MEASURE_INTERNAL_TEMPERATURE: 25.0 # C
+    }
+
+app = None # The app whose stations and settings are simulated (see configure())
+settings = None # The app's [simulation] settings
+
+
+
+def configure(wsApp):
+    """ Simulate the devices of an app's stations, with its [simulation] settings """
+
+    global app, settings
+    app = wsApp
+    settings = wsApp.simulation
+
+
+
+def clock():
+    """ Simulated seconds (on the monotonic clock, timeScale times faster) """
+
+    return mod_ws_controller_abstract.monotonic() * settings['timeScale']
+
+
+
+def sleep(seconds):
+    """ Sleep for simulated seconds """
+
+    time.sleep(seconds / settings['timeScale'])
+
+
+
+def getStation(serialNumber):
+    """ The configured PWS whose InterfaceKit has serialNumber (any PWS if None) """
+
+    if app is None:
+        return None
+
+    for station in app.stations.values():
+        if station.stype != mod_ws_app.STYPE_PWS:
+            continue
+        if serialNumber is None or getattr(station, 'interfaceKitID', None) == serialNumber:
+            return station
+
+    return None
+
+
+
+def getSensorRawValue(mtype, value):
+    """ The raw sensor value (0-4095) that converts to the measurement nearest value """
+
+    table = mod_ws_phidget_sensor.AS_WS_SENSOR_TABLE(mtype).table
+    i = min(bisect.bisect_left(table, value), len(table) - 1)
+
+    if mod_ws_phidget_sensor.isRawSensor(mtype):
+        return float(i)
+    return i * RAW_PER_VALUE
+
+
+
+class SIM_EVENT(object):
+    """ Event arguments, as the Phidget library passes them to the handlers """
+
+    def __init__(self, device, index=None, state=None, value=None):
+        self.device = device
+        self.index = index
+        self.state = state
+        self.value = value
+
+
+
+class SIM_SCRIPT(object):
+    """
+    Scripted sensor values and input events.
+
+    The script is a CSV file of (seconds, port, value) lines. Seconds are
+    simulated seconds since the device was opened. The port is one of the
+    station's options naming a port, with values in the measurement's
+    units, or a port of the InterfaceKit, with values in its units:
+
+        # seconds, port, value
+        0, sensorTemp, 12.5
+        3600, sensorTemp, 18.0
+        0, sensor2, 480
+        600, inputRG, 1
+        610, input0, 3
+
+    A sensor's value is interpolated between its lines, and held before
+    the first and after the last. An input line is that many input events
+    (e.g., rain gauge tips) at that time. Blank lines and lines starting
+    with # are ignored.
+    """
+
+    def __init__(self, path, station=None):
+        """
+        @param path string - The script file.
+        @param station AS_WS_STATION_PWS optional - The station whose option names the script uses.
+        """
+
+        # Ports named by the station's options: {option: (PWS_IO_*, index, mtype)}
+        ports = {}
+        if not station is None:
+            fm = station.app.fieldMap[mod_ws_app.STYPE_PWS]
+            for mtype in fm:
+                if not fm[mtype] is None:
+                    ports[fm[mtype][1]] = (fm[mtype][0], getattr(station, fm[mtype][1]), mtype)
+
+        self.sensors = {} # {index: ([seconds], [raw values])}
+        self.inputs = {} # {index: [(seconds, events)]}
+
+        with open(path, 'rb') as f:
+            for n, line in enumerate(csv.reader(f), 1):
+                if not line or not line[0].strip() or line[0].strip().startswith('#'):
+                    continue
+                try:
+                    seconds, port, value = [v.strip() for v in line]
+                    seconds = float(seconds)
+                    value = float(value)
+                except ValueError:
+                    raise ValueError('Bad simulation script line %d in %s: %s' % (n, path, ','.join(line)))
+
+                if port in ports:
+                    io, index, mtype = ports[port]
+                    if io == mod_ws_app.PWS_IO_SENSOR:
+                        value = getSensorRawValue(mtype, value)
+                elif port.startswith('sensor') and port[6:].isdigit():
+                    io, index = mod_ws_app.PWS_IO_SENSOR, int(port[6:])
+                    value = value * RAW_PER_VALUE
+                elif port.startswith('input') and port[5:].isdigit():
+                    io, index = mod_ws_app.PWS_IO_INPUT, int(port[5:])
+                else:
+                    raise ValueError('Unknown port %s on simulation script line %d in %s' % (port, n, path))
+
+                if io == mod_ws_app.PWS_IO_SENSOR:
+                    self.sensors.setdefault(index, []).append((seconds, value))
+                else:
+                    self.inputs.setdefault(index, []).append((seconds, int(value)))
+
+        for index in self.sensors:
+            points = sorted(self.sensors[index])
+            self.sensors[index] = ([p[0] for p in points], [p[1] for p in points])
+        for index in self.inputs:
+            self.inputs[index].sort()
+
+
+
+    def getSensorRawValue(self, index, seconds):
+        """ A scripted sensor's raw value at a time """
+
+        times, values = self.sensors[index]
+        i = bisect.bisect_right(times, seconds)
+        if i == 0:
+            return values[0]
+        if i == len(times):
+            return values[-1]
+
+        t0, t1 = times[i-1], times[i]
+        return values[i-1] + (values[i] - values[i-1]) * (seconds - t0) / (t1 - t0)
+
+
+
+    def getInputEvents(self, index, start, end):
+        """ Number of a scripted input's events after start and up to end (seconds) """
+
+        return sum(events for seconds, events in self.inputs[index] if start < seconds <= end)
+
+
+
+class SIM_DEVICE(object):
+    """ A simulated Phidget device: opening, attaching and closing it, and the latency of its calls """
+
+    deviceID = 0
+
+    def __init__(self):
+
+        if settings is None:
+            raise ValueError('Simulated Phidgets are not configured (see as_weatherstation.phidget.getBackend())')
+
+        self.serialNumber = None
+        self.attached = False
+        self.attachEvent = threading.Event() # Set once attached and the attach handler has run
+        self.closing = threading.Event()
+        self.thread = None
+
+        self.onAttach = None
+        self.onDetach = None
+        self.onError = None
+
+        self.calls = 0 # Device calls made (each takes the latency)
+
+
+
+    def setOnAttachHandler(self, handler): self.onAttach = handler
+    def setOnDetachHandler(self, handler): self.onDetach = handler
+    def setOnErrorhandler(self, handler): self.onError = handler
+
+
+
+    def openPhidget(self, serialNumber=None):
+        """ Start the device's event thread, which attaches it """
+
+        self.serialNumber = serialNumber
+        self.thread = threading.Thread(target=self.run, name=type(self).__name__)
+        self.thread.daemon = True
+        self.thread.start()
+
+        # Stop the event thread before the interpreter is torn down
+        # underneath it, if the device is never closed
+        atexit.register(self.closePhidget)
+
+
+
+    def openRemote(self, serverID, serialNumber=None, port=5001, password=''):
+        """ Same as openPhidget() (the latency setting stands in for the webservice) """
+
+        self.openPhidget(serialNumber)
+
+
+
+    def closePhidget(self):
+        self.closing.set()
+        if not self.thread is None and self.thread != threading.current_thread():
+            self.thread.join()
+        self.attached = False
+        self.attachEvent.clear()
+
+
+
+    def run(self):
+        """ Event thread """
+
+        self.attach()
+
+
+
+    def attach(self):
+        self.attached = True
+        if self.onAttach: self.onAttach(SIM_EVENT(self))
+        self.attachEvent.set()
+
+
+
+    def detach(self):
+        """ Simulate unplugging the device """
+
+        self.attached = False
+        self.attachEvent.clear()
+        if self.onDetach: self.onDetach(SIM_EVENT(self))
+
+
+
+    def waitForAttach(self, timeout):
+        """ @param timeout int - Milliseconds to wait. 0 = forever. """
+
+        if not self.attachEvent.wait(timeout/1000.0 if timeout else None):
+            raise PhidgetException(PhidgetErrorCodes.EPHIDGET_TIMEOUT)
+
+
+
+    def isAttached(self):
+        return self.attached
+
+
+
+    def getDeviceID(self):
+        return self.deviceID
+
+
+
+    def getSerialNum(self):
+        self.call()
+        return self.serialNumber
+
+
+
+    def call(self, index=None, count=None):
+        """ Take the latency of a device call. Raises a PhidgetException if the device isn't attached or index is out of bounds. """
+
+        self.calls += 1
+        if not self.attached:
+            raise PhidgetException(PhidgetErrorCodes.EPHIDGET_NOTATTACHED)
+        if not index is None and not 0 <= index < count:
+            raise PhidgetException(PhidgetErrorCodes.EPHIDGET_OUTOFBOUNDS)
+        if settings['latency'] > 0:
+            sleep(settings['latency'])
+
+
+
+class SIM_INTERFACEKIT(SIM_DEVICE):
+    """ A simulated InterfaceKit 8/8/8 (the Phidget library's InterfaceKit) """
+
+    sensorCount = 8
+    inputCount = 8
+    sensorChangeTrigger = 10 # The InterfaceKit's default change trigger
+    reversion = 0.01 # Pull of a random sensor value back towards its start each step (keeps the walk near plausible values)
+
+    def __init__(self):
+
+        super(SIM_INTERFACEKIT, self).__init__()
+
+        self.lock = threading.Lock() # Guards self.raw
+        self.random = random.Random(settings['seed'])
+
+        self.start = [(mod_ws_phidget_sensor.SENSOR_RAW_VALUE_MAX + 1) / 2.0] * self.sensorCount
+        self.raw = list(self.start) # Sensor values (0-4095, as floats)
+        self.reported = [None] * self.sensorCount # The last value (0-1000) of each sensor sent in a sensor change event
+        self.triggers = [self.sensorChangeTrigger] * self.sensorCount
+        self.inputs = [False] * self.inputCount
+        self.ratiometric = True
+
+        self.randomInputs = [0] # Inputs with random events
+        self.script = None
+
+        self.onInputChange = None
+        self.onOutputChange = None
+        self.onSensorChange = None
+
+        self.sensorEvents = 0 # Sensor change events sent
+        self.inputEvents = 0 # Input events (pairs of input change events) sent
+
+
+
+    def setOnInputChangeHandler(self, handler): self.onInputChange = handler
+    def setOnOutputChangeHandler(self, handler): self.onOutputChange = handler
+    def setOnSensorChangeHandler(self, handler): self.onSensorChange = handler
+
+
+
+    def openPhidget(self, serialNumber=None):
+        """ Set up the sensors and inputs of the station with this InterfaceKit, then attach it """
+
+        station = getStation(serialNumber)
+        if not station is None:
+            fm = app.fieldMap[mod_ws_app.STYPE_PWS]
+            self.randomInputs = []
+            for mtype in fm:
+                if fm[mtype] is None:
+                    continue
+                index = getattr(station, fm[mtype][1])
+                if fm[mtype][0] == mod_ws_app.PWS_IO_SENSOR and mtype in SENSOR_START:
+                    self.start[index] = self.raw[index] = getSensorRawValue(mtype, SENSOR_START[mtype])
+                elif fm[mtype][0] == mod_ws_app.PWS_IO_INPUT:
+                    self.randomInputs.append(index)
+
+        if settings['script']:
+            self.script = SIM_SCRIPT(settings['script'], station)
+            self.randomInputs = [index for index in self.randomInputs if not index in self.script.inputs]
+
+        super(SIM_INTERFACEKIT, self).openPhidget(serialNumber)
+
+
+
+    def getSensorCount(self): return self.sensorCount
+    def getInputCount(self): return self.inputCount
+
+
+
+    def getSensorValue(self, index):
+        self.call(index, self.sensorCount)
+        return int(round(self.raw[index] / RAW_PER_VALUE))
+
+
+
+    def getSensorRawValue(self, index):
+        self.call(index, self.sensorCount)
+        return int(round(self.raw[index]))
+
+
+
+    def getSensorChangeTrigger(self, index):
+        self.call(index, self.sensorCount)
+        return self.triggers[index]
+
+
+
+    def setSensorChangeTrigger(self, index, value):
+        self.call(index, self.sensorCount)
+        self.triggers[index] = value
+
+
+
+    def getInputState(self, index):
+        self.call(index, self.inputCount)
+        return self.inputs[index]
+
+
+
+    def getRatiometric(self):
+        self.call()
+        return self.ratiometric
+
+
+
+    def setRatiometric(self, state):
+        self.call()
+        self.ratiometric = state
+
+
+
+    def run(self):
+        """ Event thread: attach, then step the sensors and inputs sensorRate times a (simulated) second until closed """
+
+        self.attach()
+
+        step = 1.0 / settings['sensorRate']
+        start = t = clock()
+        nextInput = t + self.getInputInterval()
+        scripted = float('-inf') # Scripted input events are sent up to this many seconds from the start
+        while True:
+            t += step
+            wait = t - clock()
+            if wait > 0 and self.closing.wait(wait / settings['timeScale']):
+                break
+            if self.closing.is_set():
+                break
+
+            self.stepSensors(t - start)
+
+            for index in self.randomInputs:
+                while nextInput <= t:
+                    self.sendInputEvent(index)
+                    nextInput += self.getInputInterval()
+            if not self.script is None:
+                for index in self.script.inputs:
+                    for n in xrange(self.script.getInputEvents(index, scripted, t - start)):
+                        self.sendInputEvent(index)
+                scripted = t - start
+
+
+
+    def getInputInterval(self):
+        """ Simulated seconds until the next random input event """
+
+        if settings['inputRate'] <= 0:
+            return float('inf')
+        return self.random.expovariate(settings['inputRate'] / 3600.0)
+
+
+
+    def stepSensors(self, seconds):
+        """ Move the sensors on one step, and send sensor change events for those that moved by their trigger """
+
+        stepRaw = settings['sensorStep'] * RAW_PER_VALUE
+        changes = []
+        with self.lock:
+            for index in xrange(self.sensorCount):
+                if not self.script is None and index in self.script.sensors:
+                    raw = self.script.getSensorRawValue(index, seconds)
+                else:
+                    raw = self.raw[index]
+                    raw += self.random.uniform(-stepRaw, stepRaw) - (raw - self.start[index]) * self.reversion
+                self.raw[index] = min(mod_ws_phidget_sensor.SENSOR_RAW_VALUE_MAX, max(0, raw))
+
+                value = int(round(self.raw[index] / RAW_PER_VALUE))
+                if self.reported[index] is None or abs(value - self.reported[index]) >= self.triggers[index]:
+                    self.reported[index] = value
+                    changes.append((index, value))
+
+        for index, value in changes:
+            self.sensorEvents += 1
+            if self.onSensorChange: self.onSensorChange(SIM_EVENT(self, index, value=value))
+
+
+
+    def sendInputEvent(self, index):
+        """ Pulse an input (e.g., a rain gauge tip): on, then off """
+
+        self.inputEvents += 1
+        for state in (True, False):
+            self.inputs[index] = state
+            if self.onInputChange: self.onInputChange(SIM_EVENT(self, index, state=state))
+
+
+
+class SIM_TEXTLCD(SIM_DEVICE):
+    """ A simulated 2x20 TextLCD (the Phidget library's TextLCD), displaying to an in-memory framebuffer """
+
+    rowCount = 2
+    columnCount = 20
+
+    def __init__(self):
+
+        super(SIM_TEXTLCD, self).__init__()
+
+        self.lock = threading.Lock() # Guards self.framebuffer
+        self.framebuffer = [''] * self.rowCount
+        self.customCharacters = {}
+        self.cursorBlink = False
+        self.cursorOn = False
+        self.backlight = True
+        self.contrast = 0
+
+        self.updates = 0 # setDisplayString() calls
+
+
+
+    def getRowCount(self):
+        self.call()
+        return self.rowCount
+
+
+
+    def getColumnCount(self):
+        self.call()
+        return self.columnCount
+
+
+
+    def setDisplayString(self, index, text):
+        self.call(index, self.rowCount)
+        with self.lock:
+            self.framebuffer[index] = text[:self.columnCount]
+            self.updates += 1
+
+
+
+    def getFramebuffer(self):
+        """ The displayed rows (a copy) """
+
+        with self.lock:
+            return list(self.framebuffer)
+
+
+
+    def setCustomCharacter(self, index, part1, part2):
+        self.call()
+        self.customCharacters[index] = (part1, part2)
+
+
+
+    def getCustomCharacter(self, index):
+        """ The character code that displays a custom character """
+
+        return chr(0x08 + index)
+
+
+
+    def setCursorBlink(self, state):
+        self.call()
+        self.cursorBlink = state
+
+
+
+    def setCursorOn(self, state):
+        self.call()
+        self.cursorOn = state
+
+
+
+    def setBacklight(self, state):
+        self.call()
+        self.backlight = state
+
+
+
+    def setContrast(self, value):
+        self.call()
+        self.contrast = value
+
+
+
+class PHIDGET_IFK(object):
+    """ Simulated Phidget InterfaceKit (see lphidget.PHIDGET_IFK) """
+    def __init__(self, serialNumber=None, waitForAttach=1000, **kargs):
+
+        self.interfaceKit = SIM_INTERFACEKIT()
+
+        self.ratiometric = 1
+        if 'ratiometric' in kargs:
+            self.ratiometric = kargs['ratiometric']
+
+        # {sensor index: change trigger} set when the InterfaceKit attaches
+        self.sensorChangeTriggers = {}
+        if 'sensorChangeTriggers' in kargs:
+            self.sensorChangeTriggers = kargs['sensorChangeTriggers']
+
+        h = [
+            'onAttachHandler',
+            'onDetachHandler',
+            'onErrorhandler',
+            'onInputChangeHandler',
+            'onOutputChangeHandler',
+            'onSensorChangeHandler'
+            ]
+
+        for event in h:
+            self.__dict__[event] = None
+            if event in kargs:
+                self.__dict__[event] = kargs[event]
+
+        # The handlers are set before the (instant) attach
+        self.interfaceKit.setOnAttachHandler(self.attached)
+        self.interfaceKit.setOnDetachHandler(self.detached)
+        self.interfaceKit.setOnErrorhandler(self.error)
+        self.interfaceKit.setOnInputChangeHandler(self.inputChanged)
+        self.interfaceKit.setOnOutputChangeHandler(self.outputChanged)
+        self.interfaceKit.setOnSensorChangeHandler(self.sensorChanged)
+
+        if 'remoteHost' in kargs:
+            self.interfaceKit.openRemote(kargs['remoteHost'], serialNumber)
+        else:
+            self.interfaceKit.openPhidget(serialNumber)
+
+        if waitForAttach > 0:
+            try:
+                self.interfaceKit.waitForAttach(waitForAttach)
+            except PhidgetException as e:
+                self.interfaceKit.closePhidget()
+                raise e
+
+
+
+    def attached(self, e):
+        self.interfaceKit.setRatiometric(self.ratiometric)
+        for index in self.sensorChangeTriggers:
+            self.interfaceKit.setSensorChangeTrigger(index, self.sensorChangeTriggers[index])
+        if self.onAttachHandler: self.onAttachHandler(e)
+
+    def detached(self, e):
+        if self.onDetachHandler: self.onDetachHandler(e)
+
+    def error(self, e):
+        error = {'code': e.eCode, 'description': e.description}
+        if self.onErrorhandler: self.onErrorhandler(error, e)
+
+    def outputChanged(self, e):
+        if self.onInputChangeHandler: self.onInputChangeHandler(e.index, e.state, e)
+
+    def inputChanged(self, e):
+        if self.onInputChangeHandler: self.onInputChangeHandler(e.index, e.state, e)
+
+    def sensorChanged(self, e):
+        if self.onSensorChangeHandler: self.onSensorChangeHandler(e.index, e.value, e)
+
+
+
+
+class PHIDGET_TEXTLCD(object):
+    """ Simulated Phidget TextLCD (see lphidget.PHIDGET_TEXTLCD) """
+    def __init__(self, serialNumber=None, waitForAttach=1000, **kargs):
+
+        self.textLCD = SIM_TEXTLCD()
+
+        h = [
+            'onAttachHandler',
+            'onDetachHandler',
+            'onErrorhandler'
+            ]
+
+        for event in h:
+            self.__dict__[event] = None
+            if event in kargs:
+                self.__dict__[event] = kargs[event]
+
+        self.textLCD.setOnAttachHandler(self.attached)
+        self.textLCD.setOnDetachHandler(self.detached)
+
+        if 'remoteHost' in kargs:
+            self.textLCD.openRemote(kargs['remoteHost'], serialNumber)
+        else:
+            self.textLCD.openPhidget(serialNumber)
+
+        if waitForAttach > 0:
+            try:
+                self.textLCD.waitForAttach(waitForAttach)
+            except PhidgetException as e:
+                self.textLCD.closePhidget()
+                raise e
+
+
+    def attached(self, e):
+        if self.onAttachHandler: self.onAttachHandler(e)
+
+    def detached(self, e):
+        if self.onDetachHandler: self.onDetachHandler(e)
+
+    def error(self, e):
+        error = {'code': e.eCode, 'description': e.description}
+        if self.onErrorhandler: self.onErrorhandler(error, e)
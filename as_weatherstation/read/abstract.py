@@ -1,5 +1,225 @@
+import math
+import threading
+
 import as_weatherstation.app as mod_ws_app
 
+
+# How the values of a measurement type are aggregated (see AS_WS_READER.aggregateRule)
+AGGREGATE_MEAN = 'mean' # The average, e.g. of sensor polls
+AGGREGATE_SUM = 'sum' # The total, e.g. of digital input events (rain gauge tips)
+
+# How logged statistics (see mod_ws_app.STAT_*) are aggregated again, e.g.
+# when log rows are aggregated. The others are averaged.
+STAT_REAGGREGATE = {
+	mod_ws_app.STAT_MIN: mod_ws_app.STAT_MIN,
+	mod_ws_app.STAT_MAX: mod_ws_app.STAT_MAX,
+	mod_ws_app.STAT_LAST: mod_ws_app.STAT_LAST
+	}
+
+
+
+class AS_WS_AGGREGATE_STATS(object):
+	"""
+	Running statistics of one measurement type.
+
+	count/sum/min/max/last, and the variance (by Welford's method), are
+	updated as each value is added. The values themselves are only kept
+	if keepValues is set, for the median.
+	"""
+
+	__slots__ = ('count', 'total', 'min', 'max', 'last', 'mean', 'm2', 'values')
+
+	def __init__(self, value, keepValues=False):
+		self.count = 1
+		self.total = value
+		self.min = value
+		self.max = value
+		self.last = value
+		self.mean = float(value)
+		self.m2 = 0.0
+		self.values = [value] if keepValues else None
+
+
+
+	def add(self, value):
+		self.count += 1
+		self.total += value
+		if value < self.min:
+			self.min = value
+		elif value > self.max:
+			self.max = value
+		self.last = value
+
+		delta = value - self.mean
+		self.mean += delta/self.count
+		self.m2 += delta*(value - self.mean)
+
+		if not self.values is None:
+			self.values.append(value)
+
+
+
+	def get(self, stat):
+		""" Get a statistic: AGGREGATE_MEAN, AGGREGATE_SUM, or one of mod_ws_app.STAT_* """
+
+		if stat == AGGREGATE_MEAN:
+			return self.total/self.count
+		elif stat == AGGREGATE_SUM:
+			return self.total
+		elif stat == mod_ws_app.STAT_MIN:
+			return self.min
+		elif stat == mod_ws_app.STAT_MAX:
+			return self.max
+		elif stat == mod_ws_app.STAT_LAST:
+			return self.last
+		elif stat == mod_ws_app.STAT_STDDEV:
+			return math.sqrt(self.m2/self.count)
+		elif stat == mod_ws_app.STAT_MEDIAN:
+			if self.values is None:
+				raise ValueError('The median needs the values kept (keepValues)')
+			values = sorted(self.values)
+			middle = self.count // 2
+			if self.count % 2:
+				return values[middle]
+			return (values[middle - 1] + values[middle])/2.0
+		else:
+			raise ValueError('Unknown statistic %s' % str(stat))
+
+
+
+class AS_WS_AGGREGATOR(object):
+	"""
+	Incremental aggregate of samples.
+
+	Samples are folded into running stats (AS_WS_AGGREGATE_STATS) per
+	measurement type as they are added, in a single pass, so no samples
+	are kept (nor values, except of the types in keepValues). swap() hands
+	the stats gathered so far over to a new aggregator and starts this one
+	over, in O(1) however many samples were added.
+
+	add() and swap() may be called from different threads.
+	"""
+
+	def __init__(self, keepValues=()):
+		"""
+		@param keepValues list optional - Measurement types whose values are kept (for their median).
+		"""
+		self.lock = threading.Lock()
+		self.keepValues = frozenset(keepValues)
+		self.stats = {} # {mtype: AS_WS_AGGREGATE_STATS}
+		self.count = 0 # Samples added
+		self.dateTime = None # Time of the last sample added
+
+
+
+	def __len__(self):
+		return self.count
+
+
+
+	def add(self, sample):
+		""" Add the values of a sample (AS_WS_SAMPLE) """
+
+		with self.lock:
+			stats = self.stats
+			for mtype, value in sample.iterValues():
+				s = stats.get(mtype)
+				if s is None:
+					stats[mtype] = AS_WS_AGGREGATE_STATS(value, mtype in self.keepValues)
+				else:
+					s.add(value)
+			self.count += 1
+			# Keep only the last time (this assumes the samples are added in order, which they should be)
+			self.dateTime = sample.dateTime
+
+
+
+	def addValue(self, mtype, value):
+		""" Add a single value of a measurement, e.g. a digital input event (it is not counted as a sample) """
+
+		with self.lock:
+			s = self.stats.get(mtype)
+			if s is None:
+				self.stats[mtype] = AS_WS_AGGREGATE_STATS(value, mtype in self.keepValues)
+			else:
+				s.add(value)
+
+
+
+	def swap(self):
+		""" Move everything added so far to a new aggregator (which is returned), leaving this one empty """
+
+		aggregator = AS_WS_AGGREGATOR(self.keepValues)
+		with self.lock:
+			aggregator.stats, self.stats = self.stats, aggregator.stats
+			aggregator.count, self.count = self.count, 0
+			aggregator.dateTime, self.dateTime = self.dateTime, None
+		return aggregator
+
+
+
+class AS_WS_DECIMATOR_BOXCAR(object):
+	""" Streaming boxcar (moving average) decimator: reduces a run of values to their mean in O(1) memory """
+
+	def __init__(self, size):
+		"""
+		@param size int - Most values added between resets.
+		"""
+		self.size = size
+		self.reset()
+
+
+
+	def reset(self):
+		self.count = 0
+		self.total = 0.0
+
+
+
+	def add(self, value):
+		self.count += 1
+		self.total += value
+
+
+
+	def value(self):
+		""" The decimated value, or None if nothing was added """
+		if not self.count:
+			return None
+		return self.total/self.count
+
+
+
+class AS_WS_DECIMATOR_MEDIAN(AS_WS_DECIMATOR_BOXCAR):
+	""" Streaming median decimator: reduces a run of values to their median, in a buffer allocated once """
+
+	def __init__(self, size):
+		from array import array
+
+		self.values = array('d', [0.0]) * size
+		super(AS_WS_DECIMATOR_MEDIAN, self).__init__(size)
+
+
+
+	def add(self, value):
+		# Values past size are dropped rather than growing the buffer
+		if self.count < self.size:
+			self.values[self.count] = value
+			self.count += 1
+
+
+
+	def value(self):
+		if not self.count:
+			return None
+		values = sorted(self.values[:self.count])
+		middle = self.count // 2
+		if self.count % 2:
+			return values[middle]
+		return (values[middle - 1] + values[middle])/2.0
+
+
+
 class AS_WS_READER(object):
 	""" Abstract reader class """
 
@@ -7,6 +227,12 @@ class AS_WS_READER(object):
 		self.app = wsApp
 		self.samples = []
 		self.rawDdata = None
+		# Extra statistics of each measurement type (see [aggregate] in app-explain.cfg)
+		self.aggregateSpec = getattr(wsApp, 'aggregateSpec', {})
+
+		# Readers that sample continuously (e.g., the PWS) add their
+		# samples here, see flushAggregate()
+		self.aggregator = self.createAggregator()
 
 
 
@@ -28,55 +254,128 @@ class AS_WS_READER(object):
 	def flushSamples(self):
 		""" Empty and return the samples list """
 
-		s = []
-
-		# At the end of this while loop self.samples will be empty.
-		# However, in a threaded or event driven environment
-		# it may not be empty when the return happens. The only way
-		# to prevent this is to stop all threads and remove
-		# all event listeners prior to calling flushSamples()
-		while len(self.samples) > 0:
-			s.append(self.samples.pop(0))
+		# The list is swapped for a new one rather than emptied, so a
+		# sample appended meanwhile (e.g., by an event handler) ends up
+		# in either the returned list or the new one, never lost.
+		s, self.samples = self.samples, []
 
 		return s
 
 
 
+	def createAggregator(self):
+		""" Get an empty AS_WS_AGGREGATOR that keeps what the aggregate spec needs """
+
+		return AS_WS_AGGREGATOR([mtype for mtype in self.aggregateSpec if mod_ws_app.STAT_MEDIAN in self.aggregateSpec[mtype]])
+
+
+
+	def flushAggregate(self):
+		""" Aggregate the samples added to self.aggregator since the last flush down to a single sample, and start over """
+
+		return self.aggregateStats(self.aggregator.swap())
+
+
+
 	def aggregateSamples(self, samples = None):
 		""" Aggregate the values of a sample list down to a single sample """
 
 		if samples == None:
 			samples = self.samples
 
-		measurements = {}
+		aggregator = self.createAggregator()
 		for sample in samples:
-			sampleTime = sample.dateTime # keep only the last time (this assumes the samples are in order, which they should be)
-			for mtype in sample.measurements:
-				if not mtype in measurements:
-					measurements[mtype] = []
-				measurements[mtype].append(sample.measurements[mtype].value)
-
-
-		aSample = mod_ws_app.AS_WS_SAMPLE(sampleTime)
-		for mtype in measurements:
-
-			value = self.aggregateMeasurements(mtype, measurements[mtype])
-			"""
-			total = sum(measurements[mtype])
-			count = len(measurements[mtype])
-			average = total/count
-			print "%d: %f / %d = %f | %f" % (mtype, total, count, average, value)
-			"""
-			measure = mod_ws_app.AS_WS_SAMPLE.createMeasurement(mtype, value)
-			aSample.setMeasurement(measure)
+			aggregator.add(sample)
+
+		return self.aggregateStats(aggregator)
+
+
+
+	def aggregateStats(self, aggregator):
+		"""
+		Aggregate the stats of an AS_WS_AGGREGATOR down to a single sample.
+
+		Each measurement gets its mean (or sum, see aggregateRule()), and
+		the extra statistics of the aggregate spec.
+		"""
+
+		if not len(aggregator):
+			return []
+
+		aSample = mod_ws_app.AS_WS_SAMPLE(aggregator.dateTime)
+		for mtype, stats in aggregator.stats.items():
+			if mod_ws_app.isStatField(mtype):
+				# A statistic that was logged (e.g., aggregating log rows)
+				aSample.setValue(mtype, stats.get(STAT_REAGGREGATE.get(mtype[1], AGGREGATE_MEAN)))
+			elif self.aggregateRule(mtype) == AGGREGATE_SUM:
+				aSample.setValue(mtype, stats.total)
+			else:
+				aSample.setValue(mtype, stats.total/stats.count)
+
+		for mtype in self.aggregateSpec:
+			stats = aggregator.stats.get(mtype)
+			if stats is None:
+				continue
+			for stat in self.aggregateSpec[mtype]:
+				field = mod_ws_app.getStatField(mtype, stat)
+				if not field in aggregator.stats:
+					aSample.setValue(field, stats.get(stat))
 
 		return [aSample]
 
 
 
-	def aggregateMeasurements(self, mtype, measurements):
+	def aggregateColumns(self, columns):
 		"""
-		The default aggregate method calculates the average for a given measurement.
-		Child classes can override this method to provie other functionality.
+		Aggregate a columnar batch (AS_WS_SAMPLE_COLUMNS) down to a single sample.
+
+		The columns are handed to aggregateMeasurements() as they are, so
+		no per-row sample objects are built. Logged statistics are
+		aggregated again as in aggregateStats() (see STAT_REAGGREGATE).
 		"""
+
+		import time
+
+		if not len(columns):
+			return []
+
+		aSample = mod_ws_app.AS_WS_SAMPLE(time.localtime(columns.times[-1]))
+		for mtype in columns.mtypes:
+			column = columns.columns[mtype]
+			if mod_ws_app.isStatField(mtype):
+				# Rows logged without the statistic have NaN (see appendRow())
+				column = [v for v in column if v == v]
+				if not column:
+					continue
+				stat = STAT_REAGGREGATE.get(mtype[1])
+				if stat == mod_ws_app.STAT_MIN:
+					aSample.setValue(mtype, min(column))
+				elif stat == mod_ws_app.STAT_MAX:
+					aSample.setValue(mtype, max(column))
+				elif stat == mod_ws_app.STAT_LAST:
+					aSample.setValue(mtype, column[-1])
+				else:
+					aSample.setValue(mtype, sum(column)/len(column))
+			else:
+				aSample.setValue(mtype, self.aggregateMeasurements(mtype, column))
+
+		return [aSample]
+
+
+
+	def aggregateMeasurements(self, mtype, measurements):
+		""" Aggregate a list of values of a given measurement, following aggregateRule() """
+
+		if self.aggregateRule(mtype) == AGGREGATE_SUM:
+			return sum(measurements)
 		return sum(measurements)/len(measurements)
+
+
+
+	def aggregateRule(self, mtype):
+		"""
+		How a given measurement is aggregated: AGGREGATE_MEAN or AGGREGATE_SUM.
+		The default is the average. Child classes can override this method to
+		provide other rules.
+		"""
+		return AGGREGATE_MEAN
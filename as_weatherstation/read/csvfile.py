@@ -5,6 +5,8 @@ import as_weatherstation.read.abstract as mod_ws_read_abstract
 class AS_WS_READER_CSVFILE(mod_ws_read_abstract.AS_WS_READER):
     """ CSV file reader """
 
+    tailIndexLines = 60 # Minimum number of lines kept in gzip tail indexes.
+
     def __init__(self, wsApp):
 
         super(AS_WS_READER_CSVFILE, self).__init__(wsApp)
@@ -32,19 +34,55 @@ class AS_WS_READER_CSVFILE(mod_ws_read_abstract.AS_WS_READER):
     def _readCSV(self, aFile):
         """ Read a csv file into a multi-dimensional list """
 
-        import csv, gzip
+        return list(self.iterSamples(aFile))
 
-        samples = []
-        if self.isGZipped(aFile):
-            func = gzip.open
-        else:
-            func = open
-        with func(aFile, 'rb') as f:
+
+
+    def iterSamples(self, aFile, chunkSize=0):
+        """
+        Lazily read a (possibly gzipped) csv file.
+
+        Rows are parsed as the file is read (and decompressed), so memory
+        use does not grow with the size of the file and callers can start
+        writing before the last row has been read.
+
+        @param aFile string - Path to the file.
+        @param chunkSize int optional - If zero, yield parsed rows one at a time.
+            Otherwise, yield lists of up to chunkSize parsed rows.
+        """
+
+        import csv
+
+        batch = []
+        with self.openFile(aFile) as f:
             csvData = csv.reader(f, delimiter=",")
             for row in csvData:
-                samples.append(self.parseCSVLine(row)) 
+                if not row:
+                    continue
+                if not chunkSize:
+                    for sample in self.parseCSVLines(row):
+                        yield sample
+                    continue
+                batch.extend(self.parseCSVLines(row))
+                if len(batch) >= chunkSize:
+                    yield batch
+                    batch = []
+
+        if batch:
+            yield batch
+
+
+
+    def openFile(self, aFile):
+        """ Open a (possibly gzipped) csv file for reading """
+
+        import gzip
+
+        if self.isGZipped(aFile):
+            return gzip.open(aFile, 'rb')
+        else:
+            return open(aFile, 'rb')
 
-        return samples
 
 
     def isGZipped(self, aFile):
@@ -57,21 +95,12 @@ class AS_WS_READER_CSVFILE(mod_ws_read_abstract.AS_WS_READER):
 
 
     def _readCSVLines(self, aFile, lines):
+        """ Read the last few rows of a csv file without reading the whole file """
 
-        import subprocess
-
-        # The shell command to get the recent history from the file
         if self.isGZipped(aFile):
-            getLatestLogs = 'gzip -dck "%s" | tail -n%d' % (aFile, lines)
+            l = self._tailGZip(aFile, lines)
         else:
-            getLatestLogs = 'tail -n%d "%s"' % (lines, aFile)
-
-        # Spawn a command line process, and obtain the output
-        getLatestLogsProc = subprocess.Popen(getLatestLogs, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-
-        l = [line.strip() for line in getLatestLogsProc.stdout]
-
-        #print l;
+            l = self._tail(aFile, lines)
 
         samples = []
         if len(l) == 0:
@@ -80,13 +109,108 @@ class AS_WS_READER_CSVFILE(mod_ws_read_abstract.AS_WS_READER):
         import csv
         csvData = csv.reader(l, delimiter=",")
         for row in csvData:
-            samples.append(self.parseCSVLine(row)) 
+            samples.extend(self.parseCSVLines(row))
 
         return samples
 
 
 
+    def _tail(self, aFile, lines, blockSize=4096):
+        """
+        Get the last lines of a plain text file.
+
+        Blocks are read backwards from the end of the file until enough
+        line breaks have been seen, so the cost depends on the number of
+        lines wanted rather than on the size of the file.
+        """
+
+        import os
+
+        with open(aFile, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            data = ''
+            # The last line is usually terminated, so we need one more
+            # line break than lines (anything before the first break
+            # may be a partial line).
+            while pos > 0 and data.count('\n') <= lines:
+                step = min(blockSize, pos)
+                pos -= step
+                f.seek(pos)
+                data = f.read(step) + data
+
+        l = data.splitlines()
+        if pos > 0:
+            l = l[1:]
+
+        return [line.strip() for line in l if line.strip()][-lines:]
+
+
+
+    def _tailGZip(self, aFile, lines):
+        """
+        Get the last lines of a gzipped text file.
+
+        A gzip stream can't be read backwards, so the tail is decompressed
+        once and saved in a sidecar index next to the file
+        (".[file name].tail" -- hidden so it is never mistaken for a log
+        file). The index records the size and modification time of the
+        file it was built from. It is rebuilt if those change or if more
+        lines are wanted than it holds. Otherwise the cost of reading it
+        does not depend on the size of the gzipped file. The index is moved
+        along with the file when it is archived (see AS_WS_APP.moveFile()).
+        """
+
+        import os
+        from collections import deque
+
+        stat = os.stat(aFile)
+        key = '%d %d' % (stat.st_size, int(stat.st_mtime))
+        index = self.app.getTailIndexFile(aFile)
+
+        try:
+            with open(index, 'rb') as f:
+                header = f.readline().split()
+                # header: size mtime lines complete
+                if ' '.join(header[:2]) == key and (int(header[3]) or int(header[2]) >= lines):
+                    return [line.rstrip('\r\n') for line in f][-lines:]
+        except (IOError, IndexError, ValueError):
+            pass
+
+        # Keep a few more lines than asked for, so slightly bigger
+        # requests don't force a rebuild.
+        keep = max(lines, self.tailIndexLines)
+        l = deque(maxlen=keep)
+        with self.openFile(aFile) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    l.append(line)
+
+        try:
+            tmp = '%s.%d' % (index, os.getpid())
+            with open(tmp, 'wb') as f:
+                # If the whole file fit in the index, any request can be served from it
+                f.write('%s %d %d\n' % (key, len(l), int(len(l) < keep)))
+                for line in l:
+                    f.write(line + '\n')
+            os.rename(tmp, index)
+        except (IOError, OSError):
+            # A read-only folder just means we can't cache the tail
+            pass
+
+        return list(l)[-lines:]
+
+
+
     def parseCSVLine(self, line):
     
         return line
 
+
+
+    def parseCSVLines(self, line):
+        """ Parse a csv line into a list of rows (one, unless a child class's lines can stand for several) """
+
+        return [self.parseCSVLine(line)]
+
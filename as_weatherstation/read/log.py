@@ -1,5 +1,8 @@
 import as_weatherstation.app as mod_ws_app
+import as_weatherstation.read.abstract as mod_ws_read_abstract
 import as_weatherstation.read.csvfile as mod_ws_read_csvfile
+import as_weatherstation.log.weather as mod_ws_log_weather
+import as_weatherstation.timecodec as mod_ws_timecodec
 
 
 class AS_WS_READER_LOG(mod_ws_read_csvfile.AS_WS_READER_CSVFILE):
@@ -39,6 +42,11 @@ class AS_WS_READER_LOG(mod_ws_read_csvfile.AS_WS_READER_CSVFILE):
                 self.inputs[field] = getattr(self.station, fm[field][1])
         """
 
+        # Digital inputs (e.g., rain gauge tips) are logged as the sum
+        # of events during the log interval, so they stay additive
+        # when rows are aggregated.
+        fm = self.app.fieldMap[mod_ws_app.STYPE_PWS]
+        self.inputs = [field for field in fm if fm[field] is not None and fm[field][0] == mod_ws_app.PWS_IO_INPUT]
 
 
 
@@ -56,28 +64,144 @@ class AS_WS_READER_LOG(mod_ws_read_csvfile.AS_WS_READER_CSVFILE):
     def parseCSVLine(self, line):
         """ Override the parent's method  """
     
-        from time import strptime
-
         fm = self.app.fieldMap['log']
 
-        sample = mod_ws_app.AS_WS_SAMPLE(strptime(line[0], "%Y-%m-%d %H:%M:%S"))
-        for i in range(1, len(line)):
-            mtype = fm[i-1]
-            measurement = mod_ws_app.AS_WS_SAMPLE.createMeasurement(mtype, line[i])
-            sample.setMeasurement(measurement)
+        sample = mod_ws_app.AS_WS_SAMPLE(mod_ws_timecodec.parseTime(line[0]))
+        # Extra values (statistics no longer in [aggregate]) are ignored
+        for i in range(1, min(len(line), len(fm) + 1)):
+            sample.setValue(fm[i-1], line[i])
 
         return sample
 
 
 
-    def aggregateMeasurements(self, mtype, measurements):
+    def parseCSVLines(self, line):
+        """ Override the parent's method: a held row is expanded to the rows it stands for (see mod_ws_log_weather.HOLD_MARKER) """
+
+        hold = mod_ws_log_weather.parseHoldMarker(line[-1])
+        if hold is None:
+            return [self.parseCSVLine(line)]
+
+        count, interval = hold
+        epoch = mod_ws_timecodec.parseEpoch(line[0])
+        line = line[:-1]
+
+        samples = []
+        for n in xrange(count - 1, -1, -1):
+            line[0] = mod_ws_timecodec.formatEpoch(epoch - n*interval)
+            samples.append(self.parseCSVLine(line))
+
+        return samples
+
+
+
+    def iterSamples(self, log=None, chunkSize=0, columnar=False, offset=0):
+        """
+        Lazily read the station log file (see AS_WS_READER_CSVFILE.iterSamples).
+
+        @param log string optional - Path to the (possibly gzipped) log file.
+            Defaults to the station's current log file.
+        @param chunkSize int optional - Rows per yielded batch. If zero, samples
+            are yielded one at a time (or, if columnar, the whole file is
+            yielded as one batch).
+        @param columnar bool optional - If True, batches are AS_WS_SAMPLE_COLUMNS
+            rather than lists of AS_WS_SAMPLE objects. Each batch's offset
+            is the byte offset just past its last row (in the uncompressed
+            data), so a later call can resume after it.
+        @param offset int optional - Byte offset to start reading at (columnar only).
+            Must be the start of a line, e.g., the offset of an earlier batch.
+        """
+
+        if log is None:
+            log = self.station.logFile
+
+        if columnar:
+            return self._iterColumns(log, chunkSize, offset)
+        else:
+            return super(AS_WS_READER_LOG, self).iterSamples(log, chunkSize)
+
+
+
+    def readColumns(self, log=None):
+        """
+        Read the station log file straight into a columnar batch.
+
+        Unlike read(), no AS_WS_SAMPLE or measurement objects are created.
+        Each row becomes an epoch-seconds value plus one float per
+        entry in fieldMap['log'].
+
+        @param log string optional - Path to the (possibly gzipped) log file.
+            Defaults to the station's current log file.
+
+        @return AS_WS_SAMPLE_COLUMNS
+        """
+
+        for columns in self.iterSamples(log, 0, columnar=True):
+            return columns
+
+        return mod_ws_app.AS_WS_SAMPLE_COLUMNS(self.app.fieldMap['log'])
+
+
+
+    def _iterColumns(self, log, chunkSize, offset=0):
+        """
+        Generator behind iterSamples(columnar=True).
+
+        Log rows are plain comma separated numbers (nothing is quoted), so
+        lines are split directly. Reading with readline() rather than
+        iterating over the file keeps track of the byte offset (file
+        iteration reads ahead, so tell() is no use). Held rows are expanded
+        whole, so a batch never ends part way through one.
+        """
+
+        fm = self.app.fieldMap['log']
+        parseEpoch = mod_ws_timecodec.parseEpoch
+        parseHoldMarker = mod_ws_log_weather.parseHoldMarker
+
+        columns = mod_ws_app.AS_WS_SAMPLE_COLUMNS(fm)
+        with self.openFile(log) as f:
+            if offset:
+                f.seek(offset)
+            pos = offset
+            readline = f.readline
+            while True:
+                line = readline()
+                if not line:
+                    break
+                pos += len(line)
+                line = line.strip()
+                if not line:
+                    continue
+                values = line.split(',')
+                hold = parseHoldMarker(values[-1])
+                if hold is None:
+                    columns.appendRow(parseEpoch(values[0]), [float(v) for v in values[1:]])
+                else:
+                    # A held row: the same values every interval seconds
+                    count, interval = hold
+                    epoch = parseEpoch(values[0])
+                    row = [float(v) for v in values[1:-1]]
+                    for n in xrange(count - 1, -1, -1):
+                        columns.appendRow(epoch - n*interval, row)
+                if chunkSize and len(columns) >= chunkSize:
+                    columns.offset = pos
+                    yield columns
+                    columns = mod_ws_app.AS_WS_SAMPLE_COLUMNS(fm)
+
+        if len(columns):
+            columns.offset = pos
+            yield columns
+
+
+
+    def aggregateRule(self, mtype):
 
         # For digital inputs the aggregate is the sum of the value sampled
         # (that is, the events are additive).
         if mtype in self.inputs:
-            return sum(measurements)
+            return mod_ws_read_abstract.AGGREGATE_SUM
         else:
-            return super(AS_WS_READER_PWS, self).aggregateMeasurements(mtype, measurements)
+            return super(AS_WS_READER_LOG, self).aggregateRule(mtype)
 
 
 
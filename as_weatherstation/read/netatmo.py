@@ -106,8 +106,7 @@ class AS_WS_READER_NETATMO(mod_ws_read_abstract.AS_WS_READER):
                 # Netatmo API returns a value of None.
                 if value == None: value = 0
                 #print "%s %d %s %f" % (str(stype), int(field), str(fm[stype][field]), float(value))
-                measure = mod_ws_app.AS_WS_SAMPLE.createMeasurement(field, value)
-                sample.setMeasurement(measure)
+                sample.setValue(field, value)
             self.samples.append(sample)
 
         return self.samples
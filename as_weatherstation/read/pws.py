@@ -1,17 +1,33 @@
 import as_weatherstation.app as mod_ws_app
+import as_weatherstation.controller.abstract as mod_ws_controller_abstract
 import as_weatherstation.read.abstract as mod_ws_read_abstract
+import as_weatherstation.ringbuffer as mod_ws_ringbuffer
 
-#Phidget specific imports
-from Phidgets.PhidgetException import PhidgetErrorCodes, PhidgetException
-from Phidgets.Events.Events import AttachEventArgs, DetachEventArgs, ErrorEventArgs, InputChangeEventArgs, OutputChangeEventArgs, SensorChangeEventArgs
-from Phidgets.Devices.InterfaceKit import InterfaceKit
+import as_weatherstation.phidget as mod_ws_phidget
+from as_weatherstation.phidget import sensor as mod_ws_phidget_sensor
 
-from as_weatherstation.phidget import lphidget as mod_lphidget
+
+# How sensor values are captured (see the station's sensorCapture option)
+SENSOR_CAPTURE_POLL = 'poll' # read() asks the InterfaceKit for each sensor's value
+SENSOR_CAPTURE_EVENT = 'event' # Sensor change events update self.latest, which read() samples
+
+SENSOR_CAPTURES = (SENSOR_CAPTURE_POLL, SENSOR_CAPTURE_EVENT)
+
+# How a burst of sensor reads is reduced to a sample (see the station's burstFilter option)
+BURST_FILTERS = {
+	'boxcar': mod_ws_read_abstract.AS_WS_DECIMATOR_BOXCAR, # The mean of the burst
+	'median': mod_ws_read_abstract.AS_WS_DECIMATOR_MEDIAN # The median of the burst (ignores spikes)
+	}
 
 
 class AS_WS_READER_PWS(mod_ws_read_abstract.AS_WS_READER):
 	""" Phidget Weather Station reader """
 
+	eventBufferSize = 1024 # Input events (e.g., rain gauge tips) buffered between flushes. More are dropped (and counted in self.events.overflows).
+	sensorChangeTrigger = 10 # Default change (in 0-1000 sensor units) that fires a sensor change event with SENSOR_CAPTURE_EVENT.
+	burstDuration = 1.0 # Default seconds a burst of reads lasts (see the station's burstRate option).
+	burstFilter = 'boxcar' # Default decimation filter of a burst, one of BURST_FILTERS.
+
 	def __init__(self, wsApp, sLabel=None, onInputChangeHandler=None):
 
 		super(AS_WS_READER_PWS, self).__init__(wsApp)
@@ -32,6 +48,11 @@ class AS_WS_READER_PWS(mod_ws_read_abstract.AS_WS_READER):
 			
 		self.station = self.app.stations[sLabel]
 
+		# The Phidget library, or simulated devices (which may run faster
+		# than real time)
+		self.phidget = mod_ws_phidget.getBackend(self.app)
+		self.timeScale = mod_ws_phidget.getTimeScale(self.app)
+
 
 		# Figure out which sensor and inputs to read from
 		fm = self.app.fieldMap[mod_ws_app.STYPE_PWS]
@@ -46,50 +67,194 @@ class AS_WS_READER_PWS(mod_ws_read_abstract.AS_WS_READER):
 				self.inputs[field] = getattr(self.station, fm[field][1])
 
 
+		# Conversion tables of the sensors, calibrated with the station's
+		# sensor offsets (e.g., sensorTempOffset)
+		self.sensorTables = {}
+		for field in self.sensors:
+			offset = getattr(self.station, fm[field][1] + 'Offset', None) or 0
+			self.sensorTables[field] = mod_ws_phidget_sensor.AS_WS_SENSOR_TABLE(field, offset)
+
+
+		# Input events arrive on the Phidget event thread and are handed
+		# to the main loop through a ring buffer (see flushAggregate())
+		self.events = mod_ws_ringbuffer.AS_WS_RING_BUFFER(self.eventBufferSize)
+
 		if onInputChangeHandler is None:
 			onInputChangeHandler = getattr(self, 'onInputChangeHandler')
 
+		self.sensorCapture = getattr(self.station, 'sensorCapture', None) or SENSOR_CAPTURE_POLL
+		if not self.sensorCapture in SENSOR_CAPTURES:
+			raise ValueError('Unknown sensor capture %s. Use one of: %s' % (self.sensorCapture, ', '.join(SENSOR_CAPTURES)))
+
+		# Latest device value of each sensor, kept up to date by sensor
+		# change events with SENSOR_CAPTURE_EVENT (None until known)
+		self.latest = dict((field, None) for field in self.sensors)
+		self.sensorFields = dict((self.sensors[field], field) for field in self.sensors)
+
+		# Sensor change events are handed to the main loop through a ring
+		# buffer too, so the event thread does no device I/O (see
+		# updateLatest())
+		self.sensorEvents = mod_ws_ringbuffer.AS_WS_RING_BUFFER(self.eventBufferSize)
+		self.sensorOverflows = 0
+
+		self.deviceCalls = 0 # Sensor values asked of the InterfaceKit
+		self.sensorReads = 0 # Sensor values sampled by read() (the device calls polling would make)
+
+		# Burst mode: each read() reads the sensors burstRate times a
+		# second for burstDuration seconds, and decimates the burst to
+		# a single sample
+		self.burstRate = getattr(self.station, 'burstRate', None) or 0
+		if self.burstRate:
+			self.configureBurst()
+
+		kargs = {'onInputChangeHandler': onInputChangeHandler}
+		if self.sensorCapture == SENSOR_CAPTURE_EVENT:
+			trigger = getattr(self.station, 'sensorChangeTrigger', None) or self.sensorChangeTrigger
+			kargs['onSensorChangeHandler'] = self.onSensorChangeHandler
+			kargs['sensorChangeTriggers'] = dict((index, trigger) for index in self.sensorFields)
+
 		# Connect the IFK
 		if 'remoteHost' in self.station.__dict__:
-			self.phidgetIFK = mod_lphidget.PHIDGET_IFK(
+			self.phidgetIFK = self.phidget.PHIDGET_IFK(
 				self.station.interfaceKitID,
 				remoteHost=self.station.remoteHost,
-				onInputChangeHandler=onInputChangeHandler,
-                waitForAttach=2000
+                waitForAttach=2000,
+				**kargs
 				)
 		else:
-			self.phidgetIFK = mod_lphidget.PHIDGET_IFK(
+			self.phidgetIFK = self.phidget.PHIDGET_IFK(
 				self.station.interfaceKitID,
-				onInputChangeHandler=onInputChangeHandler
+				**kargs
 				)
-		
 
 
-	def read(self):
+
+	def configureBurst(self):
+		""" Set up burst mode: the read schedule, the decimators, and the jitter stats """
+
+		self.burstDuration = getattr(self.station, 'burstDuration', None) or self.burstDuration
+		self.burstFilter = getattr(self.station, 'burstFilter', None) or self.burstFilter
+
+		if self.sensorCapture != SENSOR_CAPTURE_POLL:
+			raise ValueError('Burst mode needs sensorCapture = %s' % SENSOR_CAPTURE_POLL)
+		if not self.burstFilter in BURST_FILTERS:
+			raise ValueError('Unknown burst filter %s. Use one of: %s' % (self.burstFilter, ', '.join(sorted(BURST_FILTERS))))
+		if self.burstDuration >= self.station.intervalSensorSample:
+			raise ValueError('burstDuration (%gs) must be shorter than intervalSensorSample (%ds)' % (self.burstDuration, self.station.intervalSensorSample))
+
+		self.burstPeriod = 1.0/self.burstRate
+		self.burstReads = max(1, int(round(self.burstDuration * self.burstRate)))
+		self.decimators = dict((field, BURST_FILTERS[self.burstFilter](self.burstReads)) for field in self.sensors)
+
+		self.bursts = 0 # Bursts read
+		self.lateBursts = 0 # Bursts with a read more than half a period late
+		self.burstJitterMean = 0.0 # Mean lateness of the last burst's reads, in seconds
+		self.burstJitterMax = 0.0 # Worst lateness of the last burst's reads, in seconds
+
+
+
+	def readSensor(self, field):
+		""" Ask the InterfaceKit for a sensor's current (unconverted) value """
+
+		if mod_ws_phidget_sensor.isRawSensor(field):
+			method = 'getSensorRawValue'
+		else:
+			method = 'getSensorValue'
+
+		self.deviceCalls += 1
+		return getattr(self.phidgetIFK.interfaceKit, method)(self.sensors[field])
+
+
+
+	def read(self, sampleTime=None):
+		"""
+		Sample the sensors.
+
+		@param sampleTime float optional - Time of the sample (seconds since
+			the epoch), e.g., its scheduled time. Defaults to now.
+		"""
 
 		import time
 
 		# Sample the sensors
-		sampleTime = time.localtime()
+		sampleTime = time.localtime(sampleTime)
 		sample = mod_ws_app.AS_WS_SAMPLE(sampleTime)
-		for field in self.sensors:
 
-			if field == mod_ws_app.MEASURE_STATION_BAROMETRIC_PRESSURE:
-				method = 'getSensorRawValue'
-			else:
-				method = 'getSensorValue'
+		if self.burstRate:
+			self.readBurst(sample)
+		else:
+			if self.sensorCapture == SENSOR_CAPTURE_EVENT:
+				self.updateLatest()
+
+			for field in self.sensors:
+
+				if self.sensorCapture == SENSOR_CAPTURE_EVENT:
+					value = self.latest[field]
+					if value is None:
+						# No change event yet (e.g., just attached)
+						value = self.latest[field] = self.readSensor(field)
+				else:
+					value = self.readSensor(field)
+
+				value = self.convertSensorValue(value, field)
+
+				#print "%d %d" % (field, value)
+				sample.setValue(field, value)
+
+			self.sensorReads += len(self.sensors)
+
+		# Add the sample to the running aggregate (see flushAggregate())
+		self.aggregator.add(sample)
+
+		return [sample]
+
+
+
+	def readBurst(self, sample):
+		"""
+		Read the sensors self.burstReads times, self.burstPeriod apart, and
+		set the sample's values to the decimated burst.
+
+		The reads are planned on the monotonic clock, so a slow read
+		doesn't push the later ones back. How late each read starts is
+		kept as the burst's jitter. With simulated devices running faster
+		than real time, the burst is sped up too (and its jitter is in
+		simulated seconds).
+		"""
+
+		import time
+
+		monotonic = mod_ws_controller_abstract.monotonic
+		for field in self.decimators:
+			self.decimators[field].reset()
 
-			sensorFunc = getattr(self.phidgetIFK.interfaceKit, method)
-			value = self.convertSensorValue(sensorFunc(self.sensors[field]), field)
+		jitterTotal = 0.0
+		jitterMax = 0.0
+		start = monotonic()
+		for i in xrange(self.burstReads):
 
-			#print "%d %d" % (field, value)
-			measure = mod_ws_app.AS_WS_SAMPLE.createMeasurement(field, value)
-			sample.setMeasurement(measure)
+			due = start + i*self.burstPeriod/self.timeScale
+			now = monotonic()
+			if now < due:
+				time.sleep(due - now)
+				now = monotonic()
+			jitter = (now - due)*self.timeScale
+			jitterTotal += jitter
+			if jitter > jitterMax:
+				jitterMax = jitter
 
-		# Add the sample
-		self.samples.append(sample)
+			for field in self.decimators:
+				self.decimators[field].add(self.convertSensorValue(self.readSensor(field), field))
 
-		return self.samples
+		for field in self.decimators:
+			sample.setValue(field, self.decimators[field].value())
+
+		self.sensorReads += self.burstReads * len(self.sensors)
+		self.bursts += 1
+		self.burstJitterMean = jitterTotal/self.burstReads
+		self.burstJitterMax = jitterMax
+		if jitterMax > self.burstPeriod/2:
+			self.lateBursts += 1
 
 
 
@@ -106,47 +271,94 @@ class AS_WS_READER_PWS(mod_ws_read_abstract.AS_WS_READER):
 		#print "%s %d %s" % (match, index, state)
 		if match == False: return
 
-		sampleTime = time.localtime()
-
 		if match == mod_ws_app.MEASURE_PRECIPITATION and state == 1:
 			value = round((self.station.rainGaugeVolume/self.station.rainGaugeArea)*10, 2) # millimetres
 		else:
 			return
 
-		sample = mod_ws_app.AS_WS_SAMPLE(sampleTime)
-		measure = mod_ws_app.AS_WS_SAMPLE.createMeasurement(match, value)
-		sample.setMeasurement(measure)
-		self.samples.append(sample)
+		# This runs on the Phidget event thread, so the event is only
+		# buffered here. The main loop adds it to the aggregate.
+		self.events.put(time.time(), match, value)
 
-	def aggregateMeasurements(self, mtype, measurements):
 
-		# For digital inputs the aggregate is the sum of the value sampled
-		# (that is, the events are additive).
-		if mtype in self.inputs:
-			return sum(measurements)
+
+	def onSensorChangeHandler(self, index, value, event):
+		""" Buffer a sensor change (SENSOR_CAPTURE_EVENT, runs on the Phidget event thread) """
+
+		import time
+
+		field = self.sensorFields.get(index)
+		if field is None:
+			return
+
+		# The main loop keeps the value (see updateLatest())
+		self.sensorEvents.put(time.time(), field, value)
+
+
+
+	def updateLatest(self):
+		""" Keep the latest value of each sensor from the buffered sensor change events """
+
+		self.sensorEvents.drain(self.setLatest)
+
+		# Changes were dropped, so any value may be stale: read them all again
+		overflows = self.sensorEvents.overflows
+		if overflows > self.sensorOverflows:
+			self.sensorOverflows = overflows
+			for field in self.latest:
+				self.latest[field] = None
+
+
+
+	def setLatest(self, eventTime, field, value):
+		""" Keep a buffered sensor change """
+
+		if mod_ws_phidget_sensor.isRawSensor(field):
+			# The event carries the 0-1000 value, but the pressure is
+			# converted from the (finer) raw value: read() reads it
+			value = None
 		else:
-			return super(AS_WS_READER_PWS, self).aggregateMeasurements(mtype, measurements)
-	
+			value = int(value)
 
+		self.latest[field] = value
 
-	def convertSensorValue(self, value, mtype):
 
 
-			# These conversions are in the product manual
-			if mtype == mod_ws_app.MEASURE_TEMPERATURE or mtype == mod_ws_app.MEASURE_INTERNAL_TEMPERATURE:
-				return round((value * 0.2222) - 61.111, 1)
+	def getDeviceCallsSaved(self):
+		""" Sensor values sampled by read() without asking the InterfaceKit (with SENSOR_CAPTURE_EVENT) """
+
+		return self.sensorReads - self.deviceCalls
+
+
+
+	def flushAggregate(self):
+		""" Add the buffered input events to the aggregate, then flush it """
+
+		self.events.drain(self.addEvent)
+
+		return super(AS_WS_READER_PWS, self).flushAggregate()
+
 
-			elif mtype == mod_ws_app.MEASURE_RELATIVE_HUMIDITY:
-				return int(round((value * 0.1906) - 40.2, 0))
 
-			elif mtype == mod_ws_app.MEASURE_STATION_BAROMETRIC_PRESSURE:
-				# This version of the equation requires the use of Phidgets.Devices.InterfaceKit.getSensorRawValue()
-				return int(round((((value / 4.095)/4.0) + 10.0) * 10, 0))
+	def addEvent(self, eventTime, mtype, value):
+		""" Add a buffered input event to the aggregate """
 
-			elif mtype == mod_ws_app.MEASURE_PRECIPITATION_WEIGHT:
-				return int(round((((value / 70.0) - (10.0/7.0)) * 453.59237), 0))
+		self.aggregator.addValue(mtype, value)
 
-			else:
-				raise ValueError('Unsupported measurement type %s' % str(mtype))
 
 
+	def aggregateRule(self, mtype):
+
+		# For digital inputs the aggregate is the sum of the value sampled
+		# (that is, the events are additive).
+		if mtype in self.inputs:
+			return mod_ws_read_abstract.AGGREGATE_SUM
+		else:
+			return super(AS_WS_READER_PWS, self).aggregateRule(mtype)
+	
+
+
+	def convertSensorValue(self, value, mtype):
+		""" Convert a sensor value to a measurement, with the sensor's calibrated table """
+
+		return self.sensorTables[mtype].convert(value)
@@ -0,0 +1,102 @@
+import as_weatherstation.app as mod_ws_app
+import as_weatherstation.read.abstract as mod_ws_read_abstract
+import as_weatherstation.rollup as mod_ws_rollup
+import as_weatherstation.sqlitedb as mod_ws_sqlitedb
+import as_weatherstation.timecodec as mod_ws_timecodec
+
+
+class AS_WS_READER_SQLITE(mod_ws_read_abstract.AS_WS_READER):
+    """ Read a station's samples from the SQLite database (see as_weatherstation/sqlitedb.py) """
+
+    def __init__(self, wsApp, sLabel, path=None):
+        """
+        @param path string optional - Database file. Defaults to the
+            [database_main] path option.
+        """
+
+        super(AS_WS_READER_SQLITE, self).__init__(wsApp)
+
+        self.station = self.app.stations[sLabel]
+
+        self.path = path
+        if self.path is None:
+            self.path = self.app.db[mod_ws_app.DB_MAIN].path
+
+        self.conn = None
+
+        self.fields = list(self.app.fieldMap['db'])
+
+        # The fields the hourly rollup tier has a column for (e.g., not the
+        # [aggregate] statistics it doesn't keep), see readHourly()
+        self.hourlyFields = None
+
+
+
+    def connect(self):
+
+        self.conn = mod_ws_sqlitedb.connect(self.path, logColumns=self.app.db[mod_ws_app.DB_MAIN].logColumns)
+
+
+
+    def read(self, start=None, end=None):
+        """
+        Read the samples logged from start up to (but not including) end.
+
+        Uses the (fStationID, fSampleDateTime) index, so the cost depends
+        on the number of samples read rather than the size of the database.
+
+        @param start string optional - 'YYYY-MM-DD HH:MM:SS'. None = from the first sample.
+        @param end string optional - 'YYYY-MM-DD HH:MM:SS'. None = to the last sample.
+        @return list - AS_WS_SAMPLE in time order
+        """
+
+        self.samples = self._read('as_pws_data_log', 'fSampleDateTime', self.fields, start, end)
+
+        return self.samples
+
+
+
+    def readHourly(self, start=None, end=None):
+        """ Read hourly samples (see read()), with the fields the hourly rollup tier keeps """
+
+        if self.hourlyFields is None:
+            tier = mod_ws_rollup.ROLLUP_TIERS['hourly']
+            columns = set([column for field, a, column in mod_ws_rollup.AS_WS_ROLLUP(self.app).getColumns(tier)])
+            self.hourlyFields = [field for field in self.fields if self.app.fieldMap['db'][field] in columns]
+
+        return self._read('as_pws_data_hourly', 'fDateTime', self.hourlyFields, start, end)
+
+
+
+    def _read(self, table, timeColumn, fields, start, end):
+
+        if self.conn is None:
+            self.connect()
+
+        columns = ', '.join([self.app.fieldMap['db'][field] for field in fields])
+        sql = 'SELECT %s, %s FROM %s WHERE fStationID = ?' % (timeColumn, columns, table)
+        params = [self.station.id]
+        if not start is None:
+            sql += ' AND %s >= ?' % timeColumn
+            params.append(start)
+        if not end is None:
+            sql += ' AND %s < ?' % timeColumn
+            params.append(end)
+        sql += ' ORDER BY %s' % timeColumn
+
+        samples = []
+        for row in self.conn.execute(sql, params):
+            sample = mod_ws_app.AS_WS_SAMPLE(mod_ws_timecodec.parseTime(str(row[0])))
+            for i in range(len(fields)):
+                sample.setValue(fields[i], row[i+1])
+            samples.append(sample)
+
+        return samples
+
+
+
+    def close(self):
+
+        if not self.conn is None:
+            self.conn.close()
+            self.conn = None
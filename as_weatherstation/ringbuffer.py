@@ -0,0 +1,105 @@
+#!/usr/local/bin/python
+# coding: utf-8
+
+"""
+A fixed-capacity ring buffer of (time, mtype, value) events.
+
+AS_WS_RING_BUFFER - hands events from one thread to another
+
+The Phidget library calls input change handlers (e.g., a rain gauge tip)
+on its own event thread, while the PWS main loop aggregates and logs
+them. The buffer sits between the two:
+
+    event thread (the only producer):  buffer.put(time, mtype, value)
+    main loop (the only consumer):     buffer.drain(callback)
+
+The slots are preallocated arrays, so put() allocates nothing and can't
+fail part way. The producer only moves the head and the consumer only
+moves the tail, so neither needs a lock: an event is either seen by a
+drain (and never again) or left for the next one, never lost or counted
+twice. If the consumer falls behind and the buffer fills up, put() drops
+the event and counts it in overflows.
+
+With more than one producer or consumer, the caller has to serialise
+them.
+"""
+
+from array import array
+
+
+class AS_WS_RING_BUFFER(object):
+    """ Single-producer/single-consumer ring buffer of (time, mtype, value) events """
+
+    def __init__(self, capacity=1024):
+        """
+        @param capacity int optional - Number of slots, rounded up to a power of two.
+        """
+
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.capacity = size
+        self.mask = size - 1
+
+        self.times = array('d', [0.0]) * size # Seconds since the epoch
+        self.mtypes = array('i', [0]) * size
+        self.values = array('d', [0.0]) * size
+
+        # Free-running counters: slot = counter & mask. The buffer holds
+        # head - tail events. head is only written by the producer, tail
+        # only by the consumer.
+        self.head = 0
+        self.tail = 0
+
+        self.overflows = 0 # Events dropped because the buffer was full
+
+
+
+    def __len__(self):
+        return self.head - self.tail
+
+
+
+    def put(self, time, mtype, value):
+        """ Add an event (producer). Returns False if the buffer was full and the event was dropped. """
+
+        head = self.head
+        if head - self.tail >= self.capacity:
+            self.overflows += 1
+            return False
+
+        i = head & self.mask
+        self.times[i] = time
+        self.mtypes[i] = mtype
+        self.values[i] = value
+
+        # Publish the slot only once it has been written
+        self.head = head + 1
+        return True
+
+
+
+    def drain(self, callback):
+        """
+        Pass each buffered event to callback(time, mtype, value), oldest first (consumer).
+
+        Only the events buffered when the drain starts are passed on; any
+        put meanwhile are left for the next drain.
+
+        @return int - Number of events drained.
+        """
+
+        tail = self.tail
+        head = self.head
+        mask = self.mask
+        times = self.times
+        mtypes = self.mtypes
+        values = self.values
+
+        for n in xrange(tail, head):
+            i = n & mask
+            callback(times[i], mtypes[i], values[i])
+
+        # Free the slots only once they have been read
+        self.tail = head
+        return head - tail
@@ -0,0 +1,613 @@
+#!/usr/local/bin/python
+# coding: utf-8
+
+"""
+Roll up raw samples (as_pws_data_log) into tiers of downsampled samples:
+5 minute, hourly (as_pws_data_hourly), daily and monthly by default.
+
+Each tier is a table with one row per station and period (fDateTime is
+the start of the period). For each measurement type a tier keeps some
+aggregates:
+    mean - average (in the column named like the raw column, e.g. fTemperature)
+    min - minimum (e.g., fTemperatureMin)
+    max - maximum (e.g., fTemperatureMax)
+    sum - total (in the column named like the raw column)
+By default analog measurements get mean, min and max, and digital inputs
+(e.g., rain gauge tips, logged as the precipitation during each interval)
+get sum, the same way the readers aggregate samples. fSampleCount is the
+number of raw samples in the period.
+
+Only the first tier is computed from raw samples. Each of the others is
+computed from the tier below it: min of mins, max of maxes, sum of sums,
+and means weighted by fSampleCount (the mean of the raw samples, give or
+take the rounding of the tier below). A year of daily values costs about 365 row
+reads, rather than half a million raw rows.
+
+Rollups are incremental. For each station, the fID of the last raw row
+rolled up is kept in as_pws_rollup_watermark. Only the periods of the
+first tier that have new rows are recomputed (from all of their rows, so
+a period that is loaded in pieces still comes out right). The periods
+they fall in are then recomputed in the next tier up, and so on.
+
+fIDs are assigned in insert order, but a row only shows up once it is
+committed, so a row that is still being written (e.g., by a station's
+live writeDB writer, which commits in batches) can show up after rows
+with higher fIDs. The watermark therefore never moves past the first
+row sampled in the last lag minutes ([rollup] lag): those rows are left
+for a later rollup, along with whatever was committed by then. lag has
+to be longer than a writer can hold rows uncommitted.
+
+Any time range can also be recomputed on demand (rollupRange()), and all
+of a station's samples can be rolled up from scratch (backfill()).
+
+The tiers and aggregates can be changed in the [rollup] config section.
+The tier tables are generated from the definitions (getSchema()). An
+SQLite database gets them automatically. For MySQL, run
+controller_rollup.py --create-tables (or see schema.sql).
+"""
+
+from collections import OrderedDict
+import datetime
+
+import as_weatherstation.app as mod_ws_app
+
+
+# Aggregates
+ROLLUP_MEAN = 'mean'
+ROLLUP_MIN = 'min'
+ROLLUP_MAX = 'max'
+ROLLUP_SUM = 'sum'
+ROLLUP_AGGREGATES = (ROLLUP_MEAN, ROLLUP_MIN, ROLLUP_MAX, ROLLUP_SUM)
+
+# Column name suffix of each aggregate
+ROLLUP_SUFFIX = {ROLLUP_MEAN: '', ROLLUP_MIN: 'Min', ROLLUP_MAX: 'Max', ROLLUP_SUM: ''}
+
+# Statistics of raw samples (see [aggregate]) the first tier's min and max
+# are taken from, when they are logged
+RAW_STAT = {ROLLUP_MIN: mod_ws_app.STAT_MIN, ROLLUP_MAX: mod_ws_app.STAT_MAX}
+
+# Tier resolutions longer than an hour (shorter ones are a number of
+# minutes that divides evenly into an hour)
+RESOLUTION_HOUR = 'hour'
+RESOLUTION_DAY = 'day'
+RESOLUTION_MONTH = 'month'
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+
+class AS_WS_ROLLUP_TIER(object):
+    """ Definition of a rollup tier """
+
+    __slots__ = ('name', 'table', 'resolution', 'aggregates')
+
+    def __init__(self, name, table, resolution, aggregates=None):
+        """
+        @param resolution - Minutes (dividing evenly into an hour) or a RESOLUTION_* constant.
+        @param aggregates dict optional - mtype -> tuple of ROLLUP_* for this
+            tier only. Types not listed use the engine's aggregates.
+        """
+
+        self.name = name
+        self.table = table
+        self.resolution = resolution
+        self.aggregates = aggregates or {}
+
+
+    def floor(self, t):
+        """ Start of the period containing datetime t """
+
+        if self.resolution == RESOLUTION_MONTH:
+            return datetime.datetime(t.year, t.month, 1)
+        elif self.resolution == RESOLUTION_DAY:
+            return datetime.datetime(t.year, t.month, t.day)
+        elif self.resolution == RESOLUTION_HOUR:
+            return datetime.datetime(t.year, t.month, t.day, t.hour)
+        return datetime.datetime(t.year, t.month, t.day, t.hour, t.minute - t.minute % self.resolution)
+
+
+    def next(self, t):
+        """ Start of the period after the one starting at datetime t """
+
+        if self.resolution == RESOLUTION_MONTH:
+            if t.month == 12:
+                return datetime.datetime(t.year + 1, 1, 1)
+            return datetime.datetime(t.year, t.month + 1, 1)
+        elif self.resolution == RESOLUTION_DAY:
+            return t + datetime.timedelta(days=1)
+        elif self.resolution == RESOLUTION_HOUR:
+            return t + datetime.timedelta(hours=1)
+        return t + datetime.timedelta(minutes=self.resolution)
+
+
+    def ceil(self, t):
+        """ Start of the first period at or after datetime t """
+
+        start = self.floor(t)
+        if start == t:
+            return t
+        return self.next(start)
+
+
+    def getPeriodSQL(self, column, backend):
+        """ SQL expression for the start of the period containing a DATETIME column, as 'YYYY-MM-DD HH:MM:SS' """
+
+        if backend == mod_ws_app.DB_BACKEND_SQLITE:
+            if self.resolution == RESOLUTION_MONTH:
+                return "substr(%s, 1, 7) || '-01 00:00:00'" % column
+            elif self.resolution == RESOLUTION_DAY:
+                return "substr(%s, 1, 10) || ' 00:00:00'" % column
+            elif self.resolution == RESOLUTION_HOUR:
+                return "substr(%s, 1, 13) || ':00:00'" % column
+            return "substr(%s, 1, 14) || substr('0' || (CAST(substr(%s, 15, 2) AS INTEGER) / %d * %d), -2) || ':00'" % (column, column, self.resolution, self.resolution)
+
+        # MySQL (% doubled for the DB-API parameter formatting)
+        if self.resolution == RESOLUTION_MONTH:
+            return "DATE_FORMAT(%s, '%%%%Y-%%%%m-01 00:00:00')" % column
+        elif self.resolution == RESOLUTION_DAY:
+            return "DATE_FORMAT(%s, '%%%%Y-%%%%m-%%%%d 00:00:00')" % column
+        elif self.resolution == RESOLUTION_HOUR:
+            return "DATE_FORMAT(%s, '%%%%Y-%%%%m-%%%%d %%%%H:00:00')" % column
+        return "CONCAT(DATE_FORMAT(%s, '%%%%Y-%%%%m-%%%%d %%%%H:'), LPAD(MINUTE(%s) DIV %d * %d, 2, '0'), ':00')" % (column, column, self.resolution, self.resolution)
+
+
+
+# Tiers, from finest to coarsest, keyed on name
+ROLLUP_TIERS = OrderedDict([
+    ('5min', AS_WS_ROLLUP_TIER('5min', 'as_pws_data_5min', 5)),
+    ('hourly', AS_WS_ROLLUP_TIER('hourly', 'as_pws_data_hourly', RESOLUTION_HOUR)),
+    ('daily', AS_WS_ROLLUP_TIER('daily', 'as_pws_data_daily', RESOLUTION_DAY)),
+    ('monthly', AS_WS_ROLLUP_TIER('monthly', 'as_pws_data_monthly', RESOLUTION_MONTH))
+    ])
+
+
+
+def parseTime(s):
+    return datetime.datetime.strptime(str(s), TIME_FORMAT)
+
+def formatTime(t):
+    return t.strftime(TIME_FORMAT)
+
+
+
+class AS_WS_ROLLUP(object):
+    """ Rollup engine """
+
+    def __init__(self, wsApp, conn=None):
+        """
+        @param conn DB-API connection optional - Defaults to a new connection
+            to the main DB, opened when first needed.
+        """
+
+        self.app = wsApp
+        self.backend = self.app.db[mod_ws_app.DB_MAIN].backend
+
+        # Tiers, finest first
+        names = self.app.rollupTiers
+        if names is None:
+            names = list(ROLLUP_TIERS)
+        for name in names:
+            if not name in ROLLUP_TIERS:
+                raise ValueError('Unknown rollup tier %s' % name)
+        self.tiers = [tier for tier in ROLLUP_TIERS.values() if tier.name in names]
+        if not self.tiers:
+            raise ValueError('No rollup tiers configured')
+
+        # Default aggregates: digital inputs are summed, everything else
+        # gets mean, min and max.
+        fm = self.app.fieldMap[mod_ws_app.STYPE_PWS]
+        inputs = [field for field in fm if fm[field] is not None and fm[field][0] == mod_ws_app.PWS_IO_INPUT]
+        # Measurements only: the statistics columns (see [aggregate]) are
+        # what the first tier's min and max are taken from, if configured
+        self.fields = [field for field in self.app.fieldMap['db'] if not mod_ws_app.isStatField(field)]
+        self.aggregates = {}
+        for field in self.fields:
+            if field in inputs:
+                self.aggregates[field] = (ROLLUP_SUM,)
+            else:
+                self.aggregates[field] = (ROLLUP_MEAN, ROLLUP_MIN, ROLLUP_MAX)
+        self.aggregates.update(self.app.rollupAggregates)
+
+        for i in range(len(self.tiers)):
+            self.validateTier(i)
+
+        if self.backend == mod_ws_app.DB_BACKEND_SQLITE:
+            self.param = '?'
+            self.sqlSetWatermark = 'INSERT OR REPLACE INTO as_pws_rollup_watermark (fStationID, fLastID) VALUES (?, ?)'
+        else:
+            self.param = '%s'
+            self.sqlSetWatermark = """INSERT INTO as_pws_rollup_watermark (fStationID, fLastID) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE fLastID = VALUES(fLastID)"""
+
+        p = self.param
+        self.sqlLastID = 'SELECT MAX(fID) FROM as_pws_data_log WHERE fStationID = %s' % p
+        self.sqlFirstRecentID = 'SELECT MIN(fID) FROM as_pws_data_log WHERE fStationID = %s AND fID > %s AND fSampleDateTime >= %s' % (p, p, p)
+        self.sqlGetWatermark = 'SELECT fLastID FROM as_pws_rollup_watermark WHERE fStationID = %s' % p
+        self.sqlNewPeriods = """SELECT DISTINCT %s FROM as_pws_data_log
+            WHERE fStationID = %s AND fID > %s AND fID <= %s""" % (self.tiers[0].getPeriodSQL('fSampleDateTime', self.backend), p, p, p)
+        self.sqlTimeRange = 'SELECT MIN(fSampleDateTime), MAX(fSampleDateTime) FROM as_pws_data_log WHERE fStationID = %s' % p
+
+        self.sqlRollup = [self.getRollupSQL(i) for i in range(len(self.tiers))]
+
+        self.conn = conn
+        self.ownConn = conn is None
+
+
+
+    def connect(self):
+        """ Connect to the main DB, unless given a connection """
+
+        if not self.conn is None:
+            return
+
+        self.conn = self.app.db[mod_ws_app.DB_MAIN].connect()
+        self.ownConn = True
+
+        # The local database manages its own tables
+        if self.backend == mod_ws_app.DB_BACKEND_SQLITE:
+            self.createTables()
+
+
+
+    def getAggregates(self, tier, field):
+        return tier.aggregates.get(field, self.aggregates[field])
+
+
+
+    def validateTier(self, i):
+        """ Check a tier's aggregates, and that the tier below it has what they are computed from """
+
+        tier = self.tiers[i]
+        for field in self.fields:
+            aggregates = self.getAggregates(tier, field)
+            for a in aggregates:
+                if not a in ROLLUP_AGGREGATES:
+                    raise ValueError('Unknown rollup aggregate %s' % a)
+            if ROLLUP_MEAN in aggregates and ROLLUP_SUM in aggregates:
+                raise ValueError('%s rollup of %s can have a mean or a sum, not both' % (tier.name, self.app.fieldMap['db'][field]))
+            if i > 0:
+                source = self.getAggregates(self.tiers[i-1], field)
+                for a in aggregates:
+                    if not a in source:
+                        raise ValueError('%s rollup of %s needs the %s from the %s tier' % (tier.name, self.app.fieldMap['db'][field], a, self.tiers[i-1].name))
+
+
+
+    def getColumns(self, tier):
+        """ Get the tier's measurement columns as a list of (field, aggregate, column name) """
+
+        columns = []
+        for field in self.fields:
+            for a in self.getAggregates(tier, field):
+                columns.append((field, a, self.app.fieldMap['db'][field] + ROLLUP_SUFFIX[a]))
+        return columns
+
+
+
+    def getRollupSQL(self, i):
+        """ Build the SQL that computes a range of periods of tier i from the tier below it (or raw samples) """
+
+        tier = self.tiers[i]
+        p = self.param
+
+        if i == 0:
+            source, timeColumn, count = 'as_pws_data_log', 'fSampleDateTime', 'COUNT(*)'
+        else:
+            source, timeColumn, count = self.tiers[i-1].table, 'fDateTime', 'SUM(fSampleCount)'
+
+        cols = []
+        values = []
+        for field, a, col in self.getColumns(tier):
+            places = mod_ws_app.MEASURE_TYPES[field].precision
+            raw = self.app.fieldMap['db'][field]
+            # Raw samples have Min/Max columns only if configured, and
+            # they are NULL in rows loaded before they were (or from logs
+            # written before they were), so those rows use the measurement
+            sourceCol = col if i > 0 else raw
+            if i == 0 and a in (ROLLUP_MIN, ROLLUP_MAX):
+                statCol = self.app.fieldMap['db'].get((field, RAW_STAT[a]))
+                if not statCol is None:
+                    sourceCol = 'COALESCE(%s, %s)' % (statCol, raw)
+            cols.append(col)
+            if a == ROLLUP_MIN:
+                values.append('MIN(%s)' % sourceCol)
+            elif a == ROLLUP_MAX:
+                values.append('MAX(%s)' % sourceCol)
+            elif a == ROLLUP_SUM:
+                values.append('ROUND(SUM(%s), %d)' % (raw, places))
+            elif i == 0:
+                values.append('ROUND(AVG(%s), %d)' % (raw, places))
+            else:
+                values.append('ROUND(SUM(%s * fSampleCount) / SUM(fSampleCount), %d)' % (raw, places))
+
+        delete = 'DELETE FROM %s WHERE fStationID = %s AND fDateTime >= %s AND fDateTime < %s' % (tier.table, p, p, p)
+
+        insert = """INSERT INTO %s (
+            fStationID,
+            fDateTime,
+            %s,
+            fSampleCount
+            )
+            SELECT fStationID, %s AS fPeriod, %s, %s
+            FROM %s
+            WHERE fStationID = %s AND %s >= %s AND %s < %s
+            GROUP BY fStationID, fPeriod""" % (tier.table, ",\n            ".join(cols), tier.getPeriodSQL(timeColumn, self.backend), ", ".join(values), count, source, p, timeColumn, p, timeColumn, p)
+
+        return (delete, insert)
+
+
+
+    def getLastID(self, cursor, stationID, watermark=0):
+        """
+        Get the fID the watermark can be moved up to: the last row, or the
+        one before the first row (above the watermark) sampled in the last
+        lag minutes, as rows that are still being written can show up with
+        lower fIDs.
+
+        @return int - None if the station has no rows.
+        """
+
+        cursor.execute(self.sqlLastID, (stationID,))
+        lastID = cursor.fetchone()[0]
+        if lastID is None or not self.app.rollupLag:
+            return lastID
+
+        recent = datetime.datetime.now() - datetime.timedelta(minutes=self.app.rollupLag)
+        cursor.execute(self.sqlFirstRecentID, (stationID, watermark, formatTime(recent)))
+        row = cursor.fetchone()
+        if not row is None and not row[0] is None:
+            lastID = min(lastID, row[0] - 1)
+        return lastID
+
+
+
+    def rollupStation(self, sLabel):
+        """
+        Roll up the new raw samples since the last rollup, through every tier.
+
+        @return int - Number of ranges of periods rolled up in the first tier.
+        """
+
+        stationID = self.app.stations[sLabel].id
+        self.connect()
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(self.sqlGetWatermark, (stationID,))
+            row = cursor.fetchone()
+            watermark = 0
+            if not row is None and not row[0] is None:
+                watermark = row[0]
+
+            lastID = self.getLastID(cursor, stationID, watermark)
+            if lastID is None or lastID <= watermark:
+                return 0
+
+            cursor.execute(self.sqlNewPeriods, (stationID, watermark, lastID))
+            tier = self.tiers[0]
+            ranges = self.mergeRanges([(t, tier.next(t)) for t in [parseTime(r[0]) for r in cursor.fetchall()]])
+            self._rollup(cursor, stationID, ranges)
+
+            cursor.execute(self.sqlSetWatermark, (stationID, lastID))
+            self.conn.commit()
+        except:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        return len(ranges)
+
+
+
+    def rollupRange(self, sLabel, start, end):
+        """
+        Recompute the periods from start up to end in every tier, whether
+        or not they have been rolled up before. The range is widened to
+        whole periods of each tier. The watermark is not changed.
+
+        @param start string - 'YYYY-MM-DD HH:MM:SS'
+        @param end string - 'YYYY-MM-DD HH:MM:SS'
+        """
+
+        stationID = self.app.stations[sLabel].id
+        self.connect()
+        cursor = self.conn.cursor()
+        try:
+            self._rollup(cursor, stationID, [(parseTime(start), parseTime(end))])
+            self.conn.commit()
+        except:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+
+    def backfill(self, sLabel):
+        """
+        Roll up all of a station's raw samples from scratch, a month at a
+        time (one transaction per month), then set its watermark (see
+        getLastID()).
+
+        @return int - Number of months rolled up.
+        """
+
+        stationID = self.app.stations[sLabel].id
+        self.connect()
+        cursor = self.conn.cursor()
+        try:
+            lastID = self.getLastID(cursor, stationID)
+            cursor.execute(self.sqlTimeRange, (stationID,))
+            first, last = cursor.fetchone()
+        finally:
+            cursor.close()
+
+        if lastID is None or first is None:
+            return 0
+
+        month = ROLLUP_TIERS['monthly']
+        start = month.floor(parseTime(first))
+        end = parseTime(last)
+        months = 0
+        while start <= end:
+            self.rollupRange(sLabel, formatTime(start), formatTime(month.next(start)))
+            start = month.next(start)
+            months += 1
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(self.sqlSetWatermark, (stationID, lastID))
+            self.conn.commit()
+        finally:
+            cursor.close()
+
+        return months
+
+
+
+    def _rollup(self, cursor, stationID, ranges):
+        """
+        Recompute ranges of periods in the first tier, then the periods
+        they fall in, tier by tier, up the cascade. Does not commit.
+
+        @param ranges list - (start, end) datetime tuples
+        """
+
+        for i in range(len(self.tiers)):
+            tier = self.tiers[i]
+            ranges = self.mergeRanges([(tier.floor(start), tier.ceil(end)) for start, end in ranges])
+            delete, insert = self.sqlRollup[i]
+            for start, end in ranges:
+                params = (stationID, formatTime(start), formatTime(end))
+                cursor.execute(delete, params)
+                cursor.execute(insert, params)
+
+
+
+    def mergeRanges(self, ranges):
+        """ Sort (start, end) ranges, merging the ones that touch or overlap """
+
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        return [tuple(r) for r in merged]
+
+
+
+    def getSchema(self):
+        """ Get the CREATE TABLE statements for the tier tables (and the ALTER TABLE statements for the statistics columns of as_pws_data_log) """
+
+        schema = [self.getTableSQL(tier) for tier in self.tiers]
+        schema.append(self.getWatermarkTableSQL())
+        for col, sqlType in self.app.getStatColumnTypes(self.backend):
+            schema.append('ALTER TABLE as_pws_data_log ADD COLUMN %s %s NULL DEFAULT NULL;' % (col, sqlType))
+        return schema
+
+
+
+    def getColumnTypes(self, tier):
+        """ Get the tier's measurement columns as a list of (column name, SQL type) """
+
+        return [(col, mod_ws_app.getSQLType(field, self.backend)) for field, a, col in self.getColumns(tier)]
+
+
+
+    def getTableSQL(self, tier):
+        """ Get the CREATE TABLE statement for a tier """
+
+        if self.backend == mod_ws_app.DB_BACKEND_SQLITE:
+            cols = ''.join(["    %s %s NOT NULL DEFAULT 0,\n" % c for c in self.getColumnTypes(tier)])
+            return """CREATE TABLE IF NOT EXISTS %s (
+    fID INTEGER PRIMARY KEY AUTOINCREMENT,
+    fStationID INTEGER NOT NULL DEFAULT 0 REFERENCES as_pws_station (fID),
+    fDateTime TEXT NOT NULL DEFAULT '0000-00-00 00:00:00',
+%s    fSampleCount INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (fStationID, fDateTime)
+);""" % (tier.table, cols)
+
+        cols = ''.join(["    `%s` %s NOT NULL default '0',\n" % c for c in self.getColumnTypes(tier)])
+        return """CREATE TABLE IF NOT EXISTS `%s` (
+    `fID` BIGINT UNSIGNED NOT NULL auto_increment,
+    `fStationID` TINYINT UNSIGNED NOT NULL default '0',
+    `fDateTime` DATETIME NOT NULL default '0000-00-00 00:00:00',
+%s    `fSampleCount` INT UNSIGNED NOT NULL default '0',
+    PRIMARY KEY (`fID`),
+    UNIQUE KEY `StationAndTime` (`fStationID`, `fDateTime`),
+    FOREIGN KEY `fStationID` (`fStationID`) REFERENCES `as_pws_station` (`fID`)
+) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8;""" % (tier.table, cols)
+
+
+
+    def getWatermarkTableSQL(self):
+        """ Get the CREATE TABLE statement for as_pws_rollup_watermark """
+
+        if self.backend == mod_ws_app.DB_BACKEND_SQLITE:
+            return """CREATE TABLE IF NOT EXISTS as_pws_rollup_watermark (
+    fStationID INTEGER PRIMARY KEY REFERENCES as_pws_station (fID),
+    fLastID INTEGER NOT NULL DEFAULT 0
+);"""
+
+        return """CREATE TABLE IF NOT EXISTS `as_pws_rollup_watermark` (
+    `fStationID` TINYINT UNSIGNED NOT NULL default '0',
+    `fLastID` BIGINT UNSIGNED NOT NULL default '0',
+    PRIMARY KEY (`fStationID`),
+    FOREIGN KEY `fStationID` (`fStationID`) REFERENCES `as_pws_station` (`fID`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;"""
+
+
+
+    def createTables(self):
+        """
+        Create the tier tables, and add any columns missing from existing ones (e.g., after
+        changing the aggregates or upgrading). Also creates the rollup watermark table, and adds
+        the statistics columns of as_pws_data_log. Safe to run any number of times.
+        """
+
+        self.connect()
+        cursor = self.conn.cursor()
+        try:
+            for tier in self.tiers:
+                cursor.execute(self.getTableSQL(tier))
+                self.addColumns(cursor, tier.table, self.getColumnTypes(tier))
+            cursor.execute(self.getWatermarkTableSQL())
+            self.addColumns(cursor, 'as_pws_data_log', self.app.getStatColumnTypes(self.backend), True)
+            self.conn.commit()
+        finally:
+            cursor.close()
+
+
+
+    def addColumns(self, cursor, table, columns, nullable=False):
+        """
+        Add the (column name, SQL type) columns missing from a table.
+
+        @param nullable bool optional - If True, the columns are NULL where
+            there is no value (e.g., the statistics of existing rows), else 0.
+        """
+
+        if not columns:
+            return
+
+        if self.backend == mod_ws_app.DB_BACKEND_SQLITE:
+            cursor.execute('PRAGMA table_info(%s)' % table)
+            existing = [row[1] for row in cursor.fetchall()]
+        else:
+            cursor.execute('SHOW COLUMNS FROM %s' % table)
+            existing = [row[0] for row in cursor.fetchall()]
+
+        default = 'NULL DEFAULT NULL' if nullable else 'NOT NULL DEFAULT 0'
+        for col, sqlType in columns:
+            if not col in existing:
+                cursor.execute("ALTER TABLE %s ADD COLUMN %s %s %s" % (table, col, sqlType, default))
+
+
+
+    def close(self):
+
+        if self.ownConn and not self.conn is None:
+            self.conn.close()
+        self.conn = None
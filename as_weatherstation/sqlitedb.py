@@ -0,0 +1,103 @@
+#!/usr/local/bin/python
+# coding: utf-8
+
+"""
+SQLite version of the database (see schema.sql).
+
+Used when [database_main] backend = sqlite. A weather station without a
+database server (e.g., a PhidgetSBC) can keep its samples in a local
+file and still query them by station and time with an index, rather
+than re-parsing its text logs. It also works as a no-server stand-in
+for the MySQL database when testing.
+
+The tables and columns are the same as in schema.sql. Times are stored
+as 'YYYY-MM-DD HH:MM:SS' text, which sorts in time order. Columns of the
+configured extra statistics (e.g., fTemperatureMin, see [aggregate] in
+app-explain.cfg) are added to as_pws_data_log when the database is opened.
+"""
+
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS as_pws_station (
+    fID INTEGER PRIMARY KEY,
+    fName TEXT NOT NULL DEFAULT '',
+    fAltitude INTEGER NOT NULL DEFAULT 0,
+    fLatitude REAL NOT NULL DEFAULT 0,
+    fLongitude REAL NOT NULL DEFAULT 0,
+    fDescription TEXT DEFAULT ''
+);
+
+CREATE TABLE IF NOT EXISTS as_pws_data_log (
+    fID INTEGER PRIMARY KEY AUTOINCREMENT,
+    fStationID INTEGER NOT NULL DEFAULT 0 REFERENCES as_pws_station (fID),
+    fSampleDateTime TEXT NOT NULL DEFAULT '0000-00-00 00:00:00',
+    fTemperature REAL NOT NULL DEFAULT 0,
+    fRelativeHumidity REAL NOT NULL DEFAULT 0,
+    fStationBarometricPressure INTEGER NOT NULL DEFAULT 0,
+    fPrecipitationWeight INTEGER NOT NULL DEFAULT 0,
+    fInternalTemperature REAL NOT NULL DEFAULT 0,
+    fCO2 INTEGER NOT NULL DEFAULT 0,
+    fNoise INTEGER NOT NULL DEFAULT 0,
+    fSeaLevelBarometricPressure INTEGER NOT NULL DEFAULT 0,
+    fPrecipitation REAL NOT NULL DEFAULT 0,
+    UNIQUE (fStationID, fSampleDateTime)
+);
+
+CREATE TABLE IF NOT EXISTS as_pws_data_hourly (
+    fID INTEGER PRIMARY KEY AUTOINCREMENT,
+    fStationID INTEGER NOT NULL DEFAULT 0 REFERENCES as_pws_station (fID),
+    fDateTime TEXT NOT NULL DEFAULT '0000-00-00 00:00:00',
+    fTemperature REAL NOT NULL DEFAULT 0,
+    fRelativeHumidity REAL NOT NULL DEFAULT 0,
+    fStationBarometricPressure INTEGER NOT NULL DEFAULT 0,
+    fPrecipitationWeight INTEGER NOT NULL DEFAULT 0,
+    fInternalTemperature REAL NOT NULL DEFAULT 0,
+    fCO2 INTEGER NOT NULL DEFAULT 0,
+    fNoise INTEGER NOT NULL DEFAULT 0,
+    fSeaLevelBarometricPressure INTEGER NOT NULL DEFAULT 0,
+    fPrecipitation REAL NOT NULL DEFAULT 0,
+    fSampleCount INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (fStationID, fDateTime)
+);
+
+CREATE TABLE IF NOT EXISTS as_pws_rollup_watermark (
+    fStationID INTEGER PRIMARY KEY REFERENCES as_pws_station (fID),
+    fLastID INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+
+def connect(path, timeout=30, logColumns=()):
+    """
+    Open (and if need be create) the SQLite database.
+
+    The database runs in WAL mode: readers (e.g., a web page querying the
+    station) don't block the writer, and commits are cheap appends to the
+    write-ahead log rather than rewrites of the database file.
+
+    @param path string - Database file
+    @param timeout int optional - Seconds to wait for a lock held by another connection.
+    @param logColumns list optional - Extra as_pws_data_log columns, as (column name, SQL type), added if missing
+        (NULL where a row has no value, see AS_WS_ROLLUP.addColumns()).
+    @return sqlite3.Connection
+    """
+
+    conn = sqlite3.connect(path, timeout)
+
+    conn.execute('PRAGMA journal_mode=WAL')
+    # In WAL mode NORMAL is safe from corruption. A power cut may lose
+    # the last few commits, which are still in the text logs anyway.
+    conn.execute('PRAGMA synchronous=NORMAL')
+
+    conn.executescript(SCHEMA)
+
+    if logColumns:
+        existing = [row[1] for row in conn.execute('PRAGMA table_info(as_pws_data_log)')]
+        for col, sqlType in logColumns:
+            if not col in existing:
+                conn.execute('ALTER TABLE as_pws_data_log ADD COLUMN %s %s NULL DEFAULT NULL' % (col, sqlType))
+        conn.commit()
+
+    return conn
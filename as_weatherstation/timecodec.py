@@ -0,0 +1,213 @@
+#!/usr/local/bin/python
+# coding: utf-8
+
+"""
+Fast codec for the fixed "YYYY-MM-DD HH:MM:SS" timestamps used by the
+logs, the timestamp files, and the database.
+
+time.strptime() and time.strftime() are generic (and slow) routines.
+Our timestamps always have the same layout, so the digits are sliced out
+directly. Everything that depends only on the date (day of week, day of
+year, epoch time at midnight, the formatted date string) is computed once
+per date and cached. Log rows come in date order, so the cache nearly
+always hits.
+
+Run this module to compare it with the time module:
+    python -m as_weatherstation.timecodec
+"""
+
+import time
+
+FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Zero padded strings for seconds (61 for leap seconds)
+_PADDED = ['%02d' % i for i in range(62)]
+
+# 'HH:MM:' strings for every minute of the day
+_MINUTES = ['%02d:%02d:' % (h, m) for h in range(24) for m in range(60)]
+
+# Limit on cached dates, so a long running process can't grow without bound
+_CACHE_SIZE = 4096
+
+# 'YYYY-MM-DD' -> (year, month, day, wday, yday, epoch at midnight)
+_parseCache = {}
+
+# Output side: the last date formatted. Rows are written in time order,
+# so one entry is enough. Each is replaced as a whole tuple, so threads
+# never see a key paired with the wrong string.
+# (year*10000 + month*100 + day, 'YYYY-MM-DD ')
+_formatDate = (None, None)
+# (epoch at midnight, epoch at next midnight, 'YYYY-MM-DD ')
+_formatDay = (0, 0, None)
+
+
+
+def _getDay(prefix):
+    """ Get (and cache) the date dependent parts of a timestamp """
+
+    day = _parseCache.get(prefix)
+    if day is None:
+        # strptime validates the date and works out wday and yday for us
+        t = time.strptime(prefix, "%Y-%m-%d")
+        midnight = int(time.mktime(t))
+
+        # On days when daylight saving time starts or ends the offset
+        # from midnight is not simply h*3600 + m*60 + s. Those days fall
+        # back to mktime() for every row.
+        end = int(time.mktime((t.tm_year, t.tm_mon, t.tm_mday, 23, 59, 59, 0, 0, -1)))
+        if end - midnight != 86399:
+            midnight = None
+
+        day = (t.tm_year, t.tm_mon, t.tm_mday, t.tm_wday, t.tm_yday, midnight)
+
+        if len(_parseCache) >= _CACHE_SIZE:
+            _parseCache.clear()
+        _parseCache[prefix] = day
+
+    return day
+
+
+
+def _split(s):
+    """ Slice the time of day out of a timestamp string. Returns None if s is not in the fixed layout. """
+
+    if len(s) != 19 or s[10] != ' ' or s[13] != ':' or s[16] != ':':
+        return None
+
+    h, m, sec = s[11:13], s[14:16], s[17:19]
+    if not (h.isdigit() and m.isdigit() and sec.isdigit()):
+        return None
+
+    h, m, sec = int(h), int(m), int(sec)
+    if h > 23 or m > 59 or sec > 61:
+        return None
+
+    return (h, m, sec)
+
+
+
+def parseTime(s):
+    """
+    Parse a timestamp string into a time.struct_time.
+
+    The result is the same as time.strptime(s, FORMAT).
+
+    @param s string - 'YYYY-MM-DD HH:MM:SS'
+    @return time.struct_time
+    """
+
+    hms = _split(s)
+    if hms is None:
+        # Let strptime() deal with (and complain about) anything unusual
+        return time.strptime(s, FORMAT)
+
+    day = _getDay(s[:10])
+    return time.struct_time((day[0], day[1], day[2], hms[0], hms[1], hms[2], day[3], day[4], -1))
+
+
+
+def parseEpoch(s):
+    """
+    Parse a local timestamp string into seconds since the epoch.
+
+    The result is the same as int(time.mktime(time.strptime(s, FORMAT))).
+
+    @param s string - 'YYYY-MM-DD HH:MM:SS'
+    @return int
+    """
+
+    hms = _split(s)
+    if hms is None:
+        return int(time.mktime(time.strptime(s, FORMAT)))
+
+    day = _getDay(s[:10])
+    if day[5] is None:
+        return int(time.mktime((day[0], day[1], day[2], hms[0], hms[1], hms[2], day[3], day[4], -1)))
+
+    return day[5] + hms[0]*3600 + hms[1]*60 + hms[2]
+
+
+
+def formatTime(t):
+    """
+    Format a time.struct_time (or a 9-tuple) as a timestamp string.
+
+    The result is the same as time.strftime(FORMAT, t).
+
+    @return string - 'YYYY-MM-DD HH:MM:SS'
+    """
+
+    global _formatDate
+
+    key = t[0]*10000 + t[1]*100 + t[2]
+    date = _formatDate
+    if key != date[0]:
+        date = (key, '%04d-%02d-%02d ' % (t[0], t[1], t[2]))
+        _formatDate = date
+
+    return date[1] + _MINUTES[t[3]*60 + t[4]] + _PADDED[t[5]]
+
+
+
+def formatEpoch(epoch):
+    """
+    Format seconds since the epoch as a local timestamp string.
+
+    The result is the same as time.strftime(FORMAT, time.localtime(epoch)).
+    """
+
+    global _formatDay
+
+    epoch = int(epoch)
+    day = _formatDay
+    if day[0] <= epoch < day[1]:
+        offset = epoch - day[0]
+        return day[2] + _MINUTES[offset // 60] + _PADDED[offset % 60]
+
+    t = time.localtime(epoch)
+    s = formatTime(t)
+
+    # Remember the day, unless it is a daylight saving time change day
+    midnight = _getDay(s[:10])[5]
+    if midnight is not None:
+        _formatDay = (midnight, midnight + 86400, s[:11])
+
+    return s
+
+
+
+def benchmark(n=100000):
+    """ Time the codec against time.strptime()/time.strftime() on a day of 1-minute timestamps """
+
+    import timeit
+
+    start = int(time.mktime((2014, 4, 8, 0, 0, 0, 0, 0, -1)))
+    strings = [time.strftime(FORMAT, time.localtime(start + 60*(i % 1440))) for i in range(n)]
+    structs = [time.strptime(s, FORMAT) for s in strings]
+    epochs = [start + 60*(i % 1440) for i in range(n)]
+
+    for s in strings[:1440]:
+        assert parseTime(s) == time.strptime(s, FORMAT)
+        assert parseEpoch(s) == int(time.mktime(time.strptime(s, FORMAT)))
+    for t in structs[:1440]:
+        assert formatTime(t) == time.strftime(FORMAT, t)
+    for e in epochs[:1440]:
+        assert formatEpoch(e) == time.strftime(FORMAT, time.localtime(e))
+
+    tests = [
+        ('parse', lambda: [time.strptime(s, FORMAT) for s in strings], lambda: [parseTime(s) for s in strings]),
+        ('parse to epoch', lambda: [int(time.mktime(time.strptime(s, FORMAT))) for s in strings], lambda: [parseEpoch(s) for s in strings]),
+        ('format', lambda: [time.strftime(FORMAT, t) for t in structs], lambda: [formatTime(t) for t in structs]),
+        ('format epoch', lambda: [time.strftime(FORMAT, time.localtime(e)) for e in epochs], lambda: [formatEpoch(e) for e in epochs])
+        ]
+
+    print "%d timestamps" % n
+    for label, old, new in tests:
+        tOld = min(timeit.repeat(old, number=1, repeat=3))
+        tNew = min(timeit.repeat(new, number=1, repeat=3))
+        print "%-15s time module %.3fs   timecodec %.3fs   %.1fx faster" % (label, tOld, tNew, tOld/tNew)
+
+
+
+if __name__ == "__main__":
+    benchmark()
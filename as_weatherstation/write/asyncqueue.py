@@ -0,0 +1,356 @@
+import cPickle
+import os
+import threading
+import time
+import Queue
+
+from as_weatherstation.log import error as mod_ws_log_error
+import as_weatherstation.write.abstract as mod_ws_write_abstract
+
+
+# What write() does when the queue is full (see AS_WS_WRITER_ASYNC.full)
+QUEUE_FULL_DROP = 'drop' # Drop the samples (counted in AS_WS_WRITER_ASYNC.dropped)
+QUEUE_FULL_BLOCK = 'block' # Wait for room, up to AS_WS_WRITER_ASYNC.blockTimeout seconds, then drop
+QUEUE_FULL_SPILL = 'spill' # Append the samples to a spill file, written once the queue drains
+
+QUEUE_FULL_POLICIES = (QUEUE_FULL_DROP, QUEUE_FULL_BLOCK, QUEUE_FULL_SPILL)
+
+
+
+class AS_WS_WRITER_ASYNC(mod_ws_write_abstract.AS_WS_WRITER):
+    """
+    Write samples in the background through another writer.
+
+    write() puts the samples on a bounded in-memory queue and returns. A
+    writer thread takes them off the queue and writes them with the
+    wrapped writer (e.g., a DB writer). Whoever calls write() (e.g., the
+    PWS sampling loop) never waits for the wrapped writer, so a slow or
+    unreachable DB can't delay the next sensor read.
+
+    The wrapped writer is flushed (e.g., committed) every flushSize
+    writes or flushInterval seconds, not after every write, so a writer
+    that batches its transactions (AS_WS_WRITER_SQLITE) still does. The
+    samples written since the last flush are kept until it succeeds.
+
+    If the wrapped writer fails, the writer thread logs the error and
+    retries every retryInterval seconds: the samples it had not flushed
+    yet (which the failure may have rolled back) are written again, then
+    the new ones, so nothing is lost while the DB is down. Meanwhile the
+    queue fills up, and write() does what self.full says:
+        drop - the samples are dropped (and counted)
+        block - write() waits for room (at most blockTimeout seconds)
+        spill - the samples are appended to a spill file on disk. Once
+            the queue has drained they are written, in order, before
+            anything else that is written in the meantime.
+
+    Spilled samples outlive the process: a spill file left by an earlier
+    run is written first when the writer thread starts.
+    """
+
+    maxSize = 1000 # Maximum write() calls waiting in the queue.
+    full = QUEUE_FULL_SPILL # One of QUEUE_FULL_POLICIES.
+    blockTimeout = 10 # Seconds write() waits for room with QUEUE_FULL_BLOCK. None = forever.
+    retryInterval = 5 # Seconds between attempts when the wrapped writer fails.
+    flushSize = 100 # Most write() calls written before the wrapped writer is flushed.
+    flushInterval = 300 # Most seconds between flushes of the wrapped writer.
+
+    def __init__(self, wsApp, writer, full=None, maxSize=None, spillFile=None):
+        """
+        @param writer AS_WS_WRITER - The writer samples are passed on to.
+        @param full string optional - One of QUEUE_FULL_POLICIES (see self.full).
+        @param maxSize int optional - Queue size (see self.maxSize).
+        @param spillFile string optional - Path of the spill file. Defaults to
+            a hidden file in the data folder, named after the wrapped writer.
+        """
+
+        super(AS_WS_WRITER_ASYNC, self).__init__(wsApp)
+
+        self.writer = writer
+
+        if not full is None:
+            self.full = full
+        if not self.full in QUEUE_FULL_POLICIES:
+            raise ValueError('Unknown queue full policy %s' % str(self.full))
+        if not maxSize is None:
+            self.maxSize = maxSize
+
+        self.spillFile = spillFile
+        if self.spillFile is None:
+            self.spillFile = os.path.join(self.app.dataFolder, '.spill_%s.pickle' % type(writer).__name__.lower())
+
+        self.error_logger = mod_ws_log_error.getLogger()
+
+        self.queue = Queue.Queue(self.maxSize)
+        # Guards the spill file and self.spilling
+        self.spillLock = threading.Lock()
+        # While True, write() appends to the spill file rather than the
+        # queue, so spilled samples are written before newer ones.
+        self.spilling = os.path.isfile(self.spillFile) or os.path.isfile(self.spillFile + '.draining')
+
+        self.written = 0 # write() calls passed on to the wrapped writer
+        self.dropped = 0 # write() calls dropped because the queue was full
+        self.spilled = 0 # write() calls appended to the spill file
+        self.errors = 0 # Failed attempts of the wrapped writer
+
+        # Samples written since the wrapped writer was last flushed (only
+        # used by the writer thread), and whether they have to be written
+        # again (after a failure)
+        self.uncommitted = []
+        self.resend = False
+        self.lastFlush = time.time()
+
+        self.closing = False
+        self.thread = threading.Thread(target=self.run, name='AS_WS_WRITER_ASYNC')
+        self.thread.daemon = True
+        self.thread.start()
+
+
+
+    def write(self, samples):
+        """ Queue samples (a list of AS_WS_SAMPLE or an AS_WS_SAMPLE_COLUMNS batch) to be written. Returns at once (see self.full). """
+
+        if self.spilling and self.spill(samples):
+            return
+
+        try:
+            if self.full == QUEUE_FULL_BLOCK:
+                self.queue.put(samples, True, self.blockTimeout)
+            else:
+                self.queue.put_nowait(samples)
+            return
+        except Queue.Full:
+            pass
+
+        if self.full == QUEUE_FULL_SPILL:
+            with self.spillLock:
+                self.spilling = True
+            if self.spill(samples):
+                return
+
+        self.dropped += 1
+
+
+
+    def spill(self, samples):
+        """ Append samples to the spill file. Returns False if the spill has just been drained (so the queue can be used again). """
+
+        with self.spillLock:
+            if not self.spilling:
+                return False
+            try:
+                with open(self.spillFile, 'ab') as f:
+                    cPickle.dump(samples, f, cPickle.HIGHEST_PROTOCOL)
+            except (IOError, OSError) as e:
+                self.error_logger.error('Could not spill samples to %s: %s' % (self.spillFile, e))
+                self.dropped += 1
+                return True
+            self.spilled += 1
+            return True
+
+
+
+    def run(self):
+        """
+        Writer thread: write the spill file and the queue until closed.
+
+        The wrapped writer is only used (and closed) in this thread, so
+        its DB connection never crosses threads.
+        """
+
+        try:
+            while True:
+                if self.spilling and self.queue.empty():
+                    self.drainSpill()
+
+                try:
+                    samples = self.queue.get(True, 1)
+                except Queue.Empty:
+                    # Flush, if one is due
+                    if self.uncommitted and not self.writeSamples(None):
+                        self.saveUncommitted()
+                    if self.closing:
+                        break
+                    continue
+
+                if samples is None:
+                    self.queue.task_done()
+                    break
+
+                if not self.writeSamples(samples):
+                    # Closing while the wrapped writer is failing
+                    self.saveUncommitted()
+                self.queue.task_done()
+        finally:
+            if self.uncommitted and not self.writeSamples(None, True):
+                self.saveUncommitted()
+            if hasattr(self.writer, 'close'):
+                self.writer.close()
+
+
+
+    def writeSamples(self, samples, flush=False):
+        """
+        Write samples with the wrapped writer, and flush it if a flush is
+        due, retrying until that works (or the writer is closed).
+
+        @param samples list - Samples to write, or None to only flush if due.
+        @param flush bool optional - Flush whether or not one is due.
+        @return bool - False if the writer was closed while failing. The
+            samples not flushed yet are then left in self.uncommitted (see
+            saveUncommitted()).
+        """
+
+        if not samples is None:
+            self.uncommitted.append(samples)
+
+        while True:
+            try:
+                if self.resend:
+                    # The failure may have rolled back what wasn't flushed
+                    for s in self.uncommitted:
+                        self.writer.write(s)
+                    self.resend = False
+                elif not samples is None:
+                    self.writer.write(samples)
+
+                now = time.time()
+                if flush or len(self.uncommitted) >= self.flushSize or now - self.lastFlush >= self.flushInterval:
+                    if hasattr(self.writer, 'flush'):
+                        self.writer.flush()
+                    self.uncommitted = []
+                    self.lastFlush = now
+
+                if not samples is None:
+                    self.written += 1
+                return True
+            except Exception as e:
+                self.errors += 1
+                self.resend = True
+                self.error_logger.error('%s: %s' % (type(self.writer).__name__, e))
+                # Drop the wrapped writer's connection, so the next
+                # attempt reconnects (e.g., after the DB server went away)
+                if hasattr(self.writer, 'close'):
+                    try:
+                        self.writer.close()
+                    except Exception:
+                        pass
+                if self.closing:
+                    return False
+                time.sleep(self.retryInterval)
+
+
+
+    def takeUncommitted(self):
+        """ Return (and forget) the samples that were not flushed, when closing while the wrapped writer is failing """
+
+        samples = self.uncommitted
+        self.uncommitted = []
+        self.resend = False
+        return samples
+
+
+
+    def saveUncommitted(self):
+        """ Spill (or drop) the samples that were not flushed """
+
+        for samples in self.takeUncommitted():
+            if self.full == QUEUE_FULL_SPILL:
+                with self.spillLock:
+                    self.spilling = True
+                self.spill(samples)
+            else:
+                self.dropped += 1
+
+
+
+    def drainSpill(self):
+        """
+        Write the spilled samples, oldest first.
+
+        The spill file is renamed before it is read, so write() can keep
+        spilling to a new one in the meantime. The queue is only used
+        again once no spill file is left.
+        """
+
+        draining = self.spillFile + '.draining'
+
+        while True:
+            with self.spillLock:
+                if not os.path.isfile(draining):
+                    if not os.path.isfile(self.spillFile):
+                        self.spilling = False
+                        return
+                    os.rename(self.spillFile, draining)
+
+            # Whatever is left of the file if a write fails while closing
+            # is kept, to be written by the next run.
+            left = []
+            with open(draining, 'rb') as f:
+                while True:
+                    try:
+                        samples = cPickle.load(f)
+                    except EOFError:
+                        break
+                    except (cPickle.UnpicklingError, ValueError, TypeError, AttributeError, IndexError) as e:
+                        # e.g., the end of a spill cut short by a crash
+                        self.error_logger.error('Could not read spilled samples from %s: %s' % (draining, e))
+                        break
+                    if left:
+                        left.append(samples)
+                    elif not self.writeSamples(samples):
+                        left.extend(self.takeUncommitted())
+
+            # The file is only removed once its samples have been flushed
+            if not left and not self.writeSamples(None, True):
+                left.extend(self.takeUncommitted())
+
+            if left:
+                with self.spillLock:
+                    with open(draining, 'wb') as f:
+                        for samples in left:
+                            cPickle.dump(samples, f, cPickle.HIGHEST_PROTOCOL)
+                return
+
+            os.remove(draining)
+
+
+
+    def flush(self):
+        """ Wait until everything queued so far has been written """
+
+        self.queue.join()
+
+
+
+    def close(self, timeout=None):
+        """
+        Write what is queued, then stop the writer thread (which closes the wrapped writer).
+
+        @param timeout float optional - Seconds to wait for the queue to
+            drain. What is left after that is spilled to disk (with
+            QUEUE_FULL_SPILL) or dropped.
+        """
+
+        try:
+            self.queue.put(None, True, timeout)
+        except Queue.Full:
+            pass
+        self.thread.join(timeout)
+        self.closing = True
+
+        if self.thread.is_alive():
+            # Save what the thread didn't get to
+            while True:
+                try:
+                    samples = self.queue.get_nowait()
+                except Queue.Empty:
+                    break
+                if samples is None:
+                    continue
+                if self.full == QUEUE_FULL_SPILL:
+                    with self.spillLock:
+                        self.spilling = True
+                    self.spill(samples)
+                else:
+                    self.dropped += 1
+            self.thread.join(self.retryInterval)
@@ -5,9 +5,15 @@ from as_weatherstation.log import dbhandler as mod_ws_log_dbhandler
 import as_weatherstation.write.abstract as mod_ws_write_abstract
 
 class AS_WS_WRITER_DB(mod_ws_write_abstract.AS_WS_WRITER):
-    """ Write samples to a text log """
+    """ Write samples to the DB through the logging framework (see log/dbhandler.py) """
 
-    def __init__(self, wsApp, slabel):
+    def __init__(self, wsApp, slabel, logger=None):
+        """
+        @param logger logging.Logger optional - Logger (with a DBHandler) to
+            write through. Defaults to the one configured in
+            as_weatherstation/config/log.py. Pass a different one to write
+            over a separate DB connection (e.g., one per thread).
+        """
 
         super(AS_WS_WRITER_DB, self).__init__(wsApp)
 
@@ -16,7 +22,9 @@ class AS_WS_WRITER_DB(mod_ws_write_abstract.AS_WS_WRITER):
         #self.dbhandler = mod_ws_log_dbhandler.DBHandler(self.app)
 
         # Configured in as_weatherstation/config/log.py
-        self.db_logger = logging.getLogger(__name__)
+        self.db_logger = logger
+        if self.db_logger is None:
+            self.db_logger = logging.getLogger(__name__)
         #elf.db_logger.setLevel(logging.INFO)
         #elf.db_logger.addHandler(self.dbhandler)
 
@@ -24,7 +32,273 @@ class AS_WS_WRITER_DB(mod_ws_write_abstract.AS_WS_WRITER):
 
     def write(self, samples):
 
+        # Columnar batches go to the DB handler as a single record
+        if isinstance(samples, mod_ws_app.AS_WS_SAMPLE_COLUMNS):
+            return self.writeColumns(samples)
+
         # Loop through the samples list and log the measurements
         for s in samples:
             # Write measurements via logger
             self.db_logger.info('', extra={'stationID': self.app.stations[self.slabel].id, 'sample': s})
+
+
+
+    def writeColumns(self, columns):
+        """ Write a AS_WS_SAMPLE_COLUMNS batch with one log record for the whole batch """
+
+        if not len(columns):
+            return
+
+        self.db_logger.info('', extra={'stationID': self.app.stations[self.slabel].id, 'columns': columns})
+
+
+
+    def getDBHandlers(self):
+        """ Get the DB handlers of our logger """
+
+        return [h for h in self.db_logger.handlers if isinstance(h, mod_ws_log_dbhandler.DBHandler)]
+
+
+
+    def setBufferSize(self, bufferSize):
+        """ Set the number of rows the DB handlers buffer before each batch INSERT and commit (zero = none) """
+
+        for h in self.getDBHandlers():
+            h.setBufferSize(bufferSize)
+
+
+
+    def flush(self):
+        """ Write (and commit) any rows buffered by the DB handlers """
+
+        for h in self.getDBHandlers():
+            h.flush()
+
+
+
+    def rowsPerSecond(self):
+        """ DB write throughput of the DB handlers, in rows per second """
+
+        rate = 0.0
+        for h in self.getDBHandlers():
+            rate += h.rowsPerSecond()
+        return rate
+
+
+
+class AS_WS_WRITER_DB_BULK(mod_ws_write_abstract.AS_WS_WRITER):
+    """
+    Write samples straight to the DB.
+
+    Unlike AS_WS_WRITER_DB, nothing goes through logging: rows are
+    inserted over a DB-API connection owned by the writer, with one
+    executemany() and one commit per batch. Every write() is committed
+    before it returns. DB errors are raised to the caller.
+    """
+
+    batchSize = 500 # Rows per INSERT batch and transaction.
+
+    def __init__(self, wsApp, slabel, batchSize=None):
+
+        super(AS_WS_WRITER_DB_BULK, self).__init__(wsApp)
+
+        self.slabel = slabel
+
+        if not batchSize is None:
+            self.batchSize = batchSize
+
+        self.conn = None
+        self.cursor = None
+
+        self.fields, self.sql = mod_ws_log_dbhandler.getInsertSQL(self.app)
+
+        # Throughput counters, see rowsPerSecond()
+        self.rowCount = 0
+        self.writeTime = 0.0
+
+
+
+    def connect(self):
+
+        self.conn = self.app.db[mod_ws_app.DB_MAIN].connect()
+        self.cursor = self.conn.cursor()
+
+
+
+    def write(self, samples):
+        """ Write a list of AS_WS_SAMPLE or an AS_WS_SAMPLE_COLUMNS batch """
+
+        stationID = self.app.stations[self.slabel].id
+
+        if isinstance(samples, mod_ws_app.AS_WS_SAMPLE_COLUMNS):
+            rows = mod_ws_log_dbhandler.formatColumnRows(stationID, samples, self.fields)
+        else:
+            rows = [mod_ws_log_dbhandler.formatSampleRow(stationID, s, self.fields) for s in samples]
+
+        self.writeRows(rows)
+
+
+
+    def writeRows(self, rows):
+        """ Insert rows of getInsertSQL() parameters, committing every self.batchSize rows """
+
+        import time
+
+        if self.cursor is None:
+            self.connect()
+
+        size = self.batchSize or len(rows)
+        for i in xrange(0, len(rows), size):
+            batch = rows[i:i+size]
+            start = time.time()
+            try:
+                self.cursor.executemany(self.sql, batch)
+                self.conn.commit()
+            except:
+                self.conn.rollback()
+                raise
+            self.rowCount += len(batch)
+            self.writeTime += time.time() - start
+
+
+
+    def flush(self):
+        """ Nothing is buffered (every write() is committed). Here for compatibility with AS_WS_WRITER_DB. """
+        pass
+
+
+
+    def rowsPerSecond(self):
+        """ Rows written per second spent writing (executing and committing) them """
+
+        if self.writeTime <= 0:
+            return 0.0
+        return self.rowCount / self.writeTime
+
+
+
+    def close(self):
+
+        if not self.cursor is None:
+            self.cursor.close()
+            self.conn.close()
+            self.cursor = None
+            self.conn = None
+
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+
+class AS_WS_WRITER_DB_INFILE(AS_WS_WRITER_DB_BULK):
+    """
+    Write samples to the DB with MySQL's bulk loader.
+
+    Rows are written to a staging TSV file, which flush() loads with
+    LOAD DATA LOCAL INFILE ... IGNORE (one statement and one commit for
+    everything written since the last flush). Rows are not in the DB
+    until flush() is called.
+
+    If the server (or client library) does not allow LOCAL INFILE, the
+    staged rows are inserted with executemany() instead, and so is
+    everything written after that (see AS_WS_WRITER_DB_BULK).
+    """
+
+    # MySQL errors meaning LOAD DATA LOCAL INFILE is disabled:
+    # ER_NOT_ALLOWED_COMMAND, ER_CLIENT_LOCAL_FILES_DISABLED, CR_LOAD_DATA_LOCAL_INFILE_REJECTED
+    infileErrors = (1148, 3948, 2068)
+
+    stagingFolder = None # Where staging files are created. None = the system temp folder.
+
+    def __init__(self, wsApp, slabel, batchSize=None):
+
+        super(AS_WS_WRITER_DB_INFILE, self).__init__(wsApp, slabel, batchSize)
+
+        self.infile = True # False once we have fallen back to executemany()
+        self.stagingFile = None
+        self.staging = None
+        self.stagedRows = 0
+
+        cols = ['fStationID', 'fSampleDateTime'] + [self.app.fieldMap['db'][field] for field in self.fields]
+        self.loadSQL = """LOAD DATA LOCAL INFILE %%s
+            IGNORE INTO TABLE as_pws_data_log
+            FIELDS TERMINATED BY '\\t'
+            LINES TERMINATED BY '\\n'
+            (%s)""" % ", ".join(cols)
+
+
+
+    def connect(self):
+
+        self.conn = self.app.db[mod_ws_app.DB_MAIN].connect(local_infile=1)
+        self.cursor = self.conn.cursor()
+
+
+
+    def writeRows(self, rows):
+        """ Append rows of getInsertSQL() parameters to the staging file """
+
+        if not self.infile:
+            return super(AS_WS_WRITER_DB_INFILE, self).writeRows(rows)
+
+        if self.staging is None:
+            import os
+            import tempfile
+            fd, self.stagingFile = tempfile.mkstemp(prefix='.as_pws_data_log_', suffix='.tsv', dir=self.stagingFolder)
+            self.staging = os.fdopen(fd, 'wb')
+            self.stagedRows = 0
+
+        for row in rows:
+            # \N is NULL to LOAD DATA
+            self.staging.write('\t'.join(['\\N' if v is None else str(v) for v in row]) + '\n')
+        self.stagedRows += len(rows)
+
+
+
+    def flush(self):
+        """ Load (and commit) the staged rows """
+
+        import os
+        import time
+        import MySQLdb
+
+        if self.staging is None:
+            return
+
+        self.staging.close()
+        self.staging = None
+
+        try:
+            if self.cursor is None:
+                self.connect()
+
+            start = time.time()
+            try:
+                self.cursor.execute(self.loadSQL, (self.stagingFile,))
+                self.conn.commit()
+                self.rowCount += self.stagedRows
+                self.writeTime += time.time() - start
+            except MySQLdb.OperationalError as e:
+                self.conn.rollback()
+                if not e.args or not e.args[0] in self.infileErrors:
+                    raise
+                # LOCAL INFILE is disabled. Insert the staged rows instead.
+                self.infile = False
+                with open(self.stagingFile, 'rb') as f:
+                    super(AS_WS_WRITER_DB_INFILE, self).writeRows([tuple([None if v == '\\N' else v for v in line.rstrip('\n').split('\t')]) for line in f])
+        finally:
+            os.remove(self.stagingFile)
+            self.stagingFile = None
+            self.stagedRows = 0
+
+
+
+    def close(self):
+
+        self.flush()
+        super(AS_WS_WRITER_DB_INFILE, self).close()
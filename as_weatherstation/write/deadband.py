@@ -0,0 +1,134 @@
+import as_weatherstation.app as mod_ws_app
+import as_weatherstation.read.abstract as mod_ws_read_abstract
+import as_weatherstation.write.abstract as mod_ws_write_abstract
+
+
+
+class AS_WS_WRITER_DEADBAND(mod_ws_write_abstract.AS_WS_WRITER):
+    """
+    Adaptive logging: write samples through the log writer, holding back
+    those that haven't moved.
+
+    Each sample (one per log interval) is compared with the last sample
+    written. While every measurement stays within its deadband (see
+    DEADBAND_DEFAULTS and [deadband] in app-explain.cfg) and no input
+    event (e.g., a rain gauge tip) arrives, samples are held back, so the
+    log interval stretches. The held samples are written as a single held
+    row, their aggregate marked with how many rows it stands for (see
+    as_weatherstation/log/weather.py), so readers can expand it back to
+    one row per log interval. A held row is written:
+        - when a sample moves out of its deadband, or an event arrives
+          (the sample is written as usual after it, and becomes the one
+          the next samples are compared with)
+        - when maxInterval seconds of samples have been held
+        - when the writer is flushed or closed
+
+    The wrapped writer has to write held rows (writeHold(), see
+    AS_WS_WRITER_LOG).
+    """
+
+    def __init__(self, wsApp, writer, interval, maxInterval, aggregate=None):
+        """
+        @param writer AS_WS_WRITER_LOG - The writer samples are passed on to.
+        @param interval int - Seconds between samples (the log interval).
+        @param maxInterval int - Most seconds of samples held back (a multiple of interval).
+        @param aggregate function optional - Aggregates an AS_WS_AGGREGATOR
+            of held samples down to a list of one sample, e.g. the reader's
+            aggregateStats(). Defaults to a plain AS_WS_READER's.
+        """
+
+        super(AS_WS_WRITER_DEADBAND, self).__init__(wsApp)
+
+        if maxInterval <= interval or maxInterval % interval:
+            raise ValueError('The longest log interval (%ds) must be a multiple of the log interval (%ds)' % (maxInterval, interval))
+
+        self.writer = writer
+        self.interval = interval
+        self.maxHeld = maxInterval // interval
+
+        if aggregate is None:
+            aggregate = mod_ws_read_abstract.AS_WS_READER(wsApp).aggregateStats
+        self.aggregate = aggregate
+
+        self.deadbands = wsApp.deadbands
+
+        # Events (digital inputs) are sums: any event is a change
+        fm = self.app.fieldMap[mod_ws_app.STYPE_PWS]
+        self.events = frozenset(field for field in fm if fm[field] is not None and fm[field][0] == mod_ws_app.PWS_IO_INPUT)
+
+        self.last = None # The last sample written, which samples are compared with
+        self.held = mod_ws_read_abstract.AS_WS_AGGREGATOR() # Samples held back since then
+
+        self.samples = 0 # Samples passed to write()
+        self.rows = 0 # Rows written (held rows count as one)
+
+
+
+    def write(self, samples):
+        """ Write the samples that moved, and hold back the others """
+
+        for sample in samples:
+            self.samples += 1
+
+            if self.isHeld(sample):
+                self.held.add(sample)
+                if len(self.held) >= self.maxHeld:
+                    self.writeHeld()
+                continue
+
+            self.writeHeld()
+            self.writer.write([sample])
+            self.rows += 1
+            self.last = sample
+
+
+
+    def isHeld(self, sample):
+        """ Is a sample within the deadbands of the last sample written (with no events)? """
+
+        if self.last is None:
+            return False
+
+        for field, value in sample.iterValues():
+            mtype = field[0] if mod_ws_app.isStatField(field) else field
+            if mtype in self.events:
+                if value:
+                    return False
+                continue
+            last = self.last.getValue(field)
+            if last is None or abs(value - last) > self.deadbands.get(mtype, 0):
+                return False
+
+        return True
+
+
+
+    def writeHeld(self):
+        """ Write the samples held back so far as a held row """
+
+        count = len(self.held)
+        if not count:
+            return
+
+        samples = self.aggregate(self.held.swap())
+        if count == 1:
+            self.writer.write(samples)
+        else:
+            self.writer.writeHold(samples[0], count, self.interval)
+        self.rows += 1
+
+
+
+    def flush(self):
+        """ Write the samples held back so far """
+
+        self.writeHeld()
+        if hasattr(self.writer, 'flush'):
+            self.writer.flush()
+
+
+
+    def close(self):
+        self.flush()
+        if hasattr(self.writer, 'close'):
+            self.writer.close()
@@ -20,21 +20,12 @@ class AS_WS_WRITER_LOG(mod_ws_write_abstract.AS_WS_WRITER):
         # Loop through the samples list and log the measurements
         for s in samples:
             sampleTime = s.dateTime
-            row = [sampleTime]
-            for field in self.app.fieldMap['log']: # fm['log'] has to be a list (a dictionary could be in any order)
-                measurement = s.getMeasurement(field)
-                if not measurement is None:
-                    # Even though the DB stores integers for all fields
-                    # we will store higher precision floats in the log
-                    # if given.
-                    row.append(measurement.getString())
-                else :
-                    row.append('0')
+            row = self.getRow(s)
 
             #print row
 
             # Write measurements to log
-            self.log_logger.info(mod_ws_log_weather.getLogString(row))
+            self.log_logger.info(mod_ws_log_weather.getLogString(row, len(self.app.fieldMap['log']) + 1))
 
         # Close the log file so other process can use it
         #self.log_logger.handlers[0].stream.close()
@@ -50,3 +41,36 @@ class AS_WS_WRITER_LOG(mod_ws_write_abstract.AS_WS_WRITER):
             #self.timestamp_logger.handlers[0].stream.close()
             #self.timestamp_logger.handlers[0].stream = None
 
+
+
+    def writeHold(self, sample, count, interval):
+        """
+        Write a held row: sample stands for count rows, interval seconds
+        apart and ending at its time (see as_weatherstation/write/deadband.py).
+        """
+
+        row = self.getRow(sample)
+        row.append(mod_ws_log_weather.getHoldMarker(count, interval))
+        self.log_logger.info(mod_ws_log_weather.getLogString(row, len(self.app.fieldMap['log']) + 2))
+
+        if not self.timestamp_logger is None:
+            self.timestamp_logger.info(mod_ws_log_timestamp.getLogString([sample.dateTime]))
+
+
+
+    def getRow(self, s):
+        """ The log row of a sample: its time, then the strings of its fields """
+
+        row = [s.dateTime]
+        for field in self.app.fieldMap['log']: # fm['log'] has to be a list (a dictionary could be in any order)
+            measurement = s.getMeasurement(field)
+            if not measurement is None:
+                # Even though the DB stores integers for all fields
+                # we will store higher precision floats in the log
+                # if given.
+                row.append(measurement.getString())
+            else :
+                row.append('0')
+
+        return row
+
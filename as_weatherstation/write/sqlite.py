@@ -0,0 +1,89 @@
+import time
+
+import as_weatherstation.app as mod_ws_app
+import as_weatherstation.sqlitedb as mod_ws_sqlitedb
+from as_weatherstation.log import dbhandler as mod_ws_log_dbhandler
+import as_weatherstation.write.db as mod_ws_write_db
+
+class AS_WS_WRITER_SQLITE(mod_ws_write_db.AS_WS_WRITER_DB_BULK):
+    """
+    Write samples to the SQLite database (see as_weatherstation/sqlitedb.py).
+
+    Transactions are batched. Rows are inserted as they are written, but
+    only committed once batchSize rows are pending or commitInterval
+    seconds have passed since the last commit, and on flush() and
+    close(). A station writing a sample a minute commits every few
+    minutes rather than every minute. A failed write rolls back the rows
+    that have not been committed yet.
+    """
+
+    batchSize = 500 # Rows per transaction. Zero = commit every write().
+    commitInterval = 300 # Maximum seconds between commits.
+
+    def __init__(self, wsApp, slabel, batchSize=None, path=None):
+        """
+        @param path string optional - Database file. Defaults to the
+            [database_main] path option.
+        """
+
+        super(AS_WS_WRITER_SQLITE, self).__init__(wsApp, slabel, batchSize)
+
+        self.path = path
+        if self.path is None:
+            self.path = self.app.db[mod_ws_app.DB_MAIN].path
+
+        self.fields, self.sql = mod_ws_log_dbhandler.getInsertSQL(self.app, mod_ws_app.DB_BACKEND_SQLITE)
+
+        self.pending = 0 # Rows written but not committed
+        self.lastCommit = time.time()
+
+
+
+    def connect(self):
+
+        self.conn = mod_ws_sqlitedb.connect(self.path, logColumns=self.app.db[mod_ws_app.DB_MAIN].logColumns)
+        self.cursor = self.conn.cursor()
+
+
+
+    def writeRows(self, rows):
+        """ Insert rows of getInsertSQL() parameters, committing when a batch is due """
+
+        if self.cursor is None:
+            self.connect()
+
+        start = time.time()
+        try:
+            self.cursor.executemany(self.sql, rows)
+        except:
+            self.conn.rollback()
+            self.pending = 0
+            raise
+        self.pending += len(rows)
+        self.writeTime += time.time() - start
+
+        if self.pending >= self.batchSize or start - self.lastCommit >= self.commitInterval:
+            self.flush()
+
+
+
+    def flush(self):
+        """ Commit the pending rows """
+
+        if not self.pending:
+            return
+
+        start = time.time()
+        self.conn.commit()
+        self.rowCount += self.pending
+        self.pending = 0
+        self.lastCommit = time.time()
+        self.writeTime += self.lastCommit - start
+
+
+
+    def close(self):
+
+        if not self.conn is None:
+            self.flush()
+        super(AS_WS_WRITER_SQLITE, self).close()
@@ -6,13 +6,11 @@ import time
 import threading, Queue
 #import as_weatherstation.threading as threading
 
-from Phidgets.PhidgetException import PhidgetErrorCodes, PhidgetException
-
-
 import as_weatherstation.app as mod_ws_app
+import as_weatherstation.read.abstract as mod_ws_read_abstract
 import as_weatherstation.write.abstract as mod_ws_write_abstract
 
-import as_weatherstation.phidget.lphidget as mod_lphidget
+import as_weatherstation.phidget as mod_ws_phidget
 
 # Bitwise writer options
 TEXTLCD_OPT_NONE = 0
@@ -66,7 +64,9 @@ class AS_WS_WRITER_TEXTLCD(mod_ws_write_abstract.AS_WS_WRITER):
         if 'remoteHost' in self.station.__dict__:
             args['remoteHost'] = self.station.remoteHost
 
-        self.textLCD = mod_lphidget.PHIDGET_TEXTLCD(**args)
+        # The Phidget library, or a simulated TextLCD
+        self.phidget = mod_ws_phidget.getBackend(self.app)
+        self.textLCD = self.phidget.PHIDGET_TEXTLCD(**args)
 
 
         # http://www.phidgets.com/docs/LCD_Character_Display_Primer
@@ -148,7 +148,7 @@ class AS_WS_WRITER_TEXTLCD(mod_ws_write_abstract.AS_WS_WRITER):
         from as_weatherstation.util import getInterfaces
         
         # Split the latest sample off from the previous ones
-        if len(samples) = 0:
+        if len(samples) == 0:
             return
         elif len(samples) > 1:
             current = samples[-1]
@@ -383,37 +383,23 @@ class AS_WS_WRITER_TEXTLCD(mod_ws_write_abstract.AS_WS_WRITER):
 
     
     def aggregateSamples(self, samples):
-        """ Aggregate the values of a sample list """
+        """ Average the values of a sample list (see AS_WS_AGGREGATOR) """
 
-        if not samples:
-            return []
-
-        measurements = {}
+        aggregator = mod_ws_read_abstract.AS_WS_AGGREGATOR()
         for sample in samples:
-            sampleTime = sample.dateTime # keep only the last time (this assumes the samples are in order, which they should be)
-            for mtype in sample.measurements:
-                if not mtype in measurements:
-                    measurements[mtype] = []
-                measurements[mtype].append(sample.measurements[mtype].value)
+            aggregator.add(sample)
 
+        if not len(aggregator):
+            return []
 
-        aSample = mod_ws_app.AS_WS_SAMPLE(sampleTime)
-        for mtype in measurements:
-            value = self.aggregateMeasurements(measurements[mtype])
-            measure = mod_ws_app.AS_WS_SAMPLE.createMeasurement(mtype, value)
-            aSample.setMeasurement(measure)
+        aSample = mod_ws_app.AS_WS_SAMPLE(aggregator.dateTime)
+        for mtype, stats in aggregator.stats.items():
+            aSample.setValue(mtype, stats.get(mod_ws_read_abstract.AGGREGATE_MEAN))
 
         return [aSample]
 
 
 
-    def aggregateMeasurements(self, measurements):
-        """ Calculates the average for a given set of measurements """
-
-        return sum(measurements)/len(measurements)
-
-
-
 """
 ********************************************************************************
 Thread Related Stuff
@@ -1,7 +1,24 @@
 #!/usr/bin/python
 # encoding=utf-8
 
+import argparse
+
 import as_weatherstation.controller.log.dbload as mod_ws_controller_log_dbload
 
+parser = argparse.ArgumentParser(description='Load backup log files into the database.')
+parser.add_argument('--workers', type=int, default=0, metavar='N',
+    help='parse log files in N processes (default: 0, load one file at a time)')
+parser.add_argument('--writers', type=int, default=mod_ws_controller_log_dbload.AS_CONTROLLER_LOG_DBLOAD.writers, metavar='N',
+    help='number of DB connections used with --workers (default: %(default)s)')
+parser.add_argument('--buffer-size', type=int, default=mod_ws_controller_log_dbload.AS_CONTROLLER_LOG_DBLOAD.bufferSize, metavar='N',
+    help='rows per INSERT batch and commit, 0 for one per row (default: %(default)s)')
+parser.add_argument('--writer', choices=mod_ws_controller_log_dbload.DB_WRITERS, default=mod_ws_controller_log_dbload.AS_CONTROLLER_LOG_DBLOAD.dbWriter,
+    help='bulk: batched INSERTs over a direct DB connection; infile: LOAD DATA LOCAL INFILE from a staging file; log: through the logging framework (default: %(default)s)')
+parser.add_argument('--no-rollup', action='store_true',
+    help="don't roll up the new samples into the rollup tiers after loading")
+parser.add_argument('--no-skip', action='store_true',
+    help="send every row, even rows and files already in the database (e.g., to load an older file that was missed)")
+args = parser.parse_args()
+
 controller = mod_ws_controller_log_dbload.AS_CONTROLLER_LOG_DBLOAD()
-controller.main()
+controller.main(args.workers, args.writers, args.buffer_size, args.writer, not args.no_rollup, not args.no_skip)
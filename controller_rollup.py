@@ -0,0 +1,31 @@
+#!/usr/bin/python
+# encoding=utf-8
+
+import argparse
+
+import as_weatherstation.controller.rollup as mod_ws_controller_rollup
+
+parser = argparse.ArgumentParser(description='Roll up logged samples into 5 minute, hourly, daily and monthly samples in the database.')
+parser.add_argument('--start', metavar="'YYYY-MM-DD HH:MM:SS'",
+    help='recompute the periods from start to end (default: only periods with new samples)')
+parser.add_argument('--end', metavar="'YYYY-MM-DD HH:MM:SS'")
+parser.add_argument('--station', action='append', metavar='LABEL',
+    help='station label from app.cfg, may be repeated (default: all stations)')
+parser.add_argument('--backfill', action='store_true',
+    help='roll up all samples from scratch')
+parser.add_argument('--create-tables', action='store_true',
+    help='create the rollup tables, and add missing columns (including the [aggregate] statistics columns of as_pws_data_log), before rolling up')
+parser.add_argument('--schema', action='store_true',
+    help='print the CREATE TABLE statements of the rollup tables (and ALTER TABLE statements of the statistics columns) and exit')
+args = parser.parse_args()
+
+if (args.start is None) != (args.end is None):
+    parser.error('--start and --end must be given together')
+if args.backfill and not args.start is None:
+    parser.error('--backfill cannot be combined with --start and --end')
+
+controller = mod_ws_controller_rollup.AS_CONTROLLER_ROLLUP()
+if args.schema:
+    controller.printSchema()
+else:
+    controller.main(args.start, args.end, args.station, args.backfill, args.create_tables)
@@ -1,7 +1,11 @@
 SET character_set_client = utf8;
 
+DROP TABLE as_pws_rollup_watermark;
 DROP TABLE as_pws_data_log;
+DROP TABLE as_pws_data_5min;
 DROP TABLE as_pws_data_hourly;
+DROP TABLE as_pws_data_daily;
+DROP TABLE as_pws_data_monthly;
 DROP TABLE as_pws_station;
 
 CREATE TABLE `as_pws_station` (
@@ -39,21 +43,155 @@ CREATE TABLE `as_pws_data_log` (
     FOREIGN KEY `fStationID` (`fStationID`) REFERENCES `as_pws_station` (`fID`)
 ) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8;
 
+-- Extra statistics configured in [aggregate] (e.g., fTemperatureMin) are
+-- added to as_pws_data_log by controller_rollup.py --create-tables (their
+-- ALTER TABLE statements are printed by controller_rollup.py --schema).
+
+-- Rollup tiers (as_weatherstation/rollup.py). These are the default tiers and
+-- aggregates, as printed by controller_rollup.py --schema.
+CREATE TABLE `as_pws_data_5min` (
+    `fID` BIGINT UNSIGNED NOT NULL auto_increment,
+    `fStationID` TINYINT UNSIGNED NOT NULL default '0',
+    `fDateTime` DATETIME NOT NULL default '0000-00-00 00:00:00',
+    `fInternalTemperature` DECIMAL(8,2) NOT NULL default '0',
+    `fInternalTemperatureMin` DECIMAL(8,2) NOT NULL default '0',
+    `fInternalTemperatureMax` DECIMAL(8,2) NOT NULL default '0',
+    `fTemperature` DECIMAL(8,2) NOT NULL default '0',
+    `fTemperatureMin` DECIMAL(8,2) NOT NULL default '0',
+    `fTemperatureMax` DECIMAL(8,2) NOT NULL default '0',
+    `fRelativeHumidity` DECIMAL(8,2) NOT NULL default '0',
+    `fRelativeHumidityMin` DECIMAL(8,2) NOT NULL default '0',
+    `fRelativeHumidityMax` DECIMAL(8,2) NOT NULL default '0',
+    `fStationBarometricPressure` INT NOT NULL default '0',
+    `fStationBarometricPressureMin` INT NOT NULL default '0',
+    `fStationBarometricPressureMax` INT NOT NULL default '0',
+    `fCO2` INT NOT NULL default '0',
+    `fCO2Min` INT NOT NULL default '0',
+    `fCO2Max` INT NOT NULL default '0',
+    `fPrecipitationWeight` INT NOT NULL default '0',
+    `fPrecipitationWeightMin` INT NOT NULL default '0',
+    `fPrecipitationWeightMax` INT NOT NULL default '0',
+    `fNoise` INT NOT NULL default '0',
+    `fNoiseMin` INT NOT NULL default '0',
+    `fNoiseMax` INT NOT NULL default '0',
+    `fSeaLevelBarometricPressure` INT NOT NULL default '0',
+    `fSeaLevelBarometricPressureMin` INT NOT NULL default '0',
+    `fSeaLevelBarometricPressureMax` INT NOT NULL default '0',
+    `fPrecipitation` DECIMAL(8,2) NOT NULL default '0',
+    `fSampleCount` INT UNSIGNED NOT NULL default '0',
+    PRIMARY KEY (`fID`),
+    UNIQUE KEY `StationAndTime` (`fStationID`, `fDateTime`),
+    FOREIGN KEY `fStationID` (`fStationID`) REFERENCES `as_pws_station` (`fID`)
+) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8;
+
 CREATE TABLE `as_pws_data_hourly` (
     `fID` BIGINT UNSIGNED NOT NULL auto_increment,
     `fStationID` TINYINT UNSIGNED NOT NULL default '0',
     `fDateTime` DATETIME NOT NULL default '0000-00-00 00:00:00',
-    `fTemperature` DECIMAL(4,2) NOT NULL default '0',
-    `fRelativeHumidity` DECIMAL(5,2) UNSIGNED NOT NULL default '0',
-    `fStationBarometricPressure` SMALLINT UNSIGNED NOT NULL default '0',
-    `fPrecipitationWeight` SMALLINT UNSIGNED NOT NULL default '0',
-    `fInternalTemperature` DECIMAL(4,2) NOT NULL default '0',
-    `fCO2` SMALLINT UNSIGNED NOT NULL default '0',
-    `fNoise` TINYINT UNSIGNED NOT NULL default '0',
-    `fSeaLevelBarometricPressure` SMALLINT UNSIGNED NOT NULL default '0',
-    `fPrecipitation` DECIMAL(6,2) unsigned NOT NULL DEFAULT '0.0',
-    `fSampleCount` SMALLINT UNSIGNED NOT NULL default '0',
+    `fInternalTemperature` DECIMAL(8,2) NOT NULL default '0',
+    `fInternalTemperatureMin` DECIMAL(8,2) NOT NULL default '0',
+    `fInternalTemperatureMax` DECIMAL(8,2) NOT NULL default '0',
+    `fTemperature` DECIMAL(8,2) NOT NULL default '0',
+    `fTemperatureMin` DECIMAL(8,2) NOT NULL default '0',
+    `fTemperatureMax` DECIMAL(8,2) NOT NULL default '0',
+    `fRelativeHumidity` DECIMAL(8,2) NOT NULL default '0',
+    `fRelativeHumidityMin` DECIMAL(8,2) NOT NULL default '0',
+    `fRelativeHumidityMax` DECIMAL(8,2) NOT NULL default '0',
+    `fStationBarometricPressure` INT NOT NULL default '0',
+    `fStationBarometricPressureMin` INT NOT NULL default '0',
+    `fStationBarometricPressureMax` INT NOT NULL default '0',
+    `fCO2` INT NOT NULL default '0',
+    `fCO2Min` INT NOT NULL default '0',
+    `fCO2Max` INT NOT NULL default '0',
+    `fPrecipitationWeight` INT NOT NULL default '0',
+    `fPrecipitationWeightMin` INT NOT NULL default '0',
+    `fPrecipitationWeightMax` INT NOT NULL default '0',
+    `fNoise` INT NOT NULL default '0',
+    `fNoiseMin` INT NOT NULL default '0',
+    `fNoiseMax` INT NOT NULL default '0',
+    `fSeaLevelBarometricPressure` INT NOT NULL default '0',
+    `fSeaLevelBarometricPressureMin` INT NOT NULL default '0',
+    `fSeaLevelBarometricPressureMax` INT NOT NULL default '0',
+    `fPrecipitation` DECIMAL(8,2) NOT NULL default '0',
+    `fSampleCount` INT UNSIGNED NOT NULL default '0',
     PRIMARY KEY (`fID`),
     UNIQUE KEY `StationAndTime` (`fStationID`, `fDateTime`),
     FOREIGN KEY `fStationID` (`fStationID`) REFERENCES `as_pws_station` (`fID`)
 ) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8;
+
+CREATE TABLE `as_pws_data_daily` (
+    `fID` BIGINT UNSIGNED NOT NULL auto_increment,
+    `fStationID` TINYINT UNSIGNED NOT NULL default '0',
+    `fDateTime` DATETIME NOT NULL default '0000-00-00 00:00:00',
+    `fInternalTemperature` DECIMAL(8,2) NOT NULL default '0',
+    `fInternalTemperatureMin` DECIMAL(8,2) NOT NULL default '0',
+    `fInternalTemperatureMax` DECIMAL(8,2) NOT NULL default '0',
+    `fTemperature` DECIMAL(8,2) NOT NULL default '0',
+    `fTemperatureMin` DECIMAL(8,2) NOT NULL default '0',
+    `fTemperatureMax` DECIMAL(8,2) NOT NULL default '0',
+    `fRelativeHumidity` DECIMAL(8,2) NOT NULL default '0',
+    `fRelativeHumidityMin` DECIMAL(8,2) NOT NULL default '0',
+    `fRelativeHumidityMax` DECIMAL(8,2) NOT NULL default '0',
+    `fStationBarometricPressure` INT NOT NULL default '0',
+    `fStationBarometricPressureMin` INT NOT NULL default '0',
+    `fStationBarometricPressureMax` INT NOT NULL default '0',
+    `fCO2` INT NOT NULL default '0',
+    `fCO2Min` INT NOT NULL default '0',
+    `fCO2Max` INT NOT NULL default '0',
+    `fPrecipitationWeight` INT NOT NULL default '0',
+    `fPrecipitationWeightMin` INT NOT NULL default '0',
+    `fPrecipitationWeightMax` INT NOT NULL default '0',
+    `fNoise` INT NOT NULL default '0',
+    `fNoiseMin` INT NOT NULL default '0',
+    `fNoiseMax` INT NOT NULL default '0',
+    `fSeaLevelBarometricPressure` INT NOT NULL default '0',
+    `fSeaLevelBarometricPressureMin` INT NOT NULL default '0',
+    `fSeaLevelBarometricPressureMax` INT NOT NULL default '0',
+    `fPrecipitation` DECIMAL(8,2) NOT NULL default '0',
+    `fSampleCount` INT UNSIGNED NOT NULL default '0',
+    PRIMARY KEY (`fID`),
+    UNIQUE KEY `StationAndTime` (`fStationID`, `fDateTime`),
+    FOREIGN KEY `fStationID` (`fStationID`) REFERENCES `as_pws_station` (`fID`)
+) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8;
+
+CREATE TABLE `as_pws_data_monthly` (
+    `fID` BIGINT UNSIGNED NOT NULL auto_increment,
+    `fStationID` TINYINT UNSIGNED NOT NULL default '0',
+    `fDateTime` DATETIME NOT NULL default '0000-00-00 00:00:00',
+    `fInternalTemperature` DECIMAL(8,2) NOT NULL default '0',
+    `fInternalTemperatureMin` DECIMAL(8,2) NOT NULL default '0',
+    `fInternalTemperatureMax` DECIMAL(8,2) NOT NULL default '0',
+    `fTemperature` DECIMAL(8,2) NOT NULL default '0',
+    `fTemperatureMin` DECIMAL(8,2) NOT NULL default '0',
+    `fTemperatureMax` DECIMAL(8,2) NOT NULL default '0',
+    `fRelativeHumidity` DECIMAL(8,2) NOT NULL default '0',
+    `fRelativeHumidityMin` DECIMAL(8,2) NOT NULL default '0',
+    `fRelativeHumidityMax` DECIMAL(8,2) NOT NULL default '0',
+    `fStationBarometricPressure` INT NOT NULL default '0',
+    `fStationBarometricPressureMin` INT NOT NULL default '0',
+    `fStationBarometricPressureMax` INT NOT NULL default '0',
+    `fCO2` INT NOT NULL default '0',
+    `fCO2Min` INT NOT NULL default '0',
+    `fCO2Max` INT NOT NULL default '0',
+    `fPrecipitationWeight` INT NOT NULL default '0',
+    `fPrecipitationWeightMin` INT NOT NULL default '0',
+    `fPrecipitationWeightMax` INT NOT NULL default '0',
+    `fNoise` INT NOT NULL default '0',
+    `fNoiseMin` INT NOT NULL default '0',
+    `fNoiseMax` INT NOT NULL default '0',
+    `fSeaLevelBarometricPressure` INT NOT NULL default '0',
+    `fSeaLevelBarometricPressureMin` INT NOT NULL default '0',
+    `fSeaLevelBarometricPressureMax` INT NOT NULL default '0',
+    `fPrecipitation` DECIMAL(8,2) NOT NULL default '0',
+    `fSampleCount` INT UNSIGNED NOT NULL default '0',
+    PRIMARY KEY (`fID`),
+    UNIQUE KEY `StationAndTime` (`fStationID`, `fDateTime`),
+    FOREIGN KEY `fStationID` (`fStationID`) REFERENCES `as_pws_station` (`fID`)
+) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8;
+
+CREATE TABLE `as_pws_rollup_watermark` (
+    `fStationID` TINYINT UNSIGNED NOT NULL default '0',
+    `fLastID` BIGINT UNSIGNED NOT NULL default '0',
+    PRIMARY KEY (`fStationID`),
+    FOREIGN KEY `fStationID` (`fStationID`) REFERENCES `as_pws_station` (`fID`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;